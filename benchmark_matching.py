@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+
+from organize_playlist import (CANDIDATE_TOP_K, PlaylistIndex, get_valid_songs, read_playlist_tracks,
+                               score_songs)
+
+# 安全设置标准输出编码为UTF-8
+try:
+    if sys.stdout:
+        sys.stdout.reconfigure(encoding='utf-8')
+except:
+    pass
+
+# 测试歌单的歌曲数和本地文件数
+PLAYLIST_SIZE = 2000
+FILE_COUNT = 300
+# 比较的候选数（统计召回率时每个值都要另外全量扫描一次）
+TOP_K_VALUES = (10, 25, CANDIDATE_TOP_K, 100)
+# 与 organize_directory 相同的匹配阈值
+THRESHOLD = 0.68
+# 生成标题用的词
+WORDS = ["晴天", "夜曲", "稻香", "江南", "Love", "Night", "Dream", "海", "风", "星空", "Remix", "Live",
+         "夏天", "告白", "雨", "Story", "Blue", "花", "光", "Memory"]
+
+
+def synthetic_title(rng, i):
+    return f"Artist {i % 200} - {' '.join(rng.sample(WORDS, 3))} {i}"
+
+
+def noisy_filename(rng, title):
+    """模拟本地文件名与歌单标题的常见差异：缺少艺术家、多出版本标记、错字和多余空格"""
+    artist, name = title.split(" - ", 1)
+    variant = rng.randrange(4)
+    if variant == 0:
+        text = name
+    elif variant == 1:
+        text = f"{artist} - {name} (Live)"
+    elif variant == 2:
+        chars = list(name)
+        k = rng.randrange(len(chars) - 1)
+        chars[k], chars[k + 1] = chars[k + 1], chars[k]
+        text = f"{artist} - {''.join(chars)}"
+    else:
+        text = f"{artist}  -  {name.replace(' ', '  ')} 伴奏"
+    return text.replace("/", " ")
+
+
+def generate(directory, playlist_size=PLAYLIST_SIZE, file_count=FILE_COUNT):
+    """生成 playlist.txt 和对应的空白音频文件（只用文件名匹配）"""
+    rng = random.Random(20240101)
+    titles = [synthetic_title(rng, i) for i in range(playlist_size)]
+    with open(os.path.join(directory, "playlist.txt"), 'w', encoding='utf-8') as f:
+        f.write("\n".join(titles) + "\n")
+    for i, position in enumerate(rng.sample(range(playlist_size), file_count)):
+        open(os.path.join(directory, f"{noisy_filename(rng, titles[position])}_{i}.mp3"), 'w').close()
+
+
+def benchmark(directory):
+    """按候选数统计模糊匹配的用时和召回率（候选结果达到全量扫描最高分的比例），最后一行为全量扫描的用时"""
+    tracks, _ = read_playlist_tracks(os.path.join(directory, "playlist.txt"))
+    playlist = PlaylistIndex([track['keys']['title'] for track in tracks], tracks=tracks)
+    songs, _ = get_valid_songs(directory)
+    file_infos = list(songs.values())
+
+    output = []
+    output.append(f"歌单 {len(playlist.entries)} 首，本地文件 {len(file_infos)} 个")
+    output.append(f"{'top_k':>6}{'用时(秒)':>10}{'模糊匹配':>10}{'召回':>10}{'召回率':>10}")
+    for top_k in TOP_K_VALUES:
+        start_time = time.perf_counter()
+        results, _ = score_songs(file_infos, playlist, THRESHOLD, top_k)
+        elapsed = time.perf_counter() - start_time
+
+        # 另外执行一次带全量扫描的匹配统计召回（不计入用时）
+        results, _ = score_songs(file_infos, playlist, THRESHOLD, top_k, measure_recall=True)
+        recalls = [result['recall'] for result in results if result['recall'] is not None]
+        rate = f"{sum(recalls) / len(recalls) * 100:.1f}%" if recalls else "-"
+        output.append(f"{top_k:>6}{elapsed:>10.3f}{len(recalls):>10}{sum(recalls):>10}{rate:>10}")
+
+    start_time = time.perf_counter()
+    score_songs(file_infos, playlist, THRESHOLD, 0)
+    output.append(f"{'全部':>6}{time.perf_counter() - start_time:>10.3f}{'-':>10}{'-':>10}{'-':>10}")
+    return "\n".join(output)
+
+
+def main():
+    """用法: python benchmark_matching.py [含 playlist.txt 的音乐目录]，不指定目录时生成测试数据"""
+    if len(sys.argv) > 1:
+        print(benchmark(sys.argv[1]))
+        return
+
+    directory = tempfile.mkdtemp(prefix="match_benchmark_")
+    try:
+        print(f"生成测试数据: 歌单 {PLAYLIST_SIZE} 首，本地文件 {FILE_COUNT} 个")
+        generate(directory)
+        print(benchmark(directory))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
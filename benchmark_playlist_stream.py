@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import tracemalloc
+
+from update_playlist import (STREAM_CHUNK_SIZE, PLAYLIST_STREAM_PATHS, iter_json_values, track_record,
+                             stream_playlist_tracks, format_track)
+
+# 安全设置标准输出编码为UTF-8
+try:
+    if sys.stdout:
+        sys.stdout.reconfigure(encoding='utf-8')
+except:
+    pass
+
+# 测试歌单的歌曲数
+TRACK_COUNT = 50000
+
+
+def synthetic_track(i):
+    """与歌单详情接口结构相近的歌曲对象（包含完整的专辑和艺术家信息）"""
+    artists = [{'id': 1000 + i % 300 + k, 'name': f"Artist {i % 300 + k}", 'picUrl': None, 'alias': [],
+                'albumSize': 0, 'picId': 0, 'img1v1Url': "https://p1.music.126.net/" + "a" * 40 + ".jpg",
+                'img1v1': 0, 'trans': None} for k in range(1 + i % 2)]
+    return {
+        'id': 100000 + i, 'name': f"歌曲 Title {i}", 'position': 0, 'alias': [], 'status': 0, 'fee': 8,
+        'copyrightId': 0, 'disc': "01", 'no': i % 12 + 1, 'artists': artists, 'starred': False,
+        'popularity': 100.0, 'score': 100, 'starredNum': 0, 'duration': 180000 + i % 120000,
+        'playedNum': 0, 'dayPlays': 0, 'hearTime': 0, 'ringtone': "", 'crbt': None, 'audition': None,
+        'copyFrom': "", 'commentThreadId': f"R_SO_4_{100000 + i}", 'rtUrl': None, 'ftype': 0, 'rtUrls': [],
+        'copyright': 1, 'mvid': 0, 'rtype': 0, 'rurl': None, 'mp3Url': None,
+        'album': {'id': 2000 + i // 12, 'name': f"Album {i // 12}", 'type': "专辑", 'size': 12,
+                  'picId': 109951163000000000 + i, 'blurPicUrl': "https://p1.music.126.net/" + "b" * 40 + ".jpg",
+                  'companyId': 0, 'pic': 109951163000000000 + i,
+                  'picUrl': "https://p1.music.126.net/" + "c" * 40 + ".jpg", 'publishTime': 1500000000000,
+                  'description': "", 'tags': "", 'company': "Benchmark Records", 'briefDesc': "",
+                  'artist': artists[0], 'songs': [], 'alias': [], 'status': 0, 'copyrightId': 0,
+                  'commentThreadId': f"R_AL_3_{2000 + i // 12}", 'artists': artists},
+        'hMusic': {'name': None, 'id': 300000 + i, 'size': 9000000, 'extension': "mp3", 'sr': 44100,
+                   'dfsId': 0, 'bitrate': 320000, 'playTime': 180000 + i % 120000, 'volumeDelta': -2.0},
+        'mMusic': {'name': None, 'id': 400000 + i, 'size': 5400000, 'extension': "mp3", 'sr': 44100,
+                   'dfsId': 0, 'bitrate': 192000, 'playTime': 180000 + i % 120000, 'volumeDelta': -2.0},
+        'lMusic': {'name': None, 'id': 500000 + i, 'size': 3600000, 'extension': "mp3", 'sr': 44100,
+                   'dfsId': 0, 'bitrate': 128000, 'playTime': 180000 + i % 120000, 'volumeDelta': -2.0},
+    }
+
+
+def generate(path, track_count=TRACK_COUNT):
+    """逐首写入测试用的歌单详情响应，返回文件大小"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"result": {"id": 1, "name": "benchmark", "trackCount": %d, "trackIds": [' % track_count)
+        f.write(', '.join(json.dumps({'id': 100000 + i, 'v': 1, 'at': 0}) for i in range(track_count)))
+        f.write('], "tracks": [')
+        for i in range(track_count):
+            if i:
+                f.write(', ')
+            f.write(json.dumps(synthetic_track(i), ensure_ascii=False))
+        f.write(']}, "code": 200}')
+    return os.path.getsize(path)
+
+
+def read_chunks(path, chunk_size=STREAM_CHUNK_SIZE):
+    """模拟 response.iter_content：按块读取文件"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def parse_full(path):
+    """原方式：整体读入并 json.loads 后逐首转换为歌曲记录"""
+    with open(path, 'rb') as f:
+        data = json.loads(f.read())
+    records = (track_record(position, track) for position, track in enumerate(data['result']['tracks'], 1))
+    return sum(1 for record in records if format_track(record))
+
+
+def parse_stream(path):
+    """流式方式：与 open_playlist_stream 相同，用 stream_playlist_tracks 边读取边产生歌曲记录
+
+    测试数据中的歌曲全部内联，不需要按 trackIds 补全，因此不会发出网络请求。
+    """
+    events = iter_json_values(read_chunks(path), PLAYLIST_STREAM_PATHS)
+    records = stream_playlist_tracks(None, None, events, None, [])
+    return sum(1 for record in records if format_track(record))
+
+
+def measure(func, path):
+    """返回 (歌曲数, 用时, 内存峰值字节数)"""
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    count = func(path)
+    elapsed = time.perf_counter() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+def benchmark(path):
+    output = []
+    output.append(f"{'方式':<10}{'歌曲数':>8}{'用时(秒)':>10}{'歌曲/秒':>10}{'内存峰值(MB)':>14}")
+    for name, func in (("json.loads", parse_full), ("流式解析", parse_stream)):
+        count, elapsed, peak = measure(func, path)
+        output.append(f"{name:<10}{count:>8}{elapsed:>10.3f}{count / max(elapsed, 1e-9):>10.0f}"
+                      f"{peak / (1024 * 1024):>14.1f}")
+    return "\n".join(output)
+
+
+def main():
+    """用法: python benchmark_playlist_stream.py [歌单详情JSON文件]，不指定文件时生成测试数据"""
+    if len(sys.argv) > 1:
+        print(benchmark(sys.argv[1]))
+        return
+
+    fd, path = tempfile.mkstemp(prefix="playlist_benchmark_", suffix=".json")
+    os.close(fd)
+    try:
+        size = generate(path)
+        print(f"生成测试歌单: {TRACK_COUNT} 首歌曲，响应大小 {size / (1024 * 1024):.1f} MB")
+        print(benchmark(path))
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from organize_playlist import SUPPORTED_FORMATS, read_embedded_tags
+
+# 安全设置标准输出编码为UTF-8
+try:
+    if sys.stdout:
+        sys.stdout.reconfigure(encoding='utf-8')
+except:
+    pass
+
+# 每种格式生成的测试文件数
+FILES_PER_FORMAT = 2000
+# 测试文件的大小（稀疏文件，不实际占用磁盘空间）
+SYNTHETIC_FILE_SIZE = 300 * 1024 * 1024
+# 测试文件中封面图片的大小（读取标签时应当被跳过）
+COVER_SIZE = 512 * 1024
+
+
+def id3_frame(frame_id, text):
+    payload = b'\x03' + text.encode('utf-8')
+    return frame_id + len(payload).to_bytes(4, 'big') + b'\x00\x00' + payload
+
+
+def synchsafe(size):
+    return bytes([(size >> 21) & 0x7f, (size >> 14) & 0x7f, (size >> 7) & 0x7f, size & 0x7f])
+
+
+def vorbis_comment(title, artist):
+    vendor = b'benchmark'
+    comments = [f"TITLE={title}".encode('utf-8'), f"ARTIST={artist}".encode('utf-8')]
+    data = len(vendor).to_bytes(4, 'little') + vendor + len(comments).to_bytes(4, 'little')
+    for comment in comments:
+        data += len(comment).to_bytes(4, 'little') + comment
+    return data
+
+
+def mp4_atom(atom_type, payload):
+    return (8 + len(payload)).to_bytes(4, 'big') + atom_type + payload
+
+
+def ogg_page(packet, sequence):
+    lacing = [255] * (len(packet) // 255) + [len(packet) % 255]
+    return (b'OggS\x00' + (b'\x02' if sequence == 0 else b'\x00') + b'\x00' * 8 + b'\x01\x00\x00\x00'
+            + sequence.to_bytes(4, 'little') + b'\x00' * 4 + bytes([len(lacing)]) + bytes(lacing) + packet)
+
+
+def write_synthetic(path, title, artist):
+    """写入带有标题/艺术家标签、封面和大块音频数据的测试文件"""
+    ext = os.path.splitext(path)[1]
+    cover = b'\x00' * COVER_SIZE
+    with open(path, 'wb') as f:
+        if ext == '.mp3':
+            apic = b'\x00image/jpeg\x00\x03\x00' + cover
+            frames = (id3_frame(b'TIT2', title) + id3_frame(b'TPE1', artist)
+                      + b'APIC' + len(apic).to_bytes(4, 'big') + b'\x00\x00' + apic)
+            f.write(b'ID3\x03\x00\x00' + synchsafe(len(frames)) + frames)
+        elif ext in ('.flac', '.fla'):
+            comment = vorbis_comment(title, artist)
+            # STREAMINFO: 44100Hz、双声道、16 位，约 3 分钟
+            stream_info = (4096).to_bytes(2, 'big') * 2 + b'\x00' * 6
+            stream_info += ((44100 << 44) | (1 << 41) | (15 << 36) | (180 * 44100)).to_bytes(8, 'big') + b'\x00' * 16
+            f.write(b'fLaC' + b'\x00' + len(stream_info).to_bytes(3, 'big') + stream_info)
+            f.write(b'\x06' + len(cover).to_bytes(3, 'big') + cover)
+            f.write(b'\x84' + len(comment).to_bytes(3, 'big') + comment)
+        elif ext == '.ogg':
+            identification = b'\x01vorbis' + b'\x00' * 4 + b'\x02' + (44100).to_bytes(4, 'little') + b'\x00' * 12 + b'\xb8\x01'
+            f.write(ogg_page(identification, 0))
+            f.write(ogg_page(b'\x03vorbis' + vorbis_comment(title, artist) + b'\x01', 1))
+        elif ext == '.m4a':
+            # moov 位于 mdat 之后，读取时需要跳过整个 mdat
+            f.write(mp4_atom(b'ftyp', b'M4A \x00\x00\x00\x00'))
+            f.write((SYNTHETIC_FILE_SIZE).to_bytes(4, 'big') + b'mdat')
+            f.seek(SYNTHETIC_FILE_SIZE - 8, os.SEEK_CUR)
+            items = b''
+            for atom_type, value in ((b'\xa9nam', title), (b'\xa9ART', artist)):
+                data = mp4_atom(b'data', b'\x00\x00\x00\x01\x00\x00\x00\x00' + value.encode('utf-8'))
+                items += mp4_atom(atom_type, data)
+            meta = mp4_atom(b'meta', b'\x00\x00\x00\x00' + mp4_atom(b'ilst', items))
+            f.write(mp4_atom(b'moov', mp4_atom(b'udta', meta)))
+            return
+        elif ext == '.wav':
+            info = b'INFO'
+            for chunk_id, value in ((b'INAM', title), (b'IART', artist)):
+                data = value.encode('utf-8') + b'\x00'
+                if len(data) & 1:
+                    data += b'\x00'
+                info += chunk_id + len(data).to_bytes(4, 'little') + data
+            f.write(b'RIFF' + (0).to_bytes(4, 'little') + b'WAVE')
+            f.write(b'fmt ' + (16).to_bytes(4, 'little') + b'\x00' * 16)
+            f.write(b'data' + (SYNTHETIC_FILE_SIZE).to_bytes(4, 'little'))
+            f.seek(SYNTHETIC_FILE_SIZE, os.SEEK_CUR)
+            f.write(b'LIST' + len(info).to_bytes(4, 'little') + info)
+            riff_size = f.tell() - 8
+            f.seek(4)
+            f.write(riff_size.to_bytes(4, 'little'))
+            return
+        f.truncate(SYNTHETIC_FILE_SIZE)
+
+
+def generate(directory, files_per_format=FILES_PER_FORMAT):
+    """为每种格式生成测试文件"""
+    for ext in dict.fromkeys(SUPPORTED_FORMATS):
+        for i in range(files_per_format):
+            write_synthetic(os.path.join(directory, f"{i:05d}{ext}"), f"歌曲 Title {i}", f"Artist {i % 50}")
+
+
+def benchmark(directory):
+    """按格式统计读取标签的耗时和命中率"""
+    by_format = {}
+    for entry in os.scandir(directory):
+        ext = os.path.splitext(entry.name)[1].lower()
+        if entry.is_file() and ext in SUPPORTED_FORMATS:
+            by_format.setdefault(ext, []).append(entry.path)
+
+    output = []
+    output.append(f"{'格式':<6}{'文件数':>8}{'有标签':>8}{'用时(秒)':>10}{'文件/秒':>10}")
+    total_files = 0
+    total_time = 0.0
+    for ext, paths in sorted(by_format.items()):
+        start_time = time.perf_counter()
+        tagged = sum(1 for path in paths if read_embedded_tags(path).get('title'))
+        elapsed = time.perf_counter() - start_time
+        total_files += len(paths)
+        total_time += elapsed
+        output.append(f"{ext:<6}{len(paths):>8}{tagged:>8}{elapsed:>10.3f}{len(paths) / max(elapsed, 1e-9):>10.0f}")
+    output.append(f"合计: {total_files} 个文件，用时 {total_time:.3f} 秒")
+    return "\n".join(output)
+
+
+def main():
+    """用法: python benchmark_tags.py [音乐目录]，不指定目录时生成测试文件"""
+    if len(sys.argv) > 1:
+        print(benchmark(sys.argv[1]))
+        return
+
+    directory = tempfile.mkdtemp(prefix="tag_benchmark_")
+    try:
+        print(f"生成测试文件: 每种格式 {FILES_PER_FORMAT} 个，单个文件 {SYNTHETIC_FILE_SIZE // (1024 * 1024)} MB（稀疏）")
+        generate(directory)
+        print(benchmark(directory))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
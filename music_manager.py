@@ -1,15 +1,27 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext, simpledialog
+from tkinter import ttk, messagebox, scrolledtext, simpledialog, filedialog
 import sys
 import os
 import threading
 import requests
+from requests.adapters import HTTPAdapter
 import json
+import codecs
 import webbrowser
 import time
 import unicodedata
 import string
+import queue
+import random
 import difflib
+import fnmatch
+import hashlib
+import zlib
+import heapq
+from collections import deque
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import partial
 import re
 from urllib.parse import urlencode
 from io import StringIO
@@ -22,6 +34,20 @@ try:
 except ImportError:
     BROWSER_COOKIE_AVAILABLE = False
 
+# 尝试导入numpy（相似度矩阵批量打分使用），如果不可用则设置标志
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# 目录锁使用的文件锁模块：Windows 为 msvcrt，其他系统为 fcntl
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+    import fcntl
+
 # 安全设置标准输出编码为UTF-8
 try:
     if sys.stdout:
@@ -32,6 +58,175 @@ except:
 # 支持的音频文件扩展名
 SUPPORTED_FORMATS = ('.flac', '.mp3', '.m4a', '.wav', '.ogg', '.fla')
 
+# 网易云音乐 API 地址（测试时可改为本地服务器）
+API_BASE = "https://music.163.com"
+# 分批获取歌曲详情时每批的歌曲数
+TRACK_BATCH_SIZE = 500
+# 同时进行的歌曲详情请求数
+TRACK_FETCH_WORKERS = 4
+# 请求超时（连接, 读取）秒数
+REQUEST_TIMEOUT = (5, 30)
+# 失败请求的最大重试次数
+MAX_RETRIES = 3
+# 重试退避的基础秒数（第 n 次重试等待 基础秒数 * 2^(n-1)，另加随机抖动）
+RETRY_BACKOFF = 0.5
+# 需要重试的 HTTP 状态码
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# 重试前的最长等待秒数（服务器要求的 Retry-After 更长时也只等待这么久）
+RETRY_MAX_DELAY = 10
+# 重试等待期间检查取消的间隔秒数
+RETRY_SLEEP_STEP = 0.1
+# 限速：每秒平均请求数和允许的突发请求数
+REQUESTS_PER_SECOND = 5
+REQUEST_BURST = 5
+# 流式读取歌单响应时每次读取的字节数
+STREAM_CHUNK_SIZE = 64 * 1024
+# 流式解析歌单时需要的字段路径
+PLAYLIST_STREAM_PATHS = {('code',), ('result', 'tracks'), ('result', 'trackIds')}
+# JSON 数字中可能出现的字符（判断缓冲区末尾的数字是否被截断）
+JSON_NUMBER_CHARS = '0123456789+-.eE'
+# 批量同步时同时更新的歌单数
+PLAYLIST_SYNC_WORKERS = 4
+# 获取用户歌单列表时每页的数量
+USER_PLAYLIST_PAGE_SIZE = 1000
+# 歌单文件名
+PLAYLIST_FILENAME = "playlist.txt"
+# 目录名中不允许出现的字符
+INVALID_PATH_CHARS = '<>:"/\\|?*'
+# 从浏览器读取的 Cookie 的缓存文件（位于用户目录，批量同步到不同目录时共用）
+COOKIE_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".music_manager_cookie.json")
+# Cookie 没有过期时间（会话 Cookie）时缓存的秒数
+COOKIE_DEFAULT_TTL = 7 * 24 * 3600
+# 距离过期不足该秒数时视为已过期
+COOKIE_EXPIRY_MARGIN = 60
+# 读取 Cookie 的浏览器（browser_cookie3 中的函数名），并发读取，先得到有效结果者优先
+COOKIE_BROWSERS = ('firefox', 'chrome', 'edge')
+
+# 模拟浏览器的请求头
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Referer': 'https://music.163.com/',
+    'Accept': '*/*',
+    'Accept-Encoding': 'gzip, deflate',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+}
+
+# 模糊匹配时每个文件最多比较的候选条目数（0 表示逐条扫描整个播放列表）
+CANDIDATE_TOP_K = 50
+# 出现在超过该比例条目中的 n-gram 视为停用 gram，不参与候选召回
+STOP_GRAM_RATIO = 0.2
+# 全局分配：启用后每个播放列表位置最多分配一个文件（最大权二分匹配）
+GLOBAL_ASSIGNMENT = True
+# 全局分配时每个文件保留的候选数
+MAX_CHOICES = 5
+# 日志中最多列出的争用位置数
+CONTESTED_REPORT_LIMIT = 20
+# 并行匹配的进程数（0 表示使用全部 CPU 核心，1 表示不使用多进程）
+MATCH_WORKERS = 0
+# 文件数少于该值时直接串行匹配（进程启动开销大于并行收益）
+PARALLEL_MIN_SONGS = 300
+# 候选召回方式：'index' 为 n-gram 倒排索引，'matrix' 为 NumPy 相似度矩阵批量打分
+MATCH_BACKEND = 'index'
+# 相似度矩阵中哈希 n-gram 向量的维度
+MATRIX_DIM = 1024
+# 相似度矩阵每个分块的最大字节数（按行分块，控制内存占用）
+MATRIX_CHUNK_BYTES = 64 * 1024 * 1024
+# 是否使用匹配结果缓存（只重新匹配新增或改动过的文件）
+USE_MATCH_CACHE = True
+# 匹配结果缓存文件名（保存在工作目录下）
+MATCH_CACHE_FILE = ".match_cache.json"
+# 是否使用增量整理（只处理新文件和播放列表中新增的位置）
+INCREMENTAL_ORGANIZE = False
+# 上次整理结果的快照文件名（保存在工作目录下）
+ORGANIZE_STATE_FILE = ".organize_state.json"
+# 整理快照的格式版本（键为 "文件名|大小|修改时间"），其他版本的快照视为不存在
+ORGANIZE_STATE_FORMAT = 2
+# 整理时添加的三位序号前缀（重名时另加的 "N_" 无法与原文件名开头的数字区分，不在此匹配）
+ORGANIZED_PREFIX_PATTERN = re.compile(r'^\d{3}_')
+# 未匹配文件的标记前缀
+UNMATCHED_PREFIXES = ['(未匹配)', '（未匹配）', '[未匹配]', '（未找到）', '(unmatched)']
+# 没有撤销记录时移除前缀所去掉的整理标记：三位序号前缀，或未匹配/未找到标记及重名时紧随其后的 "_N_"
+ORGANIZED_MARK_PATTERN = re.compile(r'^(?:\d{3}_|(?:（未匹配）|（未找到）|\(未找到\))(?:_\d+_)?)')
+# 是否递归扫描子目录（艺术家/专辑目录结构）
+SCAN_RECURSIVE = False
+# 扫描时包含的文件（glob，匹配文件名或相对路径，空列表表示全部）
+SCAN_INCLUDE = []
+# 扫描时排除的文件和目录（glob，匹配名称或相对路径；默认跳过隐藏文件和目录）
+SCAN_EXCLUDE = ['.*']
+# 重命名日志文件名（执行期间保存在工作目录下，中断后用于继续执行）
+RENAME_JOURNAL_FILE = ".rename_journal.json"
+# 撤销记录文件名（当前文件名 -> 整理前的原始文件名，供移除前缀时恢复）
+UNDO_JOURNAL_FILE = ".organize_undo.json"
+# 是否读取文件内嵌的标题/艺术家标签（只读取头部标签块）
+READ_EMBEDDED_TAGS = True
+# 单个标签块最多读取的字节数（超过时跳过该块）
+TAG_READ_LIMIT = 256 * 1024
+# 结构化播放列表文件（playlist.txt 旁的 playlist.json）的格式版本
+PLAYLIST_SIDECAR_VERSION = 1
+# playlist.json 中预计算匹配键的版本（标准化规则变化时递增，旧文件中的键随之重新计算）
+PLAYLIST_KEYS_VERSION = 2
+# 是否用时长过滤和排序候选（播放列表带有时长，即存在 playlist.json 时生效）
+MATCH_BY_DURATION = True
+# 时长容差：文件与播放列表条目的时长最多相差 max(秒数, 条目时长 × 比例)
+DURATION_TOLERANCE_SECONDS = 5
+DURATION_TOLERANCE_RATIO = 0.03
+# 读取时长时在文件头部（Ogg 为尾部）查找帧头/页面的字节数
+DURATION_SCAN_LIMIT = 64 * 1024
+# 是否按艺术家分组匹配：文件的艺术家对应播放列表中的艺术家时先只与该艺术家的条目比较
+ARTIST_BLOCKING = True
+# 艺术家分组内按共享 gram 数召回的候选数（分组内同一艺术家的歌曲标题差异大，只需比较最相近的几首）
+ARTIST_BLOCK_TOP_K = 5
+# 多位艺术家之间的分隔符（/、、、逗号、&、feat./ft./featuring、vs.、× 和前后有空格的 x）
+ARTIST_SEPARATOR_PATTERN = re.compile(
+    r'\s*(?:/|／|、|,|，|;|；|&|＆|×|\s(?:x|with|vs\.?)\s|\(?\b(?:feat|ft)\b\.?|\bfeaturing\b)\s*',
+    re.IGNORECASE)
+
+# 同一阶段两次进度事件之间的最短间隔（秒），阶段的最后一个事件总会发送
+PROGRESS_INTERVAL = 0.1
+# 因任务取消而未执行的重命名对应的错误信息
+RENAME_CANCELLED = "已取消"
+# 改动目录中文件的任务（命名排序、移除前缀）在目录中持有的锁文件
+DIRECTORY_LOCK_FILE = ".music_manager.lock"
+# 运行记录中表示错误、警告或未匹配的标记，只显示问题记录时据此筛选
+LOG_PROBLEM_MARKERS = ('❌', '✗', '⚠', '未匹配', '出错', '失败')
+
+# 读取进度事件队列的间隔（毫秒）
+PROGRESS_POLL_MS = 100
+
+# 进度事件中各阶段的显示名称
+PROGRESS_STAGES = {
+    'scan': "扫描文件",
+    'match': "匹配歌曲",
+    'rename': "重命名文件",
+    'rename_commit': "完成重命名",
+    'playlist': "获取歌单",
+    'sync': "同步歌单",
+}
+
+# 各功能在任务队列中显示的名称，以及是否改动工作目录中的文件
+# （同一目录同时只运行一个改动文件的任务，获取歌单等只读任务可以同时运行）
+JOB_TYPES = {
+    'update_playlist': ("更新歌单", False),
+    'sync_playlists': ("批量同步歌单", False),
+    'organize_playlist': ("命名排序", True),
+    'remove_prefixes_func': ("移除前缀", True),
+}
+
+# 任务状态的显示名称
+JOB_STATES = {'queued': "排队中", 'running': "运行中", 'done': "完成", 'cancelled': "已取消", 'failed': "出错"}
+
+# 任务队列中最多保留的已结束任务数
+JOB_HISTORY_LIMIT = 50
+
+# 运行输出框最多保留的行数（更早的记录只保存在完整日志中）
+LOG_BUFFER_LINES = 5000
+
+# 勾选"保存完整日志"时，运行记录追加写入工作目录下的这个文件
+FULL_LOG_FILE = "music_manager.log"
+
+# 工作进程中的播放列表索引（由进程池 initializer 每个进程只接收一次）
+_worker_playlist = None
+
 def get_resource_path(relative_path):
     """获取资源文件的绝对路径，处理PyInstaller打包后的情况"""
     try:
@@ -43,125 +238,521 @@ def get_resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 # ==================== 更新歌单功能 ====================
-def fetch_playlist_data(playlist_url, cookie=None):
-    """获取歌单数据"""
-    try:
-        # 设置更完整的User-Agent模拟浏览器请求
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Referer': 'https://music.163.com/',
-            'Accept': '*/*',
-            'Accept-Encoding': 'gzip, deflate',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-        }
-
-        # 如果提供了Cookie，则添加到请求头中
-        if cookie:
-            headers['Cookie'] = cookie
-        else:
-            # 默认Cookie参数
-            headers['Cookie'] = 'appver=2.0.2'
-
-        # 从URL中提取歌单ID
-        playlist_id = playlist_url.split('=')[-1]
-
-        # 构造完整的API URL和参数
-        api_url = "https://music.163.com/api/playlist/detail"
-        params = {
-            'id': playlist_id,
-            'n': 100000,
-            's': 8
-        }
+class PlaylistIncomplete(Exception):
+    """按 trackIds 补全歌曲时部分歌曲详情获取失败，异常信息说明缺少的歌曲数"""
+
+class TokenBucket:
+    """令牌桶限速器（线程安全）"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """取得一个令牌，没有可用令牌时等待"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class NetEaseClient:
+    """网易云音乐 API 客户端
+
+    所有请求共用一个带连接池的 requests.Session，设置连接/读取超时，
+    遇到 5xx/429 和连接错误时按指数退避重试（每次最多等待 max_delay 秒），并用令牌桶限制请求速率。
+    cancelled 为返回是否已取消的函数（如 JobProgress.cancelled），取消后在重试等待中立即停止重试。
+    请求数、重试数和延迟统计可通过 stats()/stats_summary() 获取。
+    """
 
-        response = requests.get(api_url, headers=headers, params=params)
+    def __init__(self, base_url=None, timeout=REQUEST_TIMEOUT, max_retries=MAX_RETRIES, backoff=RETRY_BACKOFF,
+                 rate=REQUESTS_PER_SECOND, burst=REQUEST_BURST, pool_size=TRACK_FETCH_WORKERS,
+                 max_delay=RETRY_MAX_DELAY, cancelled=None):
+        self.base_url = base_url or API_BASE
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.cancelled = cancelled
+        self.limiter = TokenBucket(rate, burst) if rate else None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update(DEFAULT_HEADERS)
+
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.retry_count = 0
+        self.error_count = 0
+        self.latencies = []
+
+    def get(self, path, params=None, cookie=None, stream=False):
+        """发送 GET 请求并返回响应；重试用尽或取消后返回最后一次响应或抛出最后一次连接错误
+
+        stream 为 True 时不预先读取响应体（由调用方读取并关闭）。
+        """
+        headers = {'Cookie': cookie or 'appver=2.0.2'}
+        for attempt in range(self.max_retries + 1):
+            if self.limiter:
+                self.limiter.acquire()
+
+            start_time = time.perf_counter()
+            try:
+                response = self.session.get(f"{self.base_url}{path}", params=params, headers=headers,
+                                            timeout=self.timeout, stream=stream)
+                error = None
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                response, error = None, e
+            self._record(time.perf_counter() - start_time, error is not None)
+
+            retryable = error is not None or response.status_code in RETRY_STATUS
+            if not retryable or attempt == self.max_retries:
+                break
+
+            if not self._wait_retry(self._retry_delay(attempt, response)):
+                break
+            with self.lock:
+                self.retry_count += 1
+            if response is not None:
+                response.close()
+
+        if error is not None:
+            raise error
+        return response
+
+    def get_json(self, path, params=None, cookie=None):
+        """发送 GET 请求并解析 JSON，HTTP 错误时抛出 requests.HTTPError"""
+        response = self.get(path, params, cookie)
         response.raise_for_status()
+        return response.json()
+
+    def _retry_delay(self, attempt, response):
+        # 429 响应带有 Retry-After 时按服务器要求等待，但不超过 max_delay
+        if response is not None and response.headers.get('Retry-After', '').isdigit():
+            return min(int(response.headers['Retry-After']), self.max_delay)
+        return min(self.backoff * (2 ** attempt) * (1 + random.random() * 0.1), self.max_delay)
+
+    def _wait_retry(self, delay):
+        """分段等待 delay 秒，期间检查取消；已取消时返回 False"""
+        deadline = time.monotonic() + delay
+        while True:
+            if self.cancelled is not None and self.cancelled():
+                return False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            time.sleep(min(remaining, RETRY_SLEEP_STEP))
+
+    def _record(self, latency, failed):
+        with self.lock:
+            self.request_count += 1
+            self.latencies.append(latency)
+            if failed:
+                self.error_count += 1
+
+    def stats(self):
+        """返回请求统计：请求数、重试数、连接错误数以及延迟（秒）的平均值/最大值"""
+        with self.lock:
+            latencies = list(self.latencies)
+            return {
+                'requests': self.request_count,
+                'retries': self.retry_count,
+                'errors': self.error_count,
+                'latency_avg': sum(latencies) / len(latencies) if latencies else 0.0,
+                'latency_max': max(latencies, default=0.0),
+            }
+
+    def stats_summary(self):
+        stats = self.stats()
+        return (f"网络请求: {stats['requests']} 次，重试 {stats['retries']} 次，连接错误 {stats['errors']} 次，"
+                f"平均延迟 {stats['latency_avg'] * 1000:.0f} ms，最大 {stats['latency_max'] * 1000:.0f} ms")
+
+    def close(self):
+        self.session.close()
+
+def fetch_song_details(client, track_ids, cookie=None, batch_size=TRACK_BATCH_SIZE, workers=TRACK_FETCH_WORKERS):
+    """按 ID 分批获取歌曲详情，返回 (与 track_ids 顺序一致的歌曲列表, 未能获取的歌曲 ID 列表)
+
+    各批次在线程池中并发请求（最多 workers 个），共用 client 的连接池和限速。
+    请求失败的批次中的歌曲和接口没有返回的歌曲都计入未能获取的 ID。
+    """
+    batches = [track_ids[i:i + batch_size] for i in range(0, len(track_ids), batch_size)]
 
-        # 解析JSON数据
-        data = response.json()
+    def fetch_batch(batch):
+        try:
+            return client.get_json("/api/song/detail/", {'ids': json.dumps(batch)}, cookie).get('songs') or []
+        except (requests.exceptions.RequestException, ValueError):
+            return []
 
-        # 检查返回码
-        if data.get('code') != 200:
-            return None, response.status_code
+    songs_by_id = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for songs in pool.map(fetch_batch, batches):
+            for song in songs:
+                songs_by_id[song.get('id')] = song
 
-        return data, response.status_code
-    except requests.exceptions.RequestException as e:
-        return None, getattr(e.response, 'status_code', None) if hasattr(e, 'response') else None
-    except json.JSONDecodeError as e:
-        return None, None
+    songs = [songs_by_id[track_id] for track_id in track_ids if track_id in songs_by_id]
+    failed = [track_id for track_id in track_ids if track_id not in songs_by_id]
+    return songs, failed
 
-def parse_playlist_tracks(data):
-    """解析歌单中的歌曲信息"""
-    if not data or 'result' not in data or 'tracks' not in data['result']:
-        return []
+def iter_json_values(chunks, targets):
+    """增量解析 JSON 文本块，逐个产生 targets 中路径上的值 (路径, 值)
+
+    路径为键的元组，如 ('result', 'tracks')；目标值为数组时逐个产生其中的元素。
+    只沿目标路径进入对象，其他值整体跳过，因此内存占用只与单个元素的大小有关。
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    prefixes = {target[:i] for target in targets for i in range(1, len(target))}
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        # 至少把未解析部分的长度翻倍，使反复重试的大值的总解析量保持线性
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        buf = buf[pos:]
+        pos = 0
+        wanted = max(len(buf) * 2, 1)
+        parts = [buf]
+        size = len(buf)
+        while size < wanted:
+            try:
+                part = text_decoder.decode(next(chunks))
+            except StopIteration:
+                part = text_decoder.decode(b'', final=True)
+                eof = True
+            parts.append(part)
+            size += len(part)
+            if eof:
+                break
+        buf = ''.join(parts)
+        return True
+
+    def peek():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if not fill():
+                raise ValueError("JSON 数据意外结束")
+
+    def expect(chars):
+        nonlocal pos
+        char = peek()
+        if char not in chars:
+            raise ValueError(f"JSON 格式错误: 位置 {pos} 处为 {char!r}")
+        pos += 1
+        return char
+
+    def decode_value():
+        nonlocal pos
+        peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                # 数字后面只剩数字字符（如 "1.5e" 中的 "e"、"0." 中的 "."）或到达缓冲区末尾时
+                # 可能被截断，读入更多数据后重新解析
+                truncated = not isinstance(value, (str, list, dict)) and not buf[end:].lstrip(JSON_NUMBER_CHARS)
+                if not truncated or not fill():
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if not fill():
+                    raise
+
+    def parse_array(path):
+        if peek() == ']':
+            expect(']')
+            return
+        while True:
+            yield path, decode_value()
+            if expect(',]') == ']':
+                return
+
+    def parse_object(path):
+        if peek() == '}':
+            expect('}')
+            return
+        while True:
+            key = decode_value()
+            expect(':')
+            child = path + (key,)
+            if child in targets:
+                if peek() == '[':
+                    expect('[')
+                    yield from parse_array(child)
+                else:
+                    yield child, decode_value()
+            elif child in prefixes and peek() == '{':
+                expect('{')
+                yield from parse_object(child)
+            else:
+                decode_value()
+            if expect(',}') == '}':
+                return
 
-    tracks = data['result']['tracks']
-    track_list = []
+    expect('{')
+    yield from parse_object(())
 
-    for track in tracks:
-        # 获取歌曲名和艺术家
-        song_name = track.get('name', '未知歌曲')
-        artists = track.get('artists', [])
+def track_record(position, track):
+    """把歌曲详情转换为歌曲记录：位置、艺术家、歌曲名、ID、专辑和时长（毫秒）"""
+    artists = track.get('artists') or track.get('ar') or []
+    album = track.get('album') or track.get('al') or {}
+    return {
+        'position': position,
+        'artists': ' / '.join([artist.get('name', '') for artist in artists]),
+        'name': track.get('name', '未知歌曲'),
+        'id': track.get('id'),
+        'album': album.get('name'),
+        'duration': track.get('duration', track.get('dt'))
+    }
 
-        # 拼接艺术家名称
-        if artists:
-            artist_names = ' / '.join([artist.get('name', '') for artist in artists])
-            track_info = f"{artist_names} - {song_name}"
-        else:
-            track_info = song_name
+def open_playlist_stream(client, playlist_url, cookie=None):
+    """使用 client（NetEaseClient）以流式方式请求歌单，返回 (歌曲记录生成器, HTTP 状态码, 接口返回码)
 
-        track_list.append(track_info)
+    读取到第一首歌曲后才返回，失败时生成器为 None。大歌单只内联了开头部分歌曲时，
+    其余歌曲在内联部分之后按 trackIds 分批获取，因此读完生成器之前不能关闭 client。
+    """
+    playlist_id = playlist_url.split('=')[-1]
+    params = {'id': playlist_id, 'n': 100000, 's': 8}
+    try:
+        response = client.get("/api/playlist/detail", params, cookie, stream=True)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        return None, getattr(e.response, 'status_code', None), None
 
-    return track_list
+    events = iter_json_values(response.iter_content(STREAM_CHUNK_SIZE), PLAYLIST_STREAM_PATHS)
+    track_ids = []
+    code = None
+    try:
+        for path, value in events:
+            if path == ('code',):
+                code = value
+            elif path == ('result', 'trackIds'):
+                track_ids.append(value.get('id'))
+            elif path == ('result', 'tracks'):
+                return (stream_playlist_tracks(client, response, events, value, track_ids, cookie),
+                        response.status_code, code)
+    except ValueError:
+        pass
+
+    # 没有内联歌曲：只有 trackIds 时直接分批获取
+    response.close()
+    if code in (None, 200) and track_ids:
+        return stream_playlist_tracks(client, None, iter(()), None, track_ids, cookie), response.status_code, 200
+    return None, response.status_code, code
+
+def stream_playlist_tracks(client, response, events, first_track, track_ids, cookie=None):
+    """open_playlist_stream 使用的生成器：依次产生内联歌曲和补全的歌曲记录（见 track_record）
+
+    按 trackIds 补全时有歌曲详情获取失败，则在产生全部获取到的歌曲后抛出 PlaylistIncomplete。
+    """
+    seen = set()
+    position = 0
+    try:
+        if first_track is not None:
+            position += 1
+            seen.add(first_track.get('id'))
+            yield track_record(position, first_track)
+        for path, value in events:
+            if path == ('result', 'tracks'):
+                position += 1
+                seen.add(value.get('id'))
+                yield track_record(position, value)
+            elif path == ('result', 'trackIds'):
+                track_ids.append(value.get('id'))
+    finally:
+        if response is not None:
+            response.close()
+
+    missing = [track_id for track_id in track_ids if track_id is not None and track_id not in seen]
+    failed = 0
+    for start in range(0, len(missing), TRACK_BATCH_SIZE * TRACK_FETCH_WORKERS):
+        songs, failed_ids = fetch_song_details(client, missing[start:start + TRACK_BATCH_SIZE * TRACK_FETCH_WORKERS],
+                                               cookie)
+        failed += len(failed_ids)
+        for song in songs:
+            position += 1
+            yield track_record(position, song)
+
+    # 部分歌曲获取失败时不能把不完整的歌单当作成功写入
+    if failed:
+        raise PlaylistIncomplete(f"⚠ 歌单共 {position + failed} 首，其中 {failed} 首的详情获取失败"
+                                 f"（按 trackIds 分批请求了 {len(missing)} 首），歌单不完整")
+
+def format_track(record):
+    """playlist.txt 中的一行：艺术家 - 歌曲名"""
+    if record['artists']:
+        return f"{record['artists']} - {record['name']}"
+    return record['name']
+
+def sidecar_track(record, line):
+    """playlist.json 中的一首歌曲：歌曲信息加上 organize_playlist 预计算的匹配键
+
+    匹配键按 read_playlist 解析 playlist.txt 中这一行的方式计算，两种读取方式得到相同的标题。
+    """
+    keys = playlist_line_record(line)
+    return {
+        'position': record['position'],
+        'id': record['id'],
+        'name': record['name'],
+        'artists': record['artists'],
+        'album': record['album'],
+        'duration': record['duration'],
+        'line': line.rstrip('\n'),
+        'keys': keys
+    }
+
+def update_playlist_file(tracks, filename=PLAYLIST_FILENAME, progress=None):
+    """更新playlist.txt文件，同时在旁边写入结构化的 playlist.json
 
-def update_playlist_file(track_list, filename="playlist.txt"):
-    """更新playlist.txt文件"""
+    tracks 为歌曲记录的可迭代对象（可以是生成器），边读取边写入临时文件，
+    全部写完后再替换原文件，中途出错时原文件保持不变。
+    playlist.json 记录 playlist.txt 内容的哈希，playlist.txt 被手动修改后命名排序会忽略它。
+    tracks 抛出 PlaylistIncomplete（部分歌曲获取失败）时同样保留原文件并返回失败。
+    progress 为 JobProgress 时报告 'playlist' 阶段的进度（总数未知）；
+    取消时删除临时文件、保留原文件并抛出 JobCancelled。
+    """
+    sidecar = playlist_sidecar_path(filename)
+    temp_paths = [filename + ".tmp", sidecar + ".tmp"]
+    count = 0
+    # 逐行计算 playlist.txt 内容的哈希（与 organize_playlist.playlist_text_digest 一致）
+    digest = hashlib.sha1()
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            for i, track in enumerate(track_list, 1):
-                f.write(f"{i}. {track}\n")
-        return True, f"成功更新 {filename}，共 {len(track_list)} 首歌曲"
+        # 批量同步时目标目录可能尚不存在
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        with open(temp_paths[0], 'w', encoding='utf-8') as f, open(temp_paths[1], 'w', encoding='utf-8') as j:
+            j.write('{"version": %d, "keys_version": %d, "tracks": [\n' % (PLAYLIST_SIDECAR_VERSION, PLAYLIST_KEYS_VERSION))
+            for record in tracks:
+                if progress is not None:
+                    progress.check_cancelled()
+                    progress.report('playlist', count, None, record['name'])
+                count += 1
+                line = f"{count}. {format_track(record)}\n"
+                f.write(line)
+                digest.update(line.encode('utf-8'))
+                if count > 1:
+                    j.write(',\n')
+                j.write(json.dumps(sidecar_track(record, line), ensure_ascii=False))
+            j.write('\n], "text_sha1": %s}\n' % json.dumps(digest.hexdigest()))
+        if not count:
+            for temp_path in temp_paths:
+                os.remove(temp_path)
+            return False, "未能解析到任何歌曲信息"
+        os.replace(temp_paths[0], filename)
+        os.replace(temp_paths[1], sidecar)
+        return True, f"成功更新 {filename}，共 {count} 首歌曲"
     except Exception as e:
+        for temp_path in temp_paths:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        if isinstance(e, JobCancelled):
+            raise
+        if isinstance(e, PlaylistIncomplete):
+            return False, f"{e}，未更新 {filename}"
         return False, f"写入文件时出错: {e}"
 
-def get_cookie_from_browser():
-    """从浏览器自动获取Cookie"""
-    if not BROWSER_COOKIE_AVAILABLE:
-        return None
+def load_cached_cookie(path=COOKIE_CACHE_FILE):
+    """读取缓存的 Cookie，缓存不存在、损坏或已过期时返回 None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('expires', 0) - COOKIE_EXPIRY_MARGIN > time.time() and 'MUSIC_U=' in cached.get('cookie', ''):
+            return cached['cookie']
+    except (OSError, ValueError, AttributeError, TypeError):
+        pass
+    return None
+
+def save_cached_cookie(cookie, expires, browser, path=COOKIE_CACHE_FILE):
+    """保存 Cookie 及其过期时间（仅当前用户可读写，先写临时文件再替换）"""
+    temp_path = path + ".tmp"
+    try:
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'cookie': cookie, 'expires': expires, 'browser': browser, 'saved_at': time.time()}, f)
+        os.replace(temp_path, path)
+    except OSError:
+        # 缓存写入失败不影响本次使用
+        pass
+
+def invalidate_cached_cookie(cookie=None, path=COOKIE_CACHE_FILE):
+    """删除缓存的 Cookie；指定 cookie 时只在缓存内容与其相同时删除"""
+    if cookie is not None and load_cached_cookie(path) != cookie:
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
 
+def read_browser_cookie(browser):
+    """从指定浏览器读取网易云的 Cookie，返回 (Cookie字符串, 过期时间戳)，没有 MUSIC_U 时返回 None"""
     try:
-        # 尝试从Firefox获取Cookie
-        try:
-            firefox_cookies = browser_cookie3.firefox(domain_name='.music.163.com')
-            cookie_dict = {cookie.name: cookie.value for cookie in firefox_cookies}
+        cookies = list(getattr(browser_cookie3, browser)(domain_name='.music.163.com'))
+    except Exception:
+        return None
 
-            # 检查是否有必要的Cookie
-            if 'MUSIC_U' in cookie_dict:
-                # 构造Cookie字符串
-                cookie_str = '; '.join([f"{name}={value}" for name, value in cookie_dict.items()])
-                return cookie_str
-        except Exception:
-            pass
+    music_u = [cookie for cookie in cookies if cookie.name == 'MUSIC_U' and cookie.value]
+    if not music_u:
+        return None
+    expires = music_u[0].expires or time.time() + COOKIE_DEFAULT_TTL
+    # 构造Cookie字符串
+    cookie_str = '; '.join([f"{cookie.name}={cookie.value}" for cookie in cookies])
+    return cookie_str, expires
 
-        # 尝试从Chrome获取Cookie
-        try:
-            chrome_cookies = browser_cookie3.chrome(domain_name='.music.163.com')
-            cookie_dict = {cookie.name: cookie.value for cookie in chrome_cookies}
+def get_cookie_from_browser(rejected=None):
+    """从浏览器自动获取Cookie
 
-            # 检查是否有必要的Cookie
-            if 'MUSIC_U' in cookie_dict:
-                # 构造Cookie字符串
-                cookie_str = '; '.join([f"{name}={value}" for name, value in cookie_dict.items()])
-                return cookie_str
-        except Exception:
-            pass
+    优先使用未过期的缓存；缓存缺失、过期，或 rejected（被服务器以 20001/403 拒绝的 Cookie）
+    与缓存相同时，并发读取 COOKIE_BROWSERS 中的浏览器，采用最先得到的有效结果并写入缓存。
+    """
+    if rejected is not None:
+        invalidate_cached_cookie(rejected)
+    cached = load_cached_cookie()
+    if cached:
+        return cached
 
+    if not BROWSER_COOKIE_AVAILABLE:
         return None
-    except Exception:
+
+    browsers = [browser for browser in COOKIE_BROWSERS if hasattr(browser_cookie3, browser)]
+    if not browsers:
         return None
 
-def update_playlist(playlist_url):
-    """更新歌单功能的主函数"""
-    output = []
+    # 读取较慢的浏览器不再等待，其线程在后台自行结束
+    pool = ThreadPoolExecutor(max_workers=len(browsers))
+    try:
+        futures = {pool.submit(read_browser_cookie, browser): browser for browser in browsers}
+        for future in as_completed(futures):
+            result = future.result()
+            if result:
+                cookie_str, expires = result
+                save_cached_cookie(cookie_str, expires, futures[future])
+                return cookie_str
+        return None
+    finally:
+        pool.shutdown(wait=False)
+
+def update_playlist(playlist_url, progress=None):
+    """更新歌单功能的主函数
+
+    progress 为 JobProgress 时报告进度，取消时抛出 JobCancelled（原 playlist.txt 保持不变）。
+    """
+    output = job_output(progress)
     
     # 验证URL格式
     if not playlist_url.startswith("https://music.163.com/api/playlist/detail?id="):
@@ -169,109 +760,306 @@ def update_playlist(playlist_url):
         output.append("格式应为: https://music.163.com/api/playlist/detail?id=歌单ID")
         return "\n".join(output)
 
-    # 初始尝试获取数据
+    # 同一次更新中的所有请求共用一个客户端（连接池、重试和限速），取消后不再等待重试
+    client = NetEaseClient(cancelled=progress.cancelled if progress is not None else None)
+    try:
+        if update_playlist_with_client(client, playlist_url, output, progress=progress):
+            output.append("\n现在可以运行 命名排序 功能来匹配和重命名音乐文件了")
+    finally:
+        client.close()
+    output.append(client.stats_summary())
+
+    return "\n".join(output)
+
+def update_playlist_with_client(client, playlist_url, output, filename=PLAYLIST_FILENAME,
+                                get_cookie=get_cookie_from_browser, progress=None):
+    """使用给定客户端获取歌单并写入 filename，过程信息追加到 output，返回是否成功
+
+    get_cookie 为需要登录时获取 Cookie 的函数，签名同 get_cookie_from_browser。
+    progress 为 JobProgress 时报告写入进度（见 update_playlist_file）。
+    """
+    # 初始尝试获取数据（流式读取，边解析边写入）
     output.append("正在获取歌单数据...")
-    data, status_code = fetch_playlist_data(playlist_url)
+    tracks, status_code, code = open_playlist_stream(client, playlist_url)
 
     # 检查是否需要登录
     cookie = None
-    if not data or (data and data.get('code') == 20001) or status_code == 403:
+    if tracks is None or code == 20001 or status_code == 403:
         output.append("检测到可能需要登录才能访问该歌单")
         # 直接尝试从浏览器获取Cookie，无需用户确认
-        cookie = get_cookie_from_browser()
+        cookie = get_cookie()
 
         if cookie:
             output.append("正在使用获取到的Cookie重新获取歌单数据...")
-            data, status_code = fetch_playlist_data(playlist_url, cookie)
-
-    if not data:
-        output.append("无法获取歌单数据")
-        return "\n".join(output)
-
-    # 检查返回码
-    if data.get('code') != 200:
-        output.append(f"获取歌单数据失败，错误码: {data.get('code')}")
-        if data.get('code') == 20001:
-            output.append("请确保您已正确登录并提供了有效的Cookie")
-        return "\n".join(output)
+            tracks, status_code, code = open_playlist_stream(client, playlist_url, cookie)
+
+            # 缓存的Cookie可能已失效，重新从浏览器读取
+            if code == 20001 or status_code == 403:
+                fresh_cookie = get_cookie(rejected=cookie)
+                if fresh_cookie and fresh_cookie != cookie:
+                    output.append("Cookie已失效，正在使用重新获取的Cookie再次获取歌单数据...")
+                    tracks, status_code, code = open_playlist_stream(client, playlist_url, fresh_cookie)
+
+    if tracks is None:
+        if code is None:
+            output.append("无法获取歌单数据")
+        else:
+            output.append(f"获取歌单数据失败，错误码: {code}")
+            if code == 20001:
+                output.append("请确保您已正确登录并提供了有效的Cookie")
+        return False
 
     output.append("正在解析歌单信息...")
-    track_list = parse_playlist_tracks(data)
-
-    if not track_list:
-        output.append("未能解析到任何歌曲信息")
-        return "\n".join(output)
-
-    output.append(f"成功解析到 {len(track_list)} 首歌曲")
 
     # 更新playlist.txt文件
-    success, message = update_playlist_file(track_list)
+    success, message = update_playlist_file(tracks, filename, progress)
     output.append(message)
     
     if success:
         output.append("playlist.txt 更新完成!")
-        output.append("\n现在可以运行 命名排序 功能来匹配和重命名音乐文件了")
     else:
         output.append("更新playlist.txt失败")
-        
-    return "\n".join(output)
+    return success
 
-# ==================== 命名排序功能 ====================
-def normalize_text(text):
-    """文本标准化处理（增强乱码清理）"""
-    if not isinstance(text, str):
-        return text
+def playlist_api_url(playlist_id):
+    """歌单ID对应的歌单API链接"""
+    return f"https://music.163.com/api/playlist/detail?id={playlist_id}"
+
+def safe_dirname(name):
+    """把歌单名转换为可用作目录名的字符串"""
+    name = ''.join('_' if char in INVALID_PATH_CHARS or ord(char) < 32 else char for char in name)
+    return name.strip().strip('.') or "_"
+
+def load_playlist_map(path):
+    """读取歌单列表文件，返回 [(歌单ID, 目标目录)]
 
-    # 替换常见中日文特殊字符为ASCII等价
-    special_replaces = {
-        '〜': '~', '～': '~', 'ー': '-', 'ｰ': '-', '（': '(', '）': ')',
-        '「': '[', '」': ']', '【': '[', '】': ']', '｛': '{', '｝': '}',
-        '“': '"', '”': '"', '‘': "'", '’': "'", '・': '.', '。': '.'
+    每行为 "歌单ID或链接 目标目录"，# 开头的行为注释；省略目录时使用歌单ID作为目录名，
+    相对目录以列表文件所在目录为基准。
+    """
+    base_dir = os.path.dirname(os.path.abspath(path))
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = line.split(None, 1)
+            playlist_id = parts[0].split('=')[-1]
+            if not playlist_id.isdigit():
+                raise ValueError(f"{path} 第 {line_number} 行的歌单ID无效: {parts[0]}")
+            directory = parts[1].strip() if len(parts) > 1 else playlist_id
+            entries.append((playlist_id, os.path.join(base_dir, directory)))
+    return entries
+
+def fetch_user_playlists(client, user_id, cookie=None):
+    """分页获取用户的全部歌单，返回 [(歌单ID, 歌单名)]；返回码不为 200 时抛出 ValueError"""
+    playlists = []
+    offset = 0
+    while True:
+        data = client.get_json("/api/user/playlist",
+                               {'uid': user_id, 'limit': USER_PLAYLIST_PAGE_SIZE, 'offset': offset}, cookie)
+        if data.get('code') != 200:
+            raise ValueError(f"获取用户歌单失败，错误码: {data.get('code')}")
+        page = data.get('playlist') or []
+        playlists.extend((str(item.get('id')), item.get('name') or str(item.get('id'))) for item in page)
+        if not data.get('more') or not page:
+            return playlists
+        offset += len(page)
+
+def shared_cookie_getter():
+    """批量同步时各歌单共用的 Cookie 获取函数：只读取一次，Cookie 被拒绝时也只刷新一次"""
+    lock = threading.Lock()
+    cached = []
+
+    def get_cookie(rejected=None):
+        with lock:
+            if not cached or (rejected is not None and cached[0] == rejected):
+                cached[:] = [get_cookie_from_browser(rejected)]
+            return cached[0]
+
+    return get_cookie
+
+def sync_one_playlist(client, playlist_id, directory, get_cookie):
+    """同步单个歌单到 directory/playlist.txt，返回结果字典（异常不会向外抛出）"""
+    output = []
+    start_time = time.perf_counter()
+    try:
+        success = update_playlist_with_client(client, playlist_api_url(playlist_id), output,
+                                              os.path.join(directory, PLAYLIST_FILENAME), get_cookie)
+    except Exception as e:
+        output.append(f"同步时出错: {e}")
+        success = False
+    return {
+        'id': playlist_id,
+        'directory': directory,
+        'success': success,
+        'elapsed': time.perf_counter() - start_time,
+        'output': output
     }
-    for orig, repl in special_replaces.items():
-        text = text.replace(orig, repl)
 
-    # 音调处理 (降噪处理)
-    normalized_chars = []
-    for char in text:
-        try:
-            # NFC规范化
-            normalized = unicodedata.normalize('NFC', char)
-            # 转换为小写
-            if normalized.isalpha():
-                normalized = normalized.lower()
-            normalized_chars.append(normalized)
-        except:
-            normalized_chars.append(char)
+def sync_playlists(source, base_dir=None, workers=PLAYLIST_SYNC_WORKERS, progress=None):
+    """批量同步歌单，每个歌单写入各自目录下的 playlist.txt
 
-    text = ''.join(normalized_chars)
+    source 为网易云用户ID（同步该用户的全部歌单到 base_dir 下以歌单名命名的子目录，
+    默认当前目录），或歌单列表文件的路径（格式见 load_playlist_map）。
+    各歌单在线程池中并发同步（最多 workers 个），共用一个客户端的连接池、重试和限速，
+    单个歌单失败或较慢不影响其他歌单。
+    progress 为 JobProgress 时按完成的歌单数报告 'sync' 阶段的进度；取消后尚未开始的歌单不再同步，
+    正在同步的歌单照常完成（但不再等待失败请求的重试）。
+    """
+    output = job_output(progress)
+    start_time = time.perf_counter()
+    get_cookie = shared_cookie_getter()
+    client = NetEaseClient(pool_size=max(1, workers) * TRACK_FETCH_WORKERS,
+                           cancelled=progress.cancelled if progress is not None else None)
+    try:
+        if source.isdigit():
+            base_dir = base_dir or os.getcwd()
+            try:
+                playlists = fetch_user_playlists(client, source)
+            except (requests.exceptions.RequestException, ValueError):
+                # 私密歌单需要登录后才能获取
+                playlists = fetch_user_playlists(client, source, get_cookie())
+            jobs = []
+            used_names = set()
+            for playlist_id, name in playlists:
+                dirname = safe_dirname(name)
+                if dirname.lower() in used_names:
+                    dirname = f"{dirname}_{playlist_id}"
+                used_names.add(dirname.lower())
+                jobs.append((playlist_id, os.path.join(base_dir, dirname), name))
+            output.append(f"用户 {source} 共有 {len(jobs)} 个歌单")
+        else:
+            jobs = [(playlist_id, directory, playlist_id) for playlist_id, directory in load_playlist_map(source)]
+            output.append(f"歌单列表文件 {source} 中共有 {len(jobs)} 个歌单")
+    except (OSError, ValueError, requests.exceptions.RequestException) as e:
+        client.close()
+        output.append(f"无法获取歌单列表: {e}")
+        return "\n".join(output)
+
+    # 同一目录只能对应一个歌单
+    results = {}
+    runnable = []
+    seen_dirs = set()
+    for index, (playlist_id, directory, name) in enumerate(jobs):
+        key = os.path.normcase(os.path.abspath(directory))
+        if key in seen_dirs:
+            results[index] = {'id': playlist_id, 'directory': directory, 'success': False, 'elapsed': 0.0,
+                              'output': ["目标目录与其他歌单重复，已跳过"]}
+            continue
+        seen_dirs.add(key)
+        runnable.append(index)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {pool.submit(sync_one_playlist, client, jobs[index][0], jobs[index][1], get_cookie): index
+                       for index in runnable}
+            if progress is not None:
+                progress.report('sync', 0, len(runnable))
+            done = 0
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                index = futures[future]
+                results[index] = future.result()
+                done += 1
+                if progress is not None:
+                    progress.report('sync', done, len(runnable), jobs[index][2])
+                    # 只取消尚未开始的歌单
+                    if progress.cancelled():
+                        for pending in futures:
+                            pending.cancel()
+    finally:
+        client.close()
+
+    cancelled = 0
+    for index in runnable:
+        if index not in results:
+            results[index] = {'id': jobs[index][0], 'directory': jobs[index][1], 'success': False, 'elapsed': 0.0,
+                              'output': ["任务已取消，未同步"]}
+            cancelled += 1
+
+    succeeded = 0
+    for index, (playlist_id, directory, name) in enumerate(jobs):
+        result = results[index]
+        succeeded += result['success']
+        status = "成功" if result['success'] else "失败"
+        label = name if name == playlist_id else f"{name} ({playlist_id})"
+        output.append(f"\n[{status}] {label} -> {directory}，用时 {result['elapsed']:.2f} 秒")
+        output.extend(f"    {line}" for line in result['output'])
+
+    output.append(f"\n同步完成: 成功 {succeeded} 个，失败 {len(jobs) - succeeded - cancelled} 个，"
+                  f"总用时 {time.perf_counter() - start_time:.2f} 秒")
+    if cancelled:
+        output.append(f"⚠ 任务已取消，{cancelled} 个歌单未同步")
+    output.append(client.stats_summary())
+    return "\n".join(output)
+
+# ==================== 命名排序功能 ====================
+# 替换常见中日文特殊字符为ASCII等价
+SPECIAL_REPLACES = {
+    '〜': '~', '～': '~', 'ー': '-', 'ｰ': '-', '（': '(', '）': ')',
+    '「': '[', '」': ']', '【': '[', '】': ']', '｛': '{', '｝': '}',
+    '“': '"', '”': '"', '‘': "'", '’': "'", '・': '.', '。': '.'
+}
+
+# 全角字符转半角的码位范围
+FULLWIDTH_RANGES = [
+    (0xFF01, 0xFF0F),  # 全角标点
+    (0xFF1A, 0xFF20),  # 全角符号
+    (0xFF3B, 0xFF40),  # 全角括弧
+    (0xFF5B, 0xFF5E)  # 全角运算符
+]
+FULLWIDTH_TABLE = {
+    code: code - 0xFEE0
+    for start, end in FULLWIDTH_RANGES
+    for code in range(start, end + 1)
+    if 0x21 <= code - 0xFEE0 <= 0x7E
+}
+
+# 清理非常用符号和乱码字符
+NOISE_PATTERN = re.compile(r'[^\w\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff\s\(\)\-\~\.]')
+
+def normalize_char(char):
+    """单个字符的标准化结果（供查表缓存使用）"""
+    char = SPECIAL_REPLACES.get(char, char)
+
+    # 音调处理：NFC规范化，字母转换为小写
+    try:
+        normalized = unicodedata.normalize('NFC', char)
+        if normalized.isalpha():
+            normalized = normalized.lower()
+    except Exception:
+        normalized = char
 
     # 移除变音符记号
-    text = ''.join(
-        c for c in unicodedata.normalize('NFD', text)
+    normalized = ''.join(
+        c for c in unicodedata.normalize('NFD', normalized)
         if not unicodedata.combining(c)
     )
 
-    # 转换全角字符为半角
-    fullwidth_ranges = [
-        (0xFF01, 0xFF0F),  # 全角标点
-        (0xFF1A, 0xFF20),  # 全角符号
-        (0xFF3B, 0xFF40),  # 全角括弧
-        (0xFF5B, 0xFF5E)  # 全角运算符
-    ]
-    for start, end in fullwidth_ranges:
-        for code in range(start, end + 1):
-            half_code = code - 0xFEE0
-            if 0x21 <= half_code <= 0x7E:
-                text = text.replace(chr(code), chr(half_code))
+    # 转换全角字符为半角，并清理乱码
+    normalized = normalized.translate(FULLWIDTH_TABLE)
+    return NOISE_PATTERN.sub('', normalized)
 
-    # ============ 关键修复1：改进乱码清理 ============
-    # 清理非常用符号和乱码字符
-    text = re.sub(r'[^\w\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff\s\(\)\-\~\.]', '', text)
-    # 合并连续空格
-    text = re.sub(r'\s+', ' ', text).strip()
+class NormalizeTable(dict):
+    """str.translate 使用的惰性字符表：每个码位只计算一次，之后直接查表"""
+
+    def __missing__(self, code):
+        result = normalize_char(chr(code))
+        self[code] = result
+        return result
+
+NORMALIZE_TABLE = NormalizeTable()
+
+def normalize_text(text):
+    """文本标准化处理（增强乱码清理）"""
+    if not isinstance(text, str):
+        return text
 
-    return text
+    # 特殊字符替换、小写、去变音符、全角转半角和乱码清理在一次查表中完成，
+    # 然后合并连续空格
+    return ' '.join(text.translate(NORMALIZE_TABLE).split())
 
 def extract_core_title(title):
     """提取标题核心部分（增强乱码处理）"""
@@ -316,235 +1104,2276 @@ def extract_core_title(title):
 
     return title
 
+# 片假名转平假名的码位映射，同时去除模糊字符
+KANA_BLUR_CHARS = 'ゔゕゖゝゞゟ'
+KANA_FOLD_TABLE = {
+    code: None if chr(code - 96) in KANA_BLUR_CHARS else code - 96
+    for code in range(ord('ァ'), ord('ヺ') + 1)
+}
+KANA_FOLD_TABLE.update({ord(char): None for char in KANA_BLUR_CHARS})
+
+def fold_kana(text):
+    """日语假名规范化：片假名转平假名，去除模糊字符"""
+    return text.translate(KANA_FOLD_TABLE)
+
+def similarity_keys(text):
+    """预先计算 advanced_similarity 需要的比较形式"""
+    kana = fold_kana(text)
+    folded = kana.lower().strip()
+    return {
+        'kana': kana,
+        'folded': folded,
+        'folded_core': extract_core_title(folded),
+    }
+
+def build_match_record(text):
+    """预先计算一个标题在匹配中用到的全部标准化形式"""
+    title = str(text)
+    norm = normalize_text(title)
+    record = {
+        'title': title,
+        'norm': norm,
+        'core': extract_core_title(norm),
+    }
+    # 相似度计算基于标准化后的文本
+    record.update(similarity_keys(norm))
+    return record
+
+def cached_matcher(record, text):
+    """返回以 text 为 b 序列的 SequenceMatcher，缓存在记录上
+
+    b 端索引（b2j）只在第一次使用时构建，之后每次比较只需 set_seq1。
+    """
+    matchers = record.get('matchers')
+    if matchers is None:
+        matchers = record['matchers'] = {}
+    matcher = matchers.get(text)
+    if matcher is None:
+        matcher = matchers[text] = difflib.SequenceMatcher(None, '', text)
+    return matcher
+
+def similarity_analysis(r1, r2, threshold=None):
+    """多维度相似度分析，返回 (相似度, matcher)
+
+    matcher 为完成了完整 ratio 计算的 SequenceMatcher（其余情况为 None），
+    调用方可以复用其中的匹配块。给出 threshold 时先用 real_quick_ratio/quick_ratio
+    上界判断，上界已低于阈值则直接返回该上界，不再做完整计算。
+    """
+    # 快速检查相同情况（假名规范化之后）
+    if r1['kana'] == r2['kana']:
+        return 1.0, None
+
+    s1 = r1['folded']
+    s2 = r2['folded']
+    core1 = r1['folded_core']
+    core2 = r2['folded_core']
+
+    # 核心匹配检查
+    if core1 and core2:
+        if core1 == core2:
+            return 0.95, None
+
+        if core1 in s2 or s1 in s2 or core2 in s1:
+            return 0.85, None
+
+    # 使用Python内建的SequenceMatcher（b 端按条目缓存）
+    matcher = cached_matcher(r2, s2)
+    matcher.set_seq1(s1)
+    if threshold is not None:
+        bound = matcher.real_quick_ratio()
+        if bound < threshold:
+            return bound, None
+        bound = matcher.quick_ratio()
+        if bound < threshold:
+            return bound, None
+
+    return matcher.ratio(), matcher
+
+def record_similarity(r1, r2, threshold=None):
+    """基于预计算形式的多维度相似度计算
+
+    给出 threshold 时，低于阈值的结果可能只是一个上界（见 similarity_analysis）。
+    """
+    return similarity_analysis(r1, r2, threshold)[0]
+
+def longest_common_block(query, title, matcher=None):
+    """标准化文本之间的最长公共子串长度
+
+    matcher 为同一对字符串已完成 ratio 计算的 SequenceMatcher 时直接复用其匹配块
+    （b 较短时没有自动 junk，最长匹配块就是最长公共子串）；
+    否则使用缓存的 b 端，并先用公共字符数上界排除不可能达到一半长度的情况。
+    """
+    q_norm = query['norm']
+    t_norm = title['norm']
+
+    if (matcher is not None and matcher.a == q_norm and matcher.b == t_norm
+            and len(t_norm) < 200):
+        return max(block.size for block in matcher.get_matching_blocks())
+
+    matcher = cached_matcher(title, t_norm)
+    matcher.set_seq1(q_norm)
+    total = len(q_norm) + len(t_norm)
+    if total:
+        common = round(matcher.quick_ratio() * total / 2)
+        if common < min(len(q_norm), len(t_norm)) * 0.5:
+            return common
+    return matcher.find_longest_match(0, len(q_norm), 0, len(t_norm)).size
+
 def advanced_similarity(s1, s2):
     """多维度文本相似度计算（添加日语假名规范化）"""
     s1 = str(s1) if not isinstance(s1, str) else s1
     s2 = str(s2) if not isinstance(s2, str) else s2
 
-    # ============ 关键修复3：日语字符规范化处理 ============
-    if bool(re.search(r'[\u3040-\u30ff]', s1 + s2)):
-        # 片假名转平假名
-        s1 = re.sub(r'[ァ-ヺ]', lambda x: chr(ord(x.group(0)) - 96), s1)
-        s2 = re.sub(r'[ァ-ヺ]', lambda x: chr(ord(x.group(0)) - 96), s2)
-        # 去除模糊字符
-        s1 = re.sub(r'[ゔゕゖゝゞゟ]', '', s1)
-        s2 = re.sub(r'[ゔゕゖゝゞゟ]', '', s2)
-
-    # 快速检查相同情况
-    if s1 == s2:
+    return record_similarity(similarity_keys(s1), similarity_keys(s2))
+
+def improved_fuzzy_match(query, title, threshold=0.72):
+    """改进的模糊匹配算法（降低阈值）
+
+    query 和 title 可以是字符串，也可以是 build_match_record 预计算的记录，
+    传入记录时不再重复标准化。
+    """
+    # ============ 关键修复4：降低匹配阈值 ============
+    adjusted_threshold = max(0.65, threshold)  # 最低降至0.65
+
+    if not isinstance(query, dict):
+        query = build_match_record(query)
+    if not isinstance(title, dict):
+        title = build_match_record(title)
+
+    # 0. 完全匹配
+    if query['title'] == title['title']:
+        return (title['title'], "exact")
+
+    # 1. 标准化处理（已预先完成）
+    q_norm = query['norm']
+    t_norm = title['norm']
+
+    # 2. 核心部分匹配
+    q_core = query['core']
+    t_core = title['core']
+
+    if q_core == t_core:
+        return (title['title'], "core")
+
+    # 3. 相互包含检查
+    if q_core in t_norm or q_norm in t_norm:
+        return (title['title'], f"包含核心({q_core}在{title['title'][:20]}中)")
+
+    if t_core in q_norm:
+        return (title['title'], "反包含")
+
+    # 4. 相似度匹配（上界低于阈值时跳过完整计算）
+    similarity_score, matcher = similarity_analysis(query, title, adjusted_threshold)
+    if similarity_score >= adjusted_threshold:  # 使用调整后的阈值
+        return (title['title'], f"相似度:{similarity_score:.2f}")
+
+    # 5. 子序列匹配（复用第 4 步的分析结果）
+    block_size = longest_common_block(query, title, matcher)
+    if block_size > 0:
+        min_length = min(len(q_norm), len(t_norm)) * 0.5
+        if block_size >= min_length:
+            return (title['title'], "公共子串")
+
+    return (None, "")
+
+def playlist_line_title(line):
+    """从播放列表文件的一行中取出歌曲标题（去掉序号），空行返回 None"""
+    clean_line = line.strip()
+    if not clean_line:
+        return None
+
+    # 匹配多种格式：数字.标题
+    match = re.match(r'^\s*\d+\.\s*(.+)', clean_line)
+    if match:
+        return match.group(1)
+    # 匹配 - 标题格式
+    if re.match(r'^\s*-', clean_line):
+        return re.sub(r'^\s*-\s*', '', clean_line)
+    # 其他格式直接添加
+    return clean_line
+
+def read_playlist_lines(playlist_file):
+    """读取播放列表文件中的原始歌曲标题（未标准化、未去重），读取失败时返回空列表"""
+    playlist = []
+
+    try:
+        with open(playlist_file, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                title = playlist_line_title(line)
+                if title is not None:
+                    playlist.append(title)
+    except Exception as e:
+        return []
+
+    return playlist
+
+def read_playlist(playlist_file):
+    """读取播放列表文件并标准化处理"""
+    # 去除重复项
+    seen = set()
+    unique_playlist = []
+    for title in read_playlist_lines(playlist_file):
+        norm_title = normalize_text(title)
+        if norm_title and norm_title not in seen:
+            seen.add(norm_title)
+            unique_playlist.append(norm_title)
+
+    return unique_playlist
+
+# 中日文字符：单字也作为 gram，保证单个汉字的标题也能召回
+CJK_CHAR_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff]')
+
+def text_grams(text):
+    """提取字符 bigram/trigram（中日文额外加入单字 gram）"""
+    grams = set()
+    for token in text.split():
+        if len(token) < 3:
+            grams.add(token)
+        for n in (2, 3):
+            for i in range(len(token) - n + 1):
+                grams.add(token[i:i + n])
+        grams.update(CJK_CHAR_PATTERN.findall(token))
+    return grams
+
+def split_playlist_title(title):
+    """把播放列表条目 "艺术家 - 标题" 拆分为 (艺术家, 标题)，无艺术家时返回 (None, 原标题)"""
+    artist, sep, song = title.partition(' - ')
+    if sep and artist.strip() and song.strip():
+        return artist.strip(), song.strip()
+    return None, title
+
+def artist_key(name):
+    """艺术家名的比较形式：标准化、假名折叠并去掉空格"""
+    return fold_kana(normalize_text(name)).replace(' ', '')
+
+def split_artists(text):
+    """把 "A / B feat. C" 形式的艺术家文本拆分为艺术家比较形式的列表（去重，保持顺序）"""
+    if not text:
+        return []
+    keys = []
+    for name in ARTIST_SEPARATOR_PATTERN.split(text):
+        key = artist_key(name.strip(' ()（）'))
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+def playlist_record(title, raw_title=None):
+    """播放列表条目的匹配记录：build_match_record 的结果加上
+    'artist_part'、'title_core'（去掉艺术家后的核心标题）和 'artist_keys'（各艺术家的比较形式）
+
+    标准化会去掉 "/" 等分隔符，给出 raw_title（标准化前的标题）时从中拆分艺术家，
+    否则整个艺术家部分作为一位艺术家。
+    """
+    record = build_match_record(title)
+    artist_part, title_part = split_playlist_title(record['norm'])
+    record['artist_part'] = artist_part
+    record['title_core'] = extract_core_title(title_part)
+    if raw_title is not None:
+        record['artist_keys'] = split_artists(split_playlist_title(raw_title)[0])
+    else:
+        record['artist_keys'] = split_artists(artist_part)
+    return record
+
+def playlist_line_record(line):
+    """playlist.txt 中一行对应的匹配记录（标题为空时 'title' 为空字符串）"""
+    raw_title = playlist_line_title(line) or ''
+    return playlist_record(normalize_text(raw_title), raw_title)
+
+def read_playlist_tracks(playlist_file):
+    """读取播放列表，返回 (歌曲列表, 是否来自 playlist.json)
+
+    优先使用 read_playlist_sidecar；没有可用的 playlist.json 时解析 playlist.txt，
+    歌曲只包含 'keys'。两种方式得到的标题与 read_playlist 相同。
+    """
+    tracks = read_playlist_sidecar(playlist_file)
+    if tracks:
+        return tracks, True
+
+    tracks = []
+    seen = set()
+    for raw_title in read_playlist_lines(playlist_file):
+        norm_title = normalize_text(raw_title)
+        if norm_title and norm_title not in seen:
+            seen.add(norm_title)
+            tracks.append({'keys': playlist_record(norm_title, raw_title)})
+    return tracks, False
+
+def playlist_sidecar_path(playlist_file):
+    """playlist.txt 对应的结构化播放列表文件路径（playlist.json）"""
+    return os.path.splitext(playlist_file)[0] + ".json"
+
+def playlist_text_digest(text):
+    """playlist.txt 内容的哈希，用于确认 playlist.json 与之对应（换行统一为 \\n）"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def read_playlist_sidecar(playlist_file):
+    """读取 playlist.txt 旁的 playlist.json，返回与 read_playlist 去重规则一致的歌曲列表
+
+    每首歌曲为包含 'id'、'name'、'artists'、'album'、'duration'（毫秒）和
+    'keys'（playlist_record 生成的匹配记录，其中 'title' 即 read_playlist 返回的标题）的字典。
+    文件不存在、损坏，或 playlist.txt 在生成后被修改过时返回 None，此时应改用 read_playlist。
+    """
+    try:
+        with open(playlist_sidecar_path(playlist_file), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        with open(playlist_file, 'r', encoding='utf-8', errors='replace') as f:
+            text = f.read()
+    except (OSError, ValueError):
+        return None
+
+    if (not isinstance(data, dict) or data.get('version') != PLAYLIST_SIDECAR_VERSION
+            or data.get('text_sha1') != playlist_text_digest(text)):
+        return None
+
+    # 标准化规则变化后旧的键不再可信，按歌曲文本重新计算
+    keys_valid = data.get('keys_version') == PLAYLIST_KEYS_VERSION
+    tracks = []
+    seen = set()
+    for track in data.get('tracks') or []:
+        keys = track.get('keys') if keys_valid else None
+        if not isinstance(keys, dict):
+            keys = track['keys'] = playlist_line_record(track.get('line', ''))
+        if keys.get('title') and keys['title'] not in seen:
+            seen.add(keys['title'])
+            tracks.append(track)
+    return tracks
+
+class PlaylistIndex:
+    """播放列表预处理索引：每个条目只标准化一次，供所有本地文件复用
+
+    每个条目是 playlist_record 生成的记录，另外带有 'position'（从1开始），
+    以及来自 playlist.json 的 'track_id'、'album' 和 'duration'（秒，没有时为 None）。
+    同时建立 标题/核心标题 -> 条目 的哈希表，用于 O(1) 的精确匹配层，
+    n-gram -> 条目下标 的倒排索引，用于模糊匹配的候选召回，
+    以及 艺术家 -> 条目 的分组，用于按艺术家缩小模糊匹配的范围。
+    """
+
+    def __init__(self, titles, stop_gram_ratio=STOP_GRAM_RATIO, positions=None, tracks=None):
+        self.entries = []
+        self.by_title = {}
+        self.by_core = {}
+        self.by_title_core = {}
+        self.gram_index = {}
+        self.by_artist = {}
+
+        # positions 用于只索引播放列表的一部分，同时保留条目在完整列表中的位置
+        if positions is None:
+            positions = range(1, len(titles) + 1)
+        # tracks 为与 titles 对应的 read_playlist_sidecar 结果，直接使用其中预计算的键
+        if tracks is None:
+            tracks = [None] * len(titles)
+
+        for entry_id, (position, title, track) in enumerate(zip(positions, titles, tracks)):
+            if track is None:
+                record = playlist_record(title)
+                track = {}
+            else:
+                record = dict(track['keys'])
+            record['position'] = position
+            record['track_id'] = track.get('id')
+            record['album'] = track.get('album')
+            record['duration'] = track['duration'] / 1000 if track.get('duration') else None
+            self.entries.append(record)
+
+            # 同一个键只保留最靠前的条目，与逐条扫描时的优先顺序一致
+            self.by_title.setdefault(record['title'], record)
+            self.by_core.setdefault(record['core'], record)
+            if record['title_core']:
+                self.by_title_core.setdefault(record['title_core'], []).append(record)
+
+            for gram in text_grams(record['folded']):
+                self.gram_index.setdefault(gram, []).append(entry_id)
+
+            for key in record.get('artist_keys') or ():
+                self.by_artist.setdefault(key, []).append(entry_id)
+
+        # 过于常见的 gram 几乎不提供区分度，召回时跳过以控制每个文件的开销
+        self.max_postings = max(20, int(len(self.entries) * stop_gram_ratio))
+        # 有条目带时长时才需要读取本地文件的时长
+        self.has_durations = MATCH_BY_DURATION and any(entry['duration'] for entry in self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def fingerprint(self):
+        """播放列表内容的指纹（标准化标题、时长及顺序的哈希）"""
+        digest = hashlib.sha1()
+        for entry in self.entries:
+            digest.update(entry['norm'].encode('utf-8'))
+            if self.has_durations and entry['duration']:
+                digest.update(f"|{entry['duration']:.3f}".encode('utf-8'))
+            digest.update(b'\n')
+        return digest.hexdigest()
+
+    def lookup(self, query, full_query=None, artist=None):
+        """哈希层查找：返回 (条目, 方法, 层级)，未命中时返回 (None, "", None)
+
+        query 为文件标题（已去掉艺术家）的匹配记录，
+        full_query 为 "艺术家 - 标题" 形式的匹配记录（可选），
+        artist 用于在多个同名条目之间消歧。
+        query 带有 'duration' 时，时长超出容差的条目不算命中（文件名相同的现场版与原版等）。
+        """
+        queries = [query] if full_query is None else [query, full_query]
+        duration = query.get('duration')
+
+        # 1. 标题完全相同
+        for q in queries:
+            entry = self.by_title.get(q['title'])
+            if entry is not None and duration_compatible(entry, duration):
+                return entry, "exact", "exact"
+
+        # 2. 核心标题相同
+        for q in queries:
+            entry = self.by_core.get(q['core'])
+            if entry is not None and duration_compatible(entry, duration):
+                return entry, "core", "core"
+
+        # 3. 与去掉艺术家后的核心标题相同
+        candidates = self.by_title_core.get(query['core'])
+        if candidates:
+            candidates = [c for c in candidates if duration_compatible(c, duration)]
+        if candidates:
+            if len(candidates) > 1 and artist:
+                artist_norm = normalize_text(artist)
+                candidates = [
+                    c for c in candidates
+                    if c['artist_part'] and artist_norm and artist_norm in c['artist_part']
+                ]
+            # 同名歌曲无法通过艺术家区分时交给模糊匹配
+            if len(candidates) == 1:
+                return candidates[0], "title_core", "title"
+
+        return None, "", None
+
+    def artist_block(self, artist):
+        """文件艺术家对应的条目下标集合（多位艺术家时取并集），没有对应艺术家时返回空集合"""
+        entry_ids = set()
+        for key in split_artists(artist):
+            entry_ids.update(self.by_artist.get(key, ()))
+        return entry_ids
+
+    def candidates(self, query, top_k=CANDIDATE_TOP_K, within=None):
+        """按共享 gram 数召回前 top_k 个候选条目，按播放列表顺序返回
+
+        within 为条目下标集合时只在其中召回（用于艺术家分组），即使分组不超过 top_k 个条目，
+        也只返回与查询有共享 gram 的条目。
+        """
+        if within is not None:
+            if not top_k:
+                return [self.entries[entry_id] for entry_id in sorted(within)]
+        elif not top_k or top_k >= len(self.entries):
+            return self.entries
+
+        postings = []
+        common = []
+        for gram in text_grams(query['folded']):
+            entry_ids = self.gram_index.get(gram)
+            if entry_ids:
+                if len(entry_ids) > self.max_postings:
+                    common.append(entry_ids)
+                else:
+                    postings.append(entry_ids)
+        # 只有常见 gram 时退回使用它们
+        if not postings:
+            postings = common
+
+        counts = {}
+        for entry_ids in postings:
+            for entry_id in entry_ids:
+                if within is None or entry_id in within:
+                    counts[entry_id] = counts.get(entry_id, 0) + 1
+
+        # 共享 gram 数相同时优先靠前的条目，保证结果与 gram 的遍历顺序无关
+        best = heapq.nlargest(top_k, counts.items(), key=lambda item: (item[1], -item[0]))
+        return [self.entries[entry_id] for entry_id in sorted(entry_id for entry_id, _ in best)]
+
+def decode_id3_text(data):
+    """解码 ID3v2 文本帧（首字节为编码方式），多个值只取第一个"""
+    if not data:
+        return ""
+    encoding, body = data[0], data[1:]
+    if encoding == 1:
+        text = body.decode('utf-16', errors='replace')
+    elif encoding == 2:
+        text = body.decode('utf-16-be', errors='replace')
+    elif encoding == 3:
+        text = body.decode('utf-8', errors='replace')
+    else:
+        text = body.decode('latin-1')
+    return text.split('\x00')[0].strip()
+
+def read_id3_tags(f, offset=0):
+    """读取位于 offset 处的 ID3v2 标签，逐帧读取帧头并跳过封面等无关帧"""
+    f.seek(offset)
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b'ID3':
+        return {}
+
+    version, flags = header[3], header[5]
+    tag_size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+    if version not in (2, 3, 4):
+        return {}
+
+    if version == 2:
+        wanted = {b'TT2': 'title', b'TP1': 'artist'}
+        frame_header_size = 6
+    else:
+        wanted = {b'TIT2': 'title', b'TPE1': 'artist'}
+        frame_header_size = 10
+
+    # 整体不同步标志（v2.3 及更早）会改变帧的字节位置，只能把整个标签读入内存处理
+    if flags & 0x80 and version < 4:
+        data = f.read(min(tag_size, TAG_READ_LIMIT)).replace(b'\xff\x00', b'\xff')
+        reader = lambda pos, size: data[pos:pos + size]
+    else:
+        base = offset + 10
+
+        def reader(pos, size):
+            f.seek(base + pos)
+            return f.read(size)
+
+    pos = 0
+    # 扩展头
+    if flags & 0x40 and version >= 3:
+        size_bytes = reader(0, 4)
+        if len(size_bytes) < 4:
+            return {}
+        if version == 4:
+            pos = (size_bytes[0] << 21) | (size_bytes[1] << 14) | (size_bytes[2] << 7) | size_bytes[3]
+        else:
+            pos = int.from_bytes(size_bytes, 'big') + 4
+
+    tags = {}
+    while pos + frame_header_size <= tag_size and len(tags) < len(wanted):
+        frame_header = reader(pos, frame_header_size)
+        if len(frame_header) < frame_header_size or frame_header[0] == 0:
+            break  # 填充区
+
+        if version == 2:
+            frame_id, frame_size = frame_header[:3], int.from_bytes(frame_header[3:6], 'big')
+        elif version == 4:
+            frame_id = frame_header[:4]
+            s = frame_header[4:8]
+            frame_size = (s[0] << 21) | (s[1] << 14) | (s[2] << 7) | s[3]
+        else:
+            frame_id, frame_size = frame_header[:4], int.from_bytes(frame_header[4:8], 'big')
+
+        pos += frame_header_size
+        key = wanted.get(frame_id)
+        if key and 0 < frame_size <= TAG_READ_LIMIT:
+            payload = reader(pos, frame_size)
+            if version == 4 and frame_header[9] & 0x02:
+                payload = payload.replace(b'\xff\x00', b'\xff')
+            text = decode_id3_text(payload)
+            if text:
+                tags[key] = text
+        pos += frame_size
+
+    return tags
+
+def parse_vorbis_comment(data):
+    """解析 Vorbis comment 数据块（FLAC 和 Ogg 共用）"""
+    tags = {}
+    try:
+        vendor_length = int.from_bytes(data[:4], 'little')
+        pos = 4 + vendor_length
+        count = int.from_bytes(data[pos:pos + 4], 'little')
+        pos += 4
+        for _ in range(count):
+            length = int.from_bytes(data[pos:pos + 4], 'little')
+            pos += 4
+            comment = data[pos:pos + length].decode('utf-8', errors='replace')
+            pos += length
+            if pos > len(data):
+                break
+            name, _, value = comment.partition('=')
+            name = name.upper()
+            if name == 'TITLE' and 'title' not in tags:
+                tags['title'] = value.strip()
+            elif name == 'ARTIST' and 'artist' not in tags:
+                tags['artist'] = value.strip()
+    except (ValueError, IndexError):
+        pass
+    return {key: value for key, value in tags.items() if value}
+
+def read_flac_tags(f):
+    """读取 FLAC 元数据块中的 VORBIS_COMMENT，跳过图片等其他块"""
+    if f.read(4) != b'fLaC':
+        # 部分文件在 FLAC 流前带有 ID3v2 标签
+        f.seek(0)
+        header = f.read(10)
+        if header[:3] != b'ID3':
+            return {}
+        tag_size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+        f.seek(10 + tag_size + (10 if header[5] & 0x10 else 0))
+        if f.read(4) != b'fLaC':
+            return {}
+
+    while True:
+        block_header = f.read(4)
+        if len(block_header) < 4:
+            return {}
+        is_last = block_header[0] & 0x80
+        block_type = block_header[0] & 0x7f
+        length = int.from_bytes(block_header[1:4], 'big')
+        if block_type == 4:
+            return parse_vorbis_comment(f.read(min(length, TAG_READ_LIMIT)))
+        if is_last:
+            return {}
+        f.seek(length, os.SEEK_CUR)
+
+def read_ogg_tags(f):
+    """读取 Ogg 流的第二个数据包（Vorbis/Opus 注释头），只读取开头几个页面"""
+    packets = []
+    packet = b''
+    total = 0
+    while len(packets) < 2 and total < TAG_READ_LIMIT:
+        page_header = f.read(27)
+        if len(page_header) < 27 or page_header[:4] != b'OggS':
+            break
+        segment_count = page_header[26]
+        lacing = f.read(segment_count)
+        body = f.read(sum(lacing))
+        total += 27 + segment_count + len(body)
+
+        pos = 0
+        for segment_size in lacing:
+            packet += body[pos:pos + segment_size]
+            pos += segment_size
+            if segment_size < 255:
+                packets.append(packet)
+                packet = b''
+                if len(packets) == 2:
+                    break
+
+    if len(packets) < 2:
+        return {}
+    comment = packets[1]
+    if comment.startswith(b'\x03vorbis'):
+        return parse_vorbis_comment(comment[7:])
+    if comment.startswith(b'OpusTags'):
+        return parse_vorbis_comment(comment[8:])
+    return {}
+
+def iter_mp4_atoms(f, start, end):
+    """遍历 [start, end) 范围内的 MP4 atom，产生 (类型, 数据起点, 数据终点)，不读取数据内容"""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size = int.from_bytes(header[:4], 'big')
+        atom_type = header[4:8]
+        header_size = 8
+        if size == 1:
+            large = f.read(8)
+            if len(large) < 8:
+                return
+            size = int.from_bytes(large, 'big')
+            header_size = 16
+        elif size == 0:
+            size = end - pos
+        if size < header_size:
+            return
+        yield atom_type, pos + header_size, min(pos + size, end)
+        pos += size
+
+def read_mp4_tags(f):
+    """读取 moov/udta/meta/ilst 中的 ©nam 和 ©ART，mdat 等大块直接跳过"""
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+
+    def find(start, end, atom_type):
+        for child_type, child_start, child_end in iter_mp4_atoms(f, start, end):
+            if child_type == atom_type:
+                return child_start, child_end
+        return None
+
+    moov = find(0, file_size, b'moov')
+    udta = moov and find(moov[0], moov[1], b'udta')
+    meta = udta and find(udta[0], udta[1], b'meta')
+    # meta 是 full box，数据前有 4 字节的版本和标志
+    ilst = meta and find(meta[0] + 4, meta[1], b'ilst')
+    if not ilst:
+        return {}
+
+    wanted = {b'\xa9nam': 'title', b'\xa9ART': 'artist'}
+    tags = {}
+    for item_type, item_start, item_end in iter_mp4_atoms(f, ilst[0], ilst[1]):
+        key = wanted.get(item_type)
+        if not key:
+            continue
+        data = find(item_start, item_end, b'data')
+        if data and data[1] - data[0] <= TAG_READ_LIMIT:
+            f.seek(data[0])
+            # 4 字节类型 + 4 字节区域后为 UTF-8 文本
+            value = f.read(data[1] - data[0])[8:].decode('utf-8', errors='replace').strip()
+            if value:
+                tags[key] = value
+    return tags
+
+def read_wav_tags(f):
+    """读取 RIFF 中 LIST/INFO 的 INAM、IART，或内嵌的 id3 块"""
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+        return {}
+
+    tags = {}
+    pos = 12
+    while True:
+        f.seek(pos)
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            break
+        chunk_id = chunk_header[:4]
+        size = int.from_bytes(chunk_header[4:8], 'little')
+        data_start = pos + 8
+        if chunk_id == b'LIST' and size <= TAG_READ_LIMIT:
+            data = f.read(size)
+            if data[:4] == b'INFO':
+                sub = 4
+                while sub + 8 <= len(data):
+                    sub_id = data[sub:sub + 4]
+                    sub_size = int.from_bytes(data[sub + 4:sub + 8], 'little')
+                    value = data[sub + 8:sub + 8 + sub_size].split(b'\x00')[0]
+                    text = value.decode('utf-8', errors='replace').strip()
+                    if sub_id == b'INAM' and text:
+                        tags.setdefault('title', text)
+                    elif sub_id == b'IART' and text:
+                        tags.setdefault('artist', text)
+                    sub += 8 + sub_size + (sub_size & 1)
+        elif chunk_id in (b'id3 ', b'ID3 '):
+            for key, value in read_id3_tags(f, data_start).items():
+                tags.setdefault(key, value)
+        # 块按偶数字节对齐
+        pos = data_start + size + (size & 1)
+    return tags
+
+TAG_READERS = {
+    '.mp3': read_id3_tags,
+    '.flac': read_flac_tags,
+    '.fla': read_flac_tags,
+    '.ogg': read_ogg_tags,
+    '.m4a': read_mp4_tags,
+    '.wav': read_wav_tags,
+}
+
+def read_embedded_tags(file_path):
+    """只读取文件头部的标签块，返回 {'title', 'artist'} 中存在的项，无法识别时返回空字典"""
+    reader = TAG_READERS.get(os.path.splitext(file_path)[1].lower())
+    if reader is None:
+        return {}
+    try:
+        with open(file_path, 'rb') as f:
+            return reader(f)
+    except (OSError, ValueError, IndexError):
+        return {}
+
+# MP3 帧头的比特率表（kbps），按 (MPEG-1, 层) 和 (MPEG-2/2.5, 层) 索引
+MP3_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# MP3 采样率表，按版本（3: MPEG-1, 2: MPEG-2, 0: MPEG-2.5）索引
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+def skip_id3v2(f, offset=0):
+    """返回 offset 处 ID3v2 标签之后的位置（没有标签时返回 offset）"""
+    f.seek(offset)
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b'ID3':
+        return offset
+    tag_size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+    return offset + 10 + tag_size + (10 if header[5] & 0x10 else 0)
+
+def parse_mp3_frame_header(header):
+    """解析 4 字节 MP3 帧头，返回 (版本, 层, 比特率 kbps, 采样率, 每帧采样数, 声道模式)，无效时返回 None"""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 0x03
+    layer = 4 - ((header[1] >> 1) & 0x03)
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x03
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = MP3_BITRATES[(1 if mpeg1 else 2, layer)][bitrate_index]
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    if layer == 1:
+        samples = 384
+    elif layer == 2 or mpeg1:
+        samples = 1152
+    else:
+        samples = 576
+    return version, layer, bitrate, sample_rate, samples, header[3] >> 6
+
+def read_mp3_duration(f):
+    """MP3 时长：优先读取首帧中的 Xing/Info 或 VBRI 帧数，没有时按首帧比特率估算"""
+    start = skip_id3v2(f)
+    f.seek(start)
+    data = f.read(DURATION_SCAN_LIMIT)
+
+    # 查找第一个有效帧头（要求紧随其后的也是帧头，避免把数据误认为同步字）
+    pos = data.find(b'\xff')
+    frame = None
+    while 0 <= pos < len(data) - 4:
+        frame = parse_mp3_frame_header(data[pos:pos + 4])
+        if frame:
+            version, layer, bitrate, sample_rate, samples, channel_mode = frame
+            padding = (data[pos + 2] >> 1) & 0x01
+            if layer == 1:
+                frame_length = (12 * bitrate * 1000 // sample_rate + padding) * 4
+            else:
+                frame_length = samples // 8 * bitrate * 1000 // sample_rate + padding
+            following = data[pos + frame_length:pos + frame_length + 4]
+            if len(following) < 4 or parse_mp3_frame_header(following):
+                break
+        frame = None
+        pos = data.find(b'\xff', pos + 1)
+    if not frame:
+        return None
+
+    version, layer, bitrate, sample_rate, samples, channel_mode = frame
+    # Xing/Info 头位于边信息之后，VBRI 头固定在帧头后 32 字节处
+    side_info = (32 if channel_mode != 3 else 17) if version == 3 else (17 if channel_mode != 3 else 9)
+    xing = data[pos + 4 + side_info:pos + 4 + side_info + 12]
+    if xing[:4] in (b'Xing', b'Info') and int.from_bytes(xing[4:8], 'big') & 0x01:
+        frames = int.from_bytes(xing[8:12], 'big')
+        return frames * samples / sample_rate if frames else None
+    vbri = data[pos + 36:pos + 36 + 18]
+    if vbri[:4] == b'VBRI':
+        frames = int.from_bytes(vbri[14:18], 'big')
+        return frames * samples / sample_rate if frames else None
+
+    # 固定比特率估算：音频数据字节数 / 比特率（扣除末尾的 ID3v1 标签）
+    f.seek(0, os.SEEK_END)
+    audio_end = f.tell()
+    if audio_end >= 128:
+        f.seek(audio_end - 128)
+        if f.read(3) == b'TAG':
+            audio_end -= 128
+    return (audio_end - start - pos) * 8 / (bitrate * 1000)
+
+def read_flac_duration(f):
+    """FLAC 时长：STREAMINFO 块中的总采样数 / 采样率"""
+    f.seek(skip_id3v2(f))
+    if f.read(4) != b'fLaC':
+        return None
+    block_header = f.read(4)
+    if len(block_header) < 4 or block_header[0] & 0x7f != 0:
+        return None
+    info = f.read(34)
+    if len(info) < 18:
+        return None
+    sample_rate = (info[10] << 12) | (info[11] << 4) | (info[12] >> 4)
+    total_samples = ((info[13] & 0x0f) << 32) | int.from_bytes(info[14:18], 'big')
+    if not sample_rate or not total_samples:
+        return None
+    return total_samples / sample_rate
+
+def read_ogg_duration(f):
+    """Ogg 时长：最后一个页面的 granule position / 采样率（Opus 固定为 48kHz 并扣除 pre-skip）"""
+    header = f.read(27)
+    if len(header) < 27 or header[:4] != b'OggS':
+        return None
+    lacing = f.read(header[26])
+    packet = f.read(min(sum(lacing), 64))
+    if packet.startswith(b'\x01vorbis') and len(packet) >= 16:
+        sample_rate = int.from_bytes(packet[12:16], 'little')
+        pre_skip = 0
+    elif packet.startswith(b'OpusHead') and len(packet) >= 12:
+        sample_rate = 48000
+        pre_skip = int.from_bytes(packet[10:12], 'little')
+    else:
+        return None
+
+    # 从文件末尾向前查找最后一个页面
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+    f.seek(max(0, file_size - DURATION_SCAN_LIMIT))
+    tail = f.read(DURATION_SCAN_LIMIT)
+    pos = tail.rfind(b'OggS')
+    while pos >= 0:
+        granule = tail[pos + 6:pos + 14]
+        if len(granule) == 8 and granule != b'\xff' * 8:
+            samples = int.from_bytes(granule, 'little') - pre_skip
+            return samples / sample_rate if samples > 0 and sample_rate else None
+        pos = tail.rfind(b'OggS', 0, pos)
+    return None
+
+def read_mp4_duration(f):
+    """MP4 时长：moov/mvhd 中的 duration / timescale"""
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+    for atom_type, start, end in iter_mp4_atoms(f, 0, file_size):
+        if atom_type != b'moov':
+            continue
+        for child_type, child_start, child_end in iter_mp4_atoms(f, start, end):
+            if child_type != b'mvhd':
+                continue
+            f.seek(child_start)
+            data = f.read(32)
+            # 版本 1 的时间字段为 64 位
+            if data[:1] == b'\x01':
+                timescale = int.from_bytes(data[20:24], 'big')
+                duration = int.from_bytes(data[24:32], 'big')
+            else:
+                timescale = int.from_bytes(data[12:16], 'big')
+                duration = int.from_bytes(data[16:20], 'big')
+            return duration / timescale if timescale and duration else None
+        return None
+    return None
+
+def read_wav_duration(f):
+    """WAV 时长：data 块大小 / fmt 块中的每秒字节数"""
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+        return None
+
+    byte_rate = None
+    pos = 12
+    while True:
+        f.seek(pos)
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            return None
+        chunk_id = chunk_header[:4]
+        size = int.from_bytes(chunk_header[4:8], 'little')
+        if chunk_id == b'fmt ':
+            fmt = f.read(12)
+            byte_rate = int.from_bytes(fmt[8:12], 'little') if len(fmt) == 12 else None
+        elif chunk_id == b'data':
+            return size / byte_rate if byte_rate else None
+        pos += 8 + size + (size & 1)
+
+DURATION_READERS = {
+    '.mp3': read_mp3_duration,
+    '.flac': read_flac_duration,
+    '.fla': read_flac_duration,
+    '.ogg': read_ogg_duration,
+    '.m4a': read_mp4_duration,
+    '.wav': read_wav_duration,
+}
+
+def read_audio_duration(file_path):
+    """只读取文件头部（Ogg 另读末尾页面）得到时长秒数，不解码音频，无法识别时返回 None"""
+    reader = DURATION_READERS.get(os.path.splitext(file_path)[1].lower())
+    if reader is None:
+        return None
+    try:
+        with open(file_path, 'rb') as f:
+            duration = reader(f)
+    except (OSError, ValueError, IndexError, KeyError, ZeroDivisionError):
+        return None
+    return duration if duration and duration > 0 else None
+
+def file_duration(file_info):
+    """文件时长秒数（第一次使用时读取，结果保存在 file_info['duration']）"""
+    if 'duration' not in file_info:
+        file_info['duration'] = read_audio_duration(file_info['file_path'])
+    return file_info['duration']
+
+def duration_difference(entry, duration):
+    """条目时长与文件时长之差的绝对值，任一方未知时返回 None"""
+    if duration is None or entry.get('duration') is None:
+        return None
+    return abs(entry['duration'] - duration)
+
+def duration_compatible(entry, duration):
+    """时长是否在容差之内（任一方未知时视为兼容）"""
+    difference = duration_difference(entry, duration)
+    if difference is None:
+        return True
+    return difference <= max(DURATION_TOLERANCE_SECONDS, entry['duration'] * DURATION_TOLERANCE_RATIO)
+
+def duration_rank(entry, duration):
+    """同分候选的排序键：时长越接近越靠前，未知时长排在已知之后"""
+    difference = duration_difference(entry, duration)
+    return float('inf') if difference is None else difference
+
+def read_song_metadata(file_path, use_tags=READ_EMBEDDED_TAGS):
+    """从文件名提取元数据-数据处理
+
+    use_tags 为 True 时读取内嵌的标题/艺术家标签，存在时代替从文件名猜测的结果。
+    """
+    filename = os.path.splitext(os.path.basename(file_path))[0]
+
+    # 清理文件名：去除前缀数字和标识
+    clean_filename = re.sub(r'^\d+\s*[-_\.]?\s*', '', filename)  # 数字前缀
+    clean_filename = re.sub(r'\(\s*Not Found\s*\)', '', clean_filename, flags=re.IGNORECASE)  # (Not Found)
+    clean_filename = re.sub(r'\（\s*未找到\s*\）', '', clean_filename)  # (未找到)
+    clean_filename = re.sub(r'\s*\[Not Matched\]', '', clean_filename, flags=re.IGNORECASE)  # [Not Matched]
+
+    # 分离标题和艺术家
+    patterns_to_try = [
+        r'^(.*?)\s*[-~–—]{1,3}\s*(.*?)$',  # 艺术家 - 标题
+        r'^(.*?)\s*[\(（]\s*(.*?)\s*[\)）]$',  # 艺术家 (标题)
+        r'^(.*?)\s{2,}(.*?)$',  # 艺术家    标题
+        r'^(.*?)\s*by\s*(.*?)$',  # 标题 by 艺术家
+        r'^(.*?)\s*-\s*(.*?)$'  # 标题 - 艺术家（备选）
+    ]
+
+    title, artist = clean_filename, None
+
+    for pattern in patterns_to_try:
+        match = re.search(pattern, clean_filename, re.IGNORECASE)
+        if match:
+            groups = match.groups()
+            # 通常第一个为艺术家，第二个为标题
+            if len(groups) >= 2:
+                possible_title = groups[1]
+                if len(possible_title) > 0:  # 确保有意义的标题
+                    title = possible_title.strip()
+                    artist = groups[0].strip()
+                    break
+
+    # 内嵌标签比文件名可靠（如 "01 - Track.flac"），存在时优先使用
+    tags = read_embedded_tags(file_path) if use_tags else {}
+    if tags.get('title'):
+        title = tags['title']
+        artist = tags.get('artist') or artist
+
+    # 返回原始文件名作为标题以便保持文件命名结构
+    return {
+        'file_path': file_path,
+        'original_filename': os.path.basename(file_path),
+        'clean_title': normalize_text(title),
+        'original_title': title,
+        'display_title': filename,  # 用于显示的原文件名
+        'artist': artist,
+        'from_tags': bool(tags.get('title'))
+    }
+
+def method_score(method):
+    """把匹配方法换算为分数"""
+    if not method:
+        return 0.0
+    if method.startswith("相似度:"):
+        return float(method.split(':')[1])
+    if method in ("exact", "core", "title_core"):
         return 1.0
+    if method.startswith("包含核心"):
+        return 0.85
+    if method == "反包含":
+        return 0.8
+    if method == "公共子串":
+        return 0.75
+    return 0.0
+
+def best_fuzzy_match(query, entries, threshold=0.72):
+    """在给定条目中逐条模糊匹配，返回 (标题, 方法, 分数, 位置)
+
+    query 带有 'duration' 时，同分条目中时长最接近的优先。遇到满分时只有在结果不会再变时
+    提前结束：query 没有时长，或该条目的时长与文件完全相同（其他满分条目不可能更接近）。
+    """
+    best_score = 0.0
+    best_match = None
+    match_method = ""
+    match_position = 0
+    duration = query.get('duration')
+    best_rank = None
+
+    for entry in entries:
+        matched_title, method = improved_fuzzy_match(query, entry, threshold)
+        score = method_score(method)
+        if score <= 0:
+            continue
+
+        # 更新最佳匹配
+        rank = duration_rank(entry, duration) if duration is not None else None
+        if score > best_score or (score == best_score and rank is not None and rank < best_rank):
+            best_score = score
+            best_match = matched_title
+            match_method = method
+            match_position = entry['position']
+            best_rank = rank
+            # 满分且不需要按时长比较其他同分条目时，无需继续扫描
+            if best_score >= 1.0 and (duration is None or (duration_compatible(entry, duration) and rank == 0)):
+                break
+
+    return best_match, match_method, best_score, match_position
+
+def fuzzy_choices(query, entries, threshold=0.72, limit=MAX_CHOICES):
+    """在给定条目中逐条模糊匹配，返回分数最高的 limit 个 (分数, 位置, 标题, 方法)"""
+    duration = query.get('duration')
+    choices = []
+    ranks = {}
+    for entry in entries:
+        matched_title, method = improved_fuzzy_match(query, entry, threshold)
+        score = method_score(method)
+        if score > 0:
+            choices.append((score, entry['position'], matched_title, method))
+            ranks[entry['position']] = duration_rank(entry, duration) if duration is not None else 0
+
+    # 同分时时长接近的优先，再按位置靠前，与逐条扫描的选择一致
+    return heapq.nsmallest(limit, choices, key=lambda choice: (-choice[0], ranks[choice[1]], choice[1]))
+
+def lookup_song(file_info, playlist):
+    """哈希层：返回 (结果, 查询记录)
+
+    结果为 {'file_info', 'tier', 'choices', 'recall'}，命中精确/核心匹配时 choices 已填好；
+    查询记录不为 None 表示还需要模糊匹配。
+    """
+    result = {'file_info': file_info, 'tier': None, 'choices': [], 'recall': None}
+
+    primary_title = file_info['clean_title']
+    if not primary_title:
+        return result, None
+
+    query = build_match_record(primary_title)
+    # 播放列表带有时长时读取文件时长，用于过滤候选和同分排序
+    query['duration'] = file_duration(file_info) if playlist.has_durations else None
+    full_query = None
+    if file_info.get('artist'):
+        full_query = build_match_record(normalize_text(f"{file_info['artist']} - {file_info['original_title']}"))
+
+    # 精确/核心匹配 O(1) 查找
+    entry, method, tier = playlist.lookup(query, full_query, file_info.get('artist'))
+    if entry is not None:
+        result['tier'] = tier
+        result['choices'] = [(1.0, entry['position'], entry['title'], method)]
+        return result, None
+
+    return result, query
+
+def rank_candidates(result, query, candidates, playlist, threshold=0.72, max_choices=1, measure_recall=False):
+    """模糊层：在召回的候选条目中打分，填充结果的 choices（以及 recall）
+
+    时长已知时先去掉时长超出容差的候选，再做字符串打分。
+    """
+    result['tier'] = 'fuzzy'
+    full_entries = playlist.entries
+    duration = query.get('duration')
+    if duration is not None:
+        # 候选即为全部条目时，全量扫描与候选使用同一个过滤结果
+        full_scan = candidates is playlist.entries
+        candidates = [entry for entry in candidates if duration_compatible(entry, duration)]
+        if full_scan:
+            full_entries = candidates
+        elif measure_recall:
+            full_entries = [entry for entry in playlist.entries if duration_compatible(entry, duration)]
+    if max_choices > 1:
+        result['choices'] = fuzzy_choices(query, candidates, threshold, max_choices)
+    else:
+        best_match, method, score, position = best_fuzzy_match(query, candidates, threshold)
+        if best_match and score > 0:
+            result['choices'] = [(score, position, best_match, method)]
+
+    if measure_recall and candidates is not full_entries:
+        # 候选结果达到全量扫描的最高分即视为召回成功（同分条目之间只是先后顺序不同）
+        full_score = best_fuzzy_match(query, full_entries, threshold)[2]
+        best_score = result['choices'][0][0] if result['choices'] else 0.0
+        result['recall'] = best_score >= full_score
+
+    return result
+
+def rank_artist_block(result, query, file_info, playlist, threshold=0.72, top_k=CANDIDATE_TOP_K, max_choices=1,
+                      measure_recall=False):
+    """艺术家分组层：文件的艺术家对应播放列表中的艺术家时，先只与分组中共享 gram 最多的
+    ARTIST_BLOCK_TOP_K 个条目模糊匹配（top_k 为 0 时比较整个分组）
+
+    有达到阈值的候选时层级记为 'artist' 并返回 None；否则返回已比较过的条目位置集合
+    （这些条目均未达到阈值，没有对应分组时为空集合），调用方继续全局召回时跳过它们。
+    """
+    if not ARTIST_BLOCKING:
+        return set()
+    block = playlist.artist_block(file_info.get('artist'))
+    if not block:
+        return set()
+
+    candidates = playlist.candidates(query, min(top_k, ARTIST_BLOCK_TOP_K), within=block)
+    rank_candidates(result, query, candidates, playlist, threshold, max_choices, measure_recall)
+    if not result['choices']:
+        result['recall'] = None
+        return {entry['position'] for entry in candidates}
+    result['tier'] = 'artist'
+    return None
+
+def skip_compared(candidates, compared):
+    """去掉艺术家分组层已比较过的条目"""
+    if not compared:
+        return candidates
+    return [entry for entry in candidates if entry['position'] not in compared]
+
+def score_song(file_info, playlist, threshold=0.72, top_k=CANDIDATE_TOP_K, max_choices=1, measure_recall=False):
+    """计算单个文件的候选匹配
+
+    返回 {'file_info', 'tier', 'choices', 'recall'}：choices 为按分数降序的
+    (分数, 位置, 标题, 方法) 列表，max_choices 为 1 时只保留最佳匹配；
+    measure_recall 为 True 时 recall 表示候选召回是否达到全量扫描的最高分。
+    """
+    result, query = lookup_song(file_info, playlist)
+    if query is None:
+        return result
+
+    # 先在文件艺术家的条目中匹配
+    compared = rank_artist_block(result, query, file_info, playlist, threshold, top_k, max_choices, measure_recall)
+    if compared is None:
+        return result
+
+    # 只比较倒排索引召回的候选
+    candidates = skip_compared(playlist.candidates(query, top_k), compared)
+    return rank_candidates(result, query, candidates, playlist, threshold, max_choices, measure_recall)
+
+def encode_gram_vectors(texts, dim=MATRIX_DIM):
+    """把文本编码为哈希 n-gram 向量（每行 L2 归一化），需要 NumPy"""
+    rows = []
+    cols = []
+    for row, text in enumerate(texts):
+        for gram in text_grams(text):
+            # crc32 在各进程间稳定，不受 PYTHONHASHSEED 影响
+            rows.append(row)
+            cols.append(zlib.crc32(gram.encode('utf-8')) % dim)
+
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    np.add.at(vectors, (np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)), 1.0)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class SimilarityMatrix:
+    """批量打分：文件 × 播放列表 的 n-gram 余弦相似度矩阵（需要 NumPy）
+
+    按行分块做矩阵乘法，每块结果不超过 MATRIX_CHUNK_BYTES，内存占用有上限；
+    每个文件取相似度最高的 top_k 个条目，再交给 improved_fuzzy_match 精排。
+    """
+
+    def __init__(self, playlist, dim=MATRIX_DIM):
+        self.playlist = playlist
+        self.dim = dim
+        self.vectors = encode_gram_vectors([entry['folded'] for entry in playlist.entries], dim)
+
+    def candidates(self, queries, top_k=CANDIDATE_TOP_K):
+        """为一批查询记录返回候选条目列表（按播放列表顺序）"""
+        entries = self.playlist.entries
+        if not top_k or top_k >= len(entries):
+            return [entries] * len(queries)
+
+        chunk_rows = max(1, MATRIX_CHUNK_BYTES // (4 * len(entries)))
+        results = []
+        for start in range(0, len(queries), chunk_rows):
+            block = encode_gram_vectors(
+                [query['folded'] for query in queries[start:start + chunk_rows]], self.dim)
+            similarity = block @ self.vectors.T
+            top = np.argpartition(-similarity, top_k - 1, axis=1)[:, :top_k]
+            for row in top:
+                results.append([entries[entry_id] for entry_id in sorted(row.tolist())])
+
+        return results
+
+def score_songs_matrix(file_infos, playlist, threshold=0.72, top_k=CANDIDATE_TOP_K, max_choices=1,
+                       measure_recall=False, progress=None):
+    """批量模式：哈希层之后的剩余文件一次性通过相似度矩阵召回候选，再逐个精排"""
+    results = []
+    pending = []
+    for file_info in file_infos:
+        result, query = lookup_song(file_info, playlist)
+        results.append(result)
+        if query is not None:
+            compared = rank_artist_block(result, query, file_info, playlist, threshold, top_k, max_choices,
+                                         measure_recall)
+            if compared is not None:
+                pending.append((result, query, compared))
+
+    if pending:
+        matrix = SimilarityMatrix(playlist)
+        candidate_lists = matrix.candidates([query for _, query, _ in pending], top_k)
+        done = len(file_infos) - len(pending)
+        for (result, query, compared), candidates in zip(pending, candidate_lists):
+            if progress is not None:
+                progress.check_cancelled()
+                progress.report('match', done, len(file_infos), result['file_info']['display_title'])
+            rank_candidates(result, query, skip_compared(candidates, compared), playlist, threshold, max_choices,
+                            measure_recall)
+            done += 1
+    if progress is not None:
+        progress.report('match', len(file_infos), len(file_infos))
+
+    return results
+
+def init_match_worker(playlist):
+    """进程池初始化：每个工作进程只接收一次预处理好的播放列表"""
+    global _worker_playlist
+    _worker_playlist = playlist
+
+def score_song_chunk(file_infos, threshold, top_k, max_choices, measure_recall):
+    """在工作进程中为一批文件计算候选匹配（结果中不回传 file_info）"""
+    results = []
+    for file_info in file_infos:
+        result = score_song(file_info, _worker_playlist, threshold, top_k, max_choices, measure_recall)
+        del result['file_info']
+        results.append(result)
+    return results
+
+def score_songs_serial(file_infos, playlist, threshold=0.72, top_k=CANDIDATE_TOP_K, max_choices=1,
+                       measure_recall=False, progress=None):
+    """在当前进程中逐个计算候选匹配，每个文件之前报告进度并检查是否已取消"""
+    results = []
+    for file_info in file_infos:
+        if progress is not None:
+            progress.check_cancelled()
+            progress.report('match', len(results), len(file_infos), file_info['display_title'])
+        results.append(score_song(file_info, playlist, threshold, top_k, max_choices, measure_recall))
+    if progress is not None:
+        progress.report('match', len(results), len(file_infos))
+    return results
+
+def score_songs(file_infos, playlist, threshold=0.72, top_k=CANDIDATE_TOP_K, max_choices=1,
+                measure_recall=False, workers=1, backend='index', progress=None):
+    """计算所有文件的候选匹配，返回 (结果列表, 说明文字或 None)
+
+    backend 为 'index' 时用 n-gram 倒排索引召回候选；为 'matrix' 时用 NumPy
+    相似度矩阵批量召回（在当前进程内完成，矩阵乘法本身已利用多核）。
+    workers 大于 1（0 表示全部 CPU 核心）且文件数足够多时，把文件分批交给进程池；
+    结果按原始顺序合并，与串行计算完全一致。
+    progress 为 JobProgress 时报告 'match' 阶段的进度，取消时抛出 JobCancelled。
+    """
+    if backend == 'matrix':
+        if NUMPY_AVAILABLE:
+            results = score_songs_matrix(file_infos, playlist, threshold, top_k, max_choices, measure_recall,
+                                         progress)
+            return results, "使用相似度矩阵批量召回候选"
+        note = "⚠ 未安装 NumPy，相似度矩阵模式不可用，已改用倒排索引"
+    else:
+        note = None
+
+    if workers == 0:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1 or len(file_infos) < PARALLEL_MIN_SONGS:
+        results = score_songs_serial(file_infos, playlist, threshold, top_k, max_choices, measure_recall, progress)
+        return results, note
+
+    # 每个进程分到若干批，兼顾负载均衡和进程间通信开销
+    chunk_size = -(-len(file_infos) // (workers * 4))
+    chunks = [file_infos[i:i + chunk_size] for i in range(0, len(file_infos), chunk_size)]
+    scorer = partial(
+        score_song_chunk, threshold=threshold, top_k=top_k,
+        max_choices=max_choices, measure_recall=measure_recall
+    )
+
+    try:
+        # 统一使用 spawn，避免在带 GUI 线程的进程中 fork
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_match_worker,
+            initargs=(playlist,)
+        ) as executor:
+            chunk_results = []
+            done = 0
+            for chunk, chunk_result in zip(chunks, executor.map(scorer, chunks)):
+                chunk_results.append(chunk_result)
+                done += len(chunk)
+                if progress is not None:
+                    if progress.cancelled():
+                        # 不再等待尚未开始的批次
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        raise JobCancelled()
+                    progress.report('match', done, len(file_infos))
+    except JobCancelled:
+        raise
+    except Exception as e:
+        results = score_songs_serial(file_infos, playlist, threshold, top_k, max_choices, measure_recall, progress)
+        return results, f"⚠ 多进程匹配失败，已改为单进程: {e}"
+
+    results = []
+    for chunk, chunk_result in zip(chunks, chunk_results):
+        for file_info, result in zip(chunk, chunk_result):
+            result['file_info'] = file_info
+            results.append(result)
+
+    return results, f"使用 {workers} 个进程并行匹配（共 {len(chunks)} 批）"
+
+def max_weight_assignment(edges):
+    """稀疏二分图最大权匹配（带势函数的 Dijkstra 最短增广路，即稀疏版匈牙利算法）
+
+    edges[i] 为第 i 个文件的候选列表 [(位置, 分数), ...]，分数在 (0, 1] 之间。
+    每个文件最多分配一个位置、每个位置最多分配一个文件，使总分数最大；
+    返回每个文件分配到的位置，未分配为 None。
+    """
+    # 代价 = 1 - 分数，保证非负；同分时按位置加极小偏置，优先靠前的位置。
+    # 每个文件额外有一个只属于自己的“不分配”选项（代价 1，即分数 0），用负数编号。
+    costs = [
+        [(position, 1.0 - score + position * 1e-9) for position, score in row]
+        for row in edges
+    ]
+    row_potential = [0.0] * len(edges)
+    col_potential = {}
+    col_owner = {}
+    row_col = [None] * len(edges)
+
+    for root in range(len(edges)):
+        dist = {}
+        pred = {}
+        done = set()
+        tree_rows = {root: 0.0}
+        heap = []
+        row, base = root, 0.0
+
+        while True:
+            # 从当前行出发松弛所有候选列（约化代价始终非负）
+            potential = row_potential[row]
+            for col, cost in costs[row] + [(-1 - row, 1.0)]:
+                if col in done:
+                    continue
+                d = base + cost - potential - col_potential.get(col, 0.0)
+                if d < dist.get(col, float('inf')):
+                    dist[col] = d
+                    pred[col] = row
+                    heapq.heappush(heap, (d, col))
+
+            # 取出距离最小的列；若该列空闲则找到增广路
+            while True:
+                d, col = heapq.heappop(heap)
+                if col not in done and d <= dist[col]:
+                    break
+            done.add(col)
+            owner = col_owner.get(col)
+            if owner is None:
+                break
+            row, base = owner, d
+            tree_rows[row] = d
+
+        # 更新势函数，使增广路上的约化代价为 0
+        for tree_row, row_dist in tree_rows.items():
+            row_potential[tree_row] += d - row_dist
+        for done_col in done:
+            col_potential[done_col] = col_potential.get(done_col, 0.0) - (d - dist[done_col])
+
+        # 沿前驱回溯完成增广
+        while True:
+            row = pred[col]
+            previous = row_col[row]
+            row_col[row] = col
+            col_owner[col] = row
+            if row == root:
+                break
+            col = previous
+
+    return [col if col is not None and col >= 0 else None for col in row_col]
+
+def assign_playlist_slots(results):
+    """全局分配：每个播放列表位置最多分配一个文件，使总匹配分数最大
+
+    返回 (每个结果选中的候选下标或 None, 争用位置 {位置: [首选该位置的结果下标, ...]})
+    """
+    edges = [[(choice[1], choice[0]) for choice in result['choices']] for result in results]
+    positions = max_weight_assignment(edges)
+
+    assignment = []
+    for result, position in zip(results, positions):
+        if position is None:
+            assignment.append(None)
+        else:
+            assignment.append(next(i for i, choice in enumerate(result['choices']) if choice[1] == position))
+
+    # 多个文件的最佳候选是同一位置时记为争用
+    top_claims = {}
+    for i, result in enumerate(results):
+        if result['choices']:
+            top_claims.setdefault(result['choices'][0][1], []).append(i)
+    contested = {position: claims for position, claims in top_claims.items() if len(claims) > 1}
+
+    return assignment, contested
+
+class MatchCache:
+    """匹配结果的磁盘缓存（工作目录下的 JSON 文件）
+
+    键为 "文件名|大小|修改时间"，值为该文件单独打分的结果：层级和候选列表
+    （score_song 的输出，每项为 [分数, 位置, 标题, 方法]）。缓存的是与其他文件无关的打分，
+    全局分配每次运行都重新执行，所以争用位置的文件被删除后其他文件仍能得到该位置。
+    整个缓存绑定播放列表指纹和匹配参数，二者变化时全部失效；
+    保存时只写入本次运行中仍存在的文件，已删除文件的条目随之淘汰。
+    """
+
+    # 缓存格式版本，格式改变时旧缓存整体失效
+    FORMAT = 2
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.entries = {}
+        self.decisions = []
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        """读取缓存文件，指纹不一致或文件损坏时视为空缓存"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return self
+
+        if (isinstance(data, dict) and data.get('format') == self.FORMAT
+                and data.get('fingerprint') == self.fingerprint):
+            self.entries = data.get('files', {})
+        return self
+
+    @staticmethod
+    def identity(file_info):
+        """文件的 (大小, 修改时间)，重命名不会改变它们"""
+        identity = file_info.get('identity')
+        if identity is None:
+            stat = os.stat(file_info['file_path'])
+            identity = file_info['identity'] = (stat.st_size, stat.st_mtime_ns)
+        return identity
+
+    @staticmethod
+    def make_key(filename, identity):
+        return f"{filename}|{identity[0]}|{identity[1]}"
+
+    def lookup(self, file_info):
+        """返回缓存的打分结果（格式同 score_song），未命中返回 None"""
+        try:
+            key = self.make_key(library_path(file_info), self.identity(file_info))
+        except OSError:
+            self.misses += 1
+            return None
+
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return {
+            'file_info': file_info,
+            'tier': entry.get('tier'),
+            'choices': [tuple(choice) for choice in entry.get('choices', [])],
+            'recall': None,
+        }
+
+    def remember(self, result):
+        """记录文件的打分结果（score_song 或 lookup 的输出）"""
+        self.decisions.append((result['file_info'], {'tier': result['tier'], 'choices': result['choices']}))
+
+    def save(self):
+        """写入缓存；文件已被重命名时使用新文件名作为键"""
+        files = {}
+        for file_info, entry in self.decisions:
+            filename = library_path(file_info, file_info.get('renamed_to'))
+            try:
+                files[self.make_key(filename, self.identity(file_info))] = entry
+            except OSError:
+                continue
+
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'format': self.FORMAT, 'fingerprint': self.fingerprint, 'files': files}, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+            return True
+        except OSError:
+            return False
+
+def match_songs(songs, playlist, threshold=0.72, top_k=CANDIDATE_TOP_K, measure_recall=False,
+                global_assignment=False, workers=1, backend='index', cache=None, progress=None):
+    """
+    核心匹配逻辑
+
+    playlist 为 PlaylistIndex（也兼容 read_playlist 返回的标题列表）。
+    先通过哈希层解决精确/核心匹配，剩余文件通过 n-gram 倒排索引召回
+    前 top_k 个候选再模糊匹配（top_k 为 0 时逐条扫描整个播放列表）。
+    measure_recall 为 True 时额外执行一次全量扫描，统计候选结果达到全量最高分的比例（召回率）。
+    global_assignment 为 True 时每个文件保留多个候选，通过最大权匹配分配位置，
+    保证每个播放列表位置最多对应一个文件；否则每个文件各自取最佳匹配。
+    workers 为并行匹配的进程数，backend 为候选召回方式（见 score_songs）。
+    cache 为 MatchCache 时直接复用未改动文件的缓存打分，只为新增或改动过的文件打分，
+    并记录全部文件的打分（由调用方在重命名后保存）；位置分配每次都重新计算。
+    progress 为 JobProgress 时报告匹配进度，取消时抛出 JobCancelled。
+    """
+    if not isinstance(playlist, PlaylistIndex):
+        playlist = PlaylistIndex(playlist)
+
+    matched = []  # 存储匹配的信息 (位置, 文件信息)
+    unmatched = []  # 存储未匹配的信息
+    tier_counts = {'exact': 0, 'core': 0, 'title': 0, 'artist': 0, 'fuzzy': 0}
+
+    output = job_output(progress)
+    output.append(f"\n🔍 开始处理 {len(songs)} 首歌曲...\n")
+
+    # 计算每个歌曲文件的候选匹配
+    file_infos = list(songs.values())
+    results = [None] * len(file_infos)
+    pending = []
+    for i, file_info in enumerate(file_infos):
+        cached = cache.lookup(file_info) if cache is not None else None
+        if cached is None:
+            pending.append(i)
+        else:
+            results[i] = cached
+    if cache is not None:
+        output.append(f"匹配缓存: 命中 {len(file_infos) - len(pending)} 个文件，需要重新匹配 {len(pending)} 个")
+
+    max_choices = MAX_CHOICES if global_assignment else 1
+    scored, parallel_note = score_songs(
+        [file_infos[i] for i in pending], playlist, threshold, top_k, max_choices, measure_recall, workers, backend,
+        progress)
+    if parallel_note:
+        output.append(parallel_note)
+    for i, result in zip(pending, scored):
+        results[i] = result
+
+    # 分配播放列表位置
+    if global_assignment:
+        assignment, contested = assign_playlist_slots(results)
+    else:
+        assignment = [0 if result['choices'] else None for result in results]
+        contested = {}
+
+    # 处理匹配结果
+    for result, choice_index in zip(results, assignment):
+        file_info = result['file_info']
+        if cache is not None and file_info['clean_title']:
+            cache.remember(result)
+        if not file_info['clean_title']:
+            unmatched.append(file_info)
+            output.append(f"  ❌ 无法处理: {file_info['display_title']}")
+            continue
+
+        output.append(f"处理: {file_info['display_title'][:50]}...")
+        if choice_index is not None:
+            best_score, match_position, best_match, match_method = result['choices'][choice_index]
+            tier_counts[result['tier']] += 1
+            matched.append({
+                'position': match_position,
+                'method': match_method,
+                'score': best_score,
+                'tier': result['tier'],
+                'file_info': file_info
+            })
+            output.append(f"  ✅ 匹配 ({match_method}) -> 播放列表第 {match_position} 首: '{best_match}'")
+            if choice_index > 0:
+                output.append(f"     (最佳位置已分配给其他文件，使用第 {choice_index + 1} 候选)")
+        elif result['choices']:
+            unmatched.append(file_info)
+            output.append("  ❌ 未匹配 (候选位置均已分配给其他文件)")
+        else:
+            unmatched.append(file_info)
+            output.append("  ❌ 未匹配")
+
+    output.append(
+        f"\n匹配层级统计: 精确 {tier_counts['exact']}, 核心 {tier_counts['core']}, "
+        f"去艺术家核心 {tier_counts['title']}, 艺术家分组 {tier_counts['artist']}, 模糊 {tier_counts['fuzzy']}, "
+        f"未匹配 {len(unmatched)}"
+    )
+
+    recalls = [result['recall'] for result in results if result['recall'] is not None]
+    if recalls:
+        recall_hits = sum(recalls)
+        output.append(
+            f"候选召回率: {recall_hits}/{len(recalls)} ({recall_hits / len(recalls) * 100:.1f}%)，"
+            f"每个文件候选数 top_k={top_k}"
+        )
+
+    if global_assignment:
+        output.append(f"全局分配: {len(contested)} 个播放列表位置被多个文件争用")
+        owners = {
+            result['choices'][choice_index][1]: result
+            for result, choice_index in zip(results, assignment)
+            if choice_index is not None
+        }
+        for position in sorted(contested)[:CONTESTED_REPORT_LIMIT]:
+            owner = owners.get(position)
+            owner_name = owner['file_info']['display_title'][:30] if owner else "无"
+            output.append(f"  第 {position} 首: {len(contested[position])} 个文件争用，分配给 '{owner_name}'")
+        if len(contested) > CONTESTED_REPORT_LIMIT:
+            output.append(f"  ... 其余 {len(contested) - CONTESTED_REPORT_LIMIT} 个争用位置省略")
+
+    return matched, unmatched, "\n".join(output)
+
+def strip_organize_prefix(filename):
+    """去掉整理时添加的三位序号前缀或未匹配标记，推测原始文件名
+
+    只在没有记录原始文件名（如跳过重命名的文件）时使用；重名时添加的 "N_" 无法与
+    原文件名开头的数字（如 "1979_"）区分，因此保留不动。
+    """
+    for prefix in UNMATCHED_PREFIXES:
+        if filename.startswith(prefix):
+            return filename[len(prefix):]
+    return ORGANIZED_PREFIX_PATTERN.sub('', filename, count=1)
+
+def diff_playlists(old_titles, new_titles):
+    """比较两个版本的播放列表
+
+    返回 (位置映射, 新增位置)：位置映射把旧列表中仍然存在的条目位置映射到新位置，
+    新增位置为新列表中没有对应旧条目的位置集合。
+    """
+    old_norms = [normalize_text(title) for title in old_titles]
+    new_norms = [normalize_text(title) for title in new_titles]
+
+    # 列表超过 200 项时 autojunk 会把出现较多的标题当作噪声跳过，这里需要逐条对齐
+    matcher = difflib.SequenceMatcher(None, old_norms, new_norms, autojunk=False)
+    position_map = {}
+    for old_start, new_start, size in matcher.get_matching_blocks():
+        for offset in range(size):
+            position_map[old_start + offset + 1] = new_start + offset + 1
+
+    kept = set(position_map.values())
+    added = {position for position in range(1, len(new_titles) + 1) if position not in kept}
+    return position_map, added
+
+def load_organize_state(path):
+    """读取上次整理的快照，不存在或损坏时返回 None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if (not isinstance(state, dict) or state.get('format') != ORGANIZE_STATE_FORMAT
+            or not isinstance(state.get('files'), dict) or not isinstance(state.get('bases'), dict)):
+        return None
+    return state
+
+def save_organize_state(path, playlist_titles, placements):
+    """保存本次整理的快照
+
+    placements 为 (文件信息, 播放列表位置) 列表，未匹配文件的位置为 None。
+    键与 MatchCache 相同（重命名后的文件名加大小和修改时间），同名文件被替换后不会沿用旧结果。
+    bases 记录每个文件去掉序号和标记后的原始文件名（重命名时使用的 'base_filename'），
+    下次增量整理时据此生成新名称，不必从文件名中解析。
+    """
+    files = {}
+    bases = {}
+    for file_info, position in placements:
+        filename = library_path(file_info, file_info.get('renamed_to'))
+        try:
+            key = MatchCache.make_key(filename, MatchCache.identity(file_info))
+        except OSError:
+            continue
+        files[key] = position
+        bases[key] = file_info.get('base_filename') or strip_organize_prefix(file_info['original_filename'])
+
+    temp_path = path + ".tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'format': ORGANIZE_STATE_FORMAT, 'playlist': playlist_titles, 'files': files, 'bases': bases},
+                      f, ensure_ascii=False)
+        os.replace(temp_path, path)
+        return True
+    except OSError:
+        return False
+
+def plan_incremental(songs, state, playlist_titles):
+    """根据上次的快照划分本次需要处理的文件
+
+    返回 (保留结果, 待匹配文件, 待重试文件, 空闲位置, 新增位置, 输出)：
+    - 保留结果：快照中已匹配且对应条目仍在播放列表中的文件，直接换算到新位置
+    - 待匹配文件：快照中没有的文件（包括名称相同但大小或修改时间变化的文件），以及原条目已被删除的文件
+    - 待重试文件：上次未匹配的文件，只与新增的播放列表条目比较
+    """
+    output = []
+    position_map, added = diff_playlists(state.get('playlist', []), playlist_titles)
+    output.append(f"增量整理: 播放列表保留 {len(position_map)} 首，新增 {len(added)} 首，"
+                  f"删除 {len(state.get('playlist', [])) - len(position_map)} 首")
+
+    kept = []
+    pending = {}
+    retry = {}
+    taken = set()
+    for key, file_info in songs.items():
+        try:
+            state_key = MatchCache.make_key(library_path(file_info), MatchCache.identity(file_info))
+        except OSError:
+            state_key = None
+        if state_key not in state['files']:
+            pending[key] = file_info
+            continue
+
+        file_info['base_filename'] = state['bases'].get(state_key) or strip_organize_prefix(file_info['original_filename'])
+        old_position = state['files'][state_key]
+        if old_position is None:
+            retry[key] = file_info
+        elif old_position in position_map and position_map[old_position] not in taken:
+            position = position_map[old_position]
+            taken.add(position)
+            kept.append({
+                'position': position,
+                'method': "增量保留",
+                'score': 1.0,
+                'tier': 'kept',
+                'file_info': file_info
+            })
+        else:
+            pending[key] = file_info
 
-    # 标准化处理
-    s1 = s1.lower().strip()
-    s2 = s2.lower().strip()
+    free = [position for position in range(1, len(playlist_titles) + 1) if position not in taken]
+    output.append(f"  保留 {len(kept)} 个文件，新文件或需重新匹配 {len(pending)} 个，"
+                  f"未匹配文件待重试 {len(retry)} 个")
+    return kept, pending, retry, free, added, "\n".join(output)
 
-    # 核心部分提取
-    core1 = extract_core_title(s1)
-    core2 = extract_core_title(s2)
+def match_incremental(songs, state, playlist_titles, threshold=0.72, tracks=None, workers=MATCH_WORKERS,
+                      backend=MATCH_BACKEND, progress=None):
+    """增量匹配：只为新文件和新增的播放列表位置运行匹配器
 
-    # 核心匹配检查
-    if core1 and core2:
-        if core1 == core2:
-            return 0.95
+    新文件只与未被保留文件占用的位置比较，上次未匹配的文件只与新增位置比较。
+    tracks 为与 playlist_titles 对应的 playlist.json 歌曲（可选）；workers 和 backend 传给 match_songs。
+    返回值与 match_songs 相同。
+    """
+    kept, pending, retry, free, added, plan_output = plan_incremental(songs, state, playlist_titles)
+    output = job_output(progress)
+    output.append(plan_output)
+    matched = list(kept)
+    unmatched = []
+
+    def match_against(files, positions):
+        if not positions:
+            unmatched.extend(files.values())
+            return
+        playlist = PlaylistIndex([playlist_titles[position - 1] for position in positions], positions=positions,
+                                 tracks=[tracks[position - 1] for position in positions] if tracks else None)
+        new_matched, new_unmatched, match_output = match_songs(
+            files, playlist, threshold=threshold, global_assignment=GLOBAL_ASSIGNMENT,
+            workers=workers, backend=backend, progress=progress)
+        output.append(match_output)
+        matched.extend(new_matched)
+        unmatched.extend(new_unmatched)
+
+    if pending:
+        match_against(pending, free)
+    if retry:
+        claimed = {match_info['position'] for match_info in matched}
+        output.append(f"\n重试上次未匹配的 {len(retry)} 个文件（只比较新增的播放列表条目）")
+        match_against(retry, [position for position in sorted(added) if position not in claimed])
 
-        if core1 in s2 or s1 in s2 or core2 in s1:
-            return 0.85
+    return matched, unmatched, "\n".join(output)
 
-    # 使用Python内建的SequenceMatcher
-    matcher = difflib.SequenceMatcher(None, s1, s2)
-    return matcher.ratio()
+class JobCancelled(Exception):
+    """用户取消了正在运行的任务"""
 
-def improved_fuzzy_match(query, title, threshold=0.72):
-    """改进的模糊匹配算法（降低阈值）"""
-    # ============ 关键修复4：降低匹配阈值 ============
-    adjusted_threshold = max(0.65, threshold)  # 最低降至0.65
+class JobProgress:
+    """后台任务的进度事件、运行记录和取消标志，供 GUI 线程与工作线程之间传递
 
-    query = str(query)
-    title = str(title)
+    report 把进度事件 {'stage', 'done', 'total', 'item'} 放入线程安全的队列 events
+    （total 为 None 表示总数未知），同一阶段按 PROGRESS_INTERVAL 节流。
+    给出 records 队列时运行记录改为逐行输出（见 job_output）：每行以 (级别, 文本) 放入 records，
+    同时写入 log_file（已打开的文本文件，可选）。
+    cancel 可以在任意线程调用；任务只在两个处理项之间检查取消，不会中断进行中的重命名。
+    """
 
-    # 0. 完全匹配
-    if query == title:
-        return (title, "exact")
+    def __init__(self, events=None, interval=PROGRESS_INTERVAL, records=None, log_file=None):
+        self.events = events if events is not None else queue.Queue()
+        self.interval = interval
+        self.records = records
+        self.log_file = log_file
+        self.cancel_event = threading.Event()
+        self.last_report = {}
+
+    def report(self, stage, done, total=None, item=None):
+        now = time.monotonic()
+        last = self.last_report.get(stage)
+        if last is not None and done != total and now - last < self.interval:
+            return
+        self.last_report[stage] = now
+        self.events.put({'stage': stage, 'done': done, 'total': total, 'item': item})
 
-    # 1. 标准化处理
-    q_norm = normalize_text(query)
-    t_norm = normalize_text(title)
+    def log(self, line):
+        """输出一行运行记录"""
+        if self.log_file is not None:
+            self.log_file.write(line + "\n")
+        self.records.put((log_level(line), line))
 
-    # 2. 核心部分匹配
-    q_core = extract_core_title(q_norm)
-    t_core = extract_core_title(t_norm)
+    def cancel(self):
+        self.cancel_event.set()
 
-    if q_core == t_core:
-        return (title, "core")
+    def cancelled(self):
+        return self.cancel_event.is_set()
 
-    # 3. 相互包含检查
-    if q_core in t_norm or q_norm in t_norm:
-        return (title, f"包含核心({q_core}在{title[:20]}中)")
+    def check_cancelled(self):
+        """已取消时抛出 JobCancelled"""
+        if self.cancel_event.is_set():
+            raise JobCancelled()
 
-    if t_core in q_norm:
-        return (title, "反包含")
+class LogOutput(list):
+    """逐行输出的 output 列表：追加的文本按行交给 JobProgress.log，本身不保留内容
 
-    # 4. 相似度匹配
-    similarity_score = advanced_similarity(q_norm, t_norm)
-    if similarity_score >= adjusted_threshold:  # 使用调整后的阈值
-        return (title, f"相似度:{similarity_score:.2f}")
+    因此 "\n".join(output) 为空字符串；嵌套调用返回的空字符串不会输出。
+    """
 
-    # 5. 子序列匹配
-    matcher = difflib.SequenceMatcher(None, q_norm, t_norm)
-    matching_block = matcher.find_longest_match(0, len(q_norm), 0, len(t_norm))
-    if matching_block.size > 0:
-        min_length = min(len(q_norm), len(t_norm)) * 0.5
-        if matching_block.size >= min_length:
-            return (title, "公共子串")
+    def __init__(self, progress):
+        super().__init__()
+        self.progress = progress
 
-    return (None, "")
+    def append(self, text):
+        if text:
+            for line in text.split("\n"):
+                self.progress.log(line)
 
-def read_playlist(playlist_file):
-    """读取播放列表文件并标准化处理"""
-    playlist = []
+    def extend(self, texts):
+        for text in texts:
+            self.append(text)
 
-    try:
-        with open(playlist_file, 'r', encoding='utf-8', errors='replace') as f:
-            for line in f:
-                clean_line = line.strip()
-                if not clean_line:
-                    continue
+def log_level(line):
+    """运行记录的级别：包含 LOG_PROBLEM_MARKERS 时为 'problem'，否则为 'info'"""
+    if any(marker in line for marker in LOG_PROBLEM_MARKERS):
+        return 'problem'
+    return 'info'
 
-                # 匹配多种格式：数字.标题
-                match = re.match(r'^\s*\d+\.\s*(.+)', clean_line)
-                if match:
-                    playlist.append(match.group(1))
-                # 匹配 - 标题格式
-                elif re.match(r'^\s*-', clean_line):
-                    playlist.append(re.sub(r'^\s*-\s*', '', clean_line))
-                # 其他格式直接添加
-                else:
-                    playlist.append(clean_line)
-    except Exception as e:
-        return []
+def job_output(progress):
+    """函数收集输出文字的列表：progress 带有 records 队列时逐行输出，否则为普通列表"""
+    if progress is not None and progress.records is not None:
+        return LogOutput(progress)
+    return []
 
-    # 去除重复项
-    seen = set()
-    unique_playlist = []
-    for title in playlist:
-        norm_title = normalize_text(title)
-        if norm_title and norm_title not in seen:
-            seen.add(norm_title)
-            unique_playlist.append(norm_title)
+class DirectoryLocked(Exception):
+    """目录正被另一个任务（可能属于另一个程序实例）使用，异常信息为持有者的说明"""
 
-    return unique_playlist
+class DirectoryLock:
+    """改动目录中文件的任务持有的目录锁
 
-def read_song_metadata(file_path):
-    """从文件名提取元数据-数据处理"""
-    filename = os.path.splitext(os.path.basename(file_path))[0]
+    打开目录中的 DIRECTORY_LOCK_FILE 并加非阻塞的系统文件锁，再写入持有者的进程号和任务名。
+    文件锁在进程退出时由系统释放，程序崩溃也不会留下失效的锁；锁文件本身保留在目录中。
+    Windows 的文件锁会阻止其他进程读取被锁定的字节，因此只锁定第一个字节，说明从第二个字节开始。
+    """
 
-    # 清理文件名：去除前缀数字和标识
-    clean_filename = re.sub(r'^\d+\s*[-_\.]?\s*', '', filename)  # 数字前缀
-    clean_filename = re.sub(r'\(\s*Not Found\s*\)', '', clean_filename, flags=re.IGNORECASE)  # (Not Found)
-    clean_filename = re.sub(r'\（\s*未找到\s*\）', '', clean_filename)  # (未找到)
-    clean_filename = re.sub(r'\s*\[Not Matched\]', '', clean_filename, flags=re.IGNORECASE)  # [Not Matched]
+    def __init__(self, directory, owner):
+        self.path = os.path.join(directory, DIRECTORY_LOCK_FILE)
+        self.owner = owner
+        self.file = None
 
-    # 分离标题和艺术家
-    patterns_to_try = [
-        r'^(.*?)\s*[-~–—]{1,3}\s*(.*?)$',  # 艺术家 - 标题
-        r'^(.*?)\s*[\(（]\s*(.*?)\s*[\)）]$',  # 艺术家 (标题)
-        r'^(.*?)\s{2,}(.*?)$',  # 艺术家    标题
-        r'^(.*?)\s*by\s*(.*?)$',  # 标题 by 艺术家
-        r'^(.*?)\s*-\s*(.*?)$'  # 标题 - 艺术家（备选）
-    ]
+    def acquire(self):
+        """获取锁，已被占用时抛出 DirectoryLocked，无法创建锁文件时抛出 OSError"""
+        f = open(self.path, 'a+b')
+        try:
+            f.seek(0)
+            if msvcrt is not None:
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.seek(1)
+            holder = f.read().decode('utf-8', 'replace').strip()
+            f.close()
+            raise DirectoryLocked(holder or "未知任务")
+
+        f.truncate(0)
+        f.write(f" 进程 {os.getpid()}: {self.owner}（{time.strftime('%Y-%m-%d %H:%M:%S')} 开始）\n".encode('utf-8'))
+        f.flush()
+        self.file = f
+        return self
+
+    def release(self):
+        if self.file is None:
+            return
+        try:
+            self.file.seek(0)
+            if msvcrt is not None:
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        except OSError:
+            pass
+        self.file.close()
+        self.file = None
 
-    title, artist = clean_filename, None
+def with_directory_lock(directory, owner, func, progress=None):
+    """持有 directory 的目录锁运行 func() 并返回其结果；无法获得锁时不运行，返回说明文字"""
+    lock = DirectoryLock(directory, owner)
+    try:
+        lock.acquire()
+    except DirectoryLocked as e:
+        output = job_output(progress)
+        output.append(f"❌ 目录正被其他任务使用（{e}），请等待其完成后再试")
+        return "\n".join(output)
+    except OSError as e:
+        output = job_output(progress)
+        output.append(f"❌ 无法创建目录锁 {DIRECTORY_LOCK_FILE}: {e}")
+        return "\n".join(output)
 
-    for pattern in patterns_to_try:
-        match = re.search(pattern, clean_filename, re.IGNORECASE)
-        if match:
-            groups = match.groups()
-            # 通常第一个为艺术家，第二个为标题
-            if len(groups) >= 2:
-                possible_title = groups[1]
-                if len(possible_title) > 0:  # 确保有意义的标题
-                    title = possible_title.strip()
-                    artist = groups[0].strip()
+    try:
+        return func()
+    finally:
+        lock.release()
+
+def write_journal(path, journal):
+    """原子地写入重命名日志（先写临时文件并落盘，再替换）"""
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(journal, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def execute_rename_journal(journal_path, journal, progress=None):
+    """按日志执行两阶段重命名：先把所有源文件改为临时名，再把临时名改为目标名
+
+    两阶段使互换和循环（A->B、B->A）也能完成。日志的 phase 记录进度，
+    中断后再次调用会从中断处继续。返回 {操作序号: 错误信息}。
+    progress 为 JobProgress 时报告 'rename'（第一阶段）和 'rename_commit'（第二阶段）的进度。
+    第一阶段中取消时，尚未移动的文件保持原名（错误信息为 RENAME_CANCELLED），
+    已移到临时名的文件照常完成。第二阶段从不覆盖已有文件：目标名仍被未移动
+    （取消或第一阶段失败）的文件占用时恢复原名。
+    """
+    base_dir = os.path.dirname(journal_path)
+    errors = {}
+    ops = journal['ops']
+
+    def path_of(name):
+        return os.path.join(base_dir, name)
+
+    if journal['phase'] == 1:
+        for i, op in enumerate(ops):
+            if progress is not None:
+                if progress.cancelled():
+                    journal['cancelled'] = i
+                    errors.update((j, RENAME_CANCELLED) for j in range(i, len(ops)))
                     break
+                progress.report('rename', i, len(ops), op['src'])
+            # 临时名已存在说明这一步在中断前已经完成
+            if os.path.exists(path_of(op['tmp'])):
+                continue
+            try:
+                os.rename(path_of(op['src']), path_of(op['tmp']))
+            except OSError as e:
+                errors[i] = str(e)
+        journal['phase'] = 2
+        journal['failed'] = sorted(errors)
+        write_journal(journal_path, journal)
+
+    # 取消时第 cancelled 个及之后的操作都未执行
+    cancelled = journal.get('cancelled', len(ops))
+    failed = set(journal.get('failed', []))
+    for i in failed:
+        errors.setdefault(i, RENAME_CANCELLED if i >= cancelled else "移动到临时文件名失败")
+    pending = []
+    for i, op in enumerate(ops):
+        if i in failed:
+            continue
+        if os.path.exists(path_of(op['tmp'])):
+            pending.append(i)
+        elif not os.path.exists(path_of(op['dst'])) and os.path.exists(path_of(op['src'])):
+            # 中断前已经恢复了原名
+            errors[i] = RENAME_CANCELLED if cancelled < len(ops) else f"{op['dst']} 已被占用"
+    # 目标名仍被未移动（第一阶段失败或取消）的文件占用时不能覆盖，这个文件恢复原名；
+    # 恢复原名又会占用其他操作的目标名（互换、循环），所以反复检查直到没有新的受阻操作
+    blocked = set()
+    kept = set()
+    while True:
+        newly = {i for i in pending if i not in blocked
+                 and (ops[i]['dst'] in kept or os.path.exists(path_of(ops[i]['dst'])))}
+        if not newly:
+            break
+        blocked |= newly
+        kept |= {ops[i]['src'] for i in newly}
+    for i in pending:
+        op = ops[i]
+        if progress is not None:
+            progress.report('rename_commit', i, len(ops), op['dst'])
+        target = op['src'] if i in blocked else op['dst']
+        try:
+            if os.path.exists(path_of(target)):
+                raise FileExistsError(f"{target} 已被占用")
+            os.rename(path_of(op['tmp']), path_of(target))
+            if i in blocked:
+                errors[i] = RENAME_CANCELLED if cancelled < len(ops) else f"{op['dst']} 已被占用"
+        except OSError as e:
+            errors[i] = str(e)
+            # 目标名不可用时尽量恢复原文件名，原文件名也被占用时保留临时名
+            try:
+                if i in blocked or os.path.exists(path_of(op['src'])):
+                    raise FileExistsError(op['src'])
+                os.rename(path_of(op['tmp']), path_of(op['src']))
+            except OSError:
+                errors[i] += f"（文件暂存为 {op['tmp']}）"
+    if progress is not None:
+        progress.report('rename_commit', len(ops), len(ops))
+
+    # 更新撤销记录：日志中保存的是全部成功后的记录，失败的操作改回原来的文件名
+    undo_map = journal.get('undo')
+    if undo_map is not None:
+        for i in errors:
+            op = ops[i]
+            undo_map.pop(op['dst'], None)
+            if op['src'] != op['orig']:
+                undo_map[op['src']] = op['orig']
+        undo_path = os.path.join(base_dir, UNDO_JOURNAL_FILE)
+        if undo_map:
+            write_journal(undo_path, undo_map)
+        elif os.path.exists(undo_path):
+            os.remove(undo_path)
+
+    os.remove(journal_path)
+    return errors
+
+def resume_rename_journal(journal_path):
+    """继续执行上次中断的重命名，没有未完成的日志时返回 None"""
+    try:
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            journal = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        return f"\n⚠ 无法读取重命名日志 {RENAME_JOURNAL_FILE}: {e}"
 
-    # 返回原始文件名作为标题以便保持文件命名结构
-    return {
-        'file_path': file_path,
-        'original_filename': os.path.basename(file_path),
-        'clean_title': normalize_text(title),
-        'original_title': title,
-        'display_title': filename,  # 用于显示的原文件名
-        'artist': artist
-    }
+    output = []
+    output.append(f"\n发现未完成的重命名日志，继续执行 {len(journal['ops'])} 个重命名（阶段 {journal['phase']}）")
+    errors = execute_rename_journal(journal_path, journal)
+    for i, op in enumerate(journal['ops']):
+        if i in errors:
+            output.append(f"  ✗ 无法重命名 {op['src']}: {errors[i]}")
+        else:
+            output.append(f"  ✓ {op['src'][:30]} -> {op['dst'][:37]}")
+    output.append(f"\n恢复完成: 重命名 {len(journal['ops']) - len(errors)} 个文件, 失败 {len(errors)} 个")
+    return "\n".join(output)
 
-def match_songs(songs, playlist_titles, threshold=0.72):
-    """
-    核心匹配逻辑
-    """
-    matched = []  # 存储匹配的信息 (位置, 文件信息)
-    unmatched = []  # 存储未匹配的信息
+def load_undo_map(path):
+    """读取撤销记录，不存在或损坏时返回 None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            undo_map = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return undo_map if isinstance(undo_map, dict) else None
 
-    output = []
-    output.append(f"\n🔍 开始处理 {len(songs)} 首歌曲...\n")
+def plan_undo_map(undo_map, ops):
+    """计算所有操作成功后的撤销记录，并在每个操作中记下文件的原始名称
 
-    # 处理每个歌曲文件
-    for file_info in songs.values():
-        primary_title = file_info['clean_title']
-        if not primary_title:
-            unmatched.append(file_info)
-            output.append(f"  ❌ 无法处理: {file_info['display_title']}")
-            continue
+    原始名称沿着多次整理追溯到第一次整理之前，撤销时一步恢复。
+    """
+    for op in ops:
+        op['orig'] = undo_map.get(op['src'], op['src'])
+    moved = {op['src'] for op in ops}
+    planned = {current: original for current, original in undo_map.items() if current not in moved}
+    for op in ops:
+        if op['dst'] != op['orig']:
+            planned[op['dst']] = op['orig']
+    return planned
+
+def directory_names(snapshots, directory):
+    """目录的文件名集合，每个目录只读取一次"""
+    if directory not in snapshots:
+        try:
+            snapshots[directory] = set(os.listdir(directory))
+        except OSError:
+            snapshots[directory] = set()
+    return snapshots[directory]
+
+def journal_op(file_path, new_name, names, base_dir, index):
+    """生成一条重命名操作：路径相对于日志所在目录，临时名从目录快照中选取未占用的名称"""
+    temp_name = unique_target(names, f".organize_{index}.tmp", lambda n: f".organize_{index}_{n}.tmp")
+    names.add(temp_name)
+    source = os.path.relpath(file_path, base_dir)
+    relative_dir = os.path.dirname(source)
+    return {'src': source, 'tmp': os.path.join(relative_dir, temp_name), 'dst': os.path.join(relative_dir, new_name)}
+
+def undo_renames(directory, progress=None):
+    """按撤销记录把整理过的文件一次性恢复为原始文件名，没有撤销记录时返回 None
+
+    progress 为 JobProgress 时报告进度，取消后未恢复的文件保留在撤销记录中。
+    """
+    undo_map = load_undo_map(os.path.join(directory, UNDO_JOURNAL_FILE))
+    if not undo_map:
+        return None
 
-        output.append(f"处理: {file_info['display_title'][:50]}...")
-        best_score = 0.0
-        best_match = None
-        match_method = ""
-        match_position = 0
-
-        # 在播放列表中查找匹配
-        for idx, pl_title in enumerate(playlist_titles):
-            matched_title, method = improved_fuzzy_match(primary_title, pl_title, threshold)
-
-            score = 0.0
-            if method:
-                if method.startswith("相似度:"):
-                    score = float(method.split(':')[1])
-                elif method in ("exact", "core"):
-                    score = 1.0
-                elif method.startswith("包含核心"):
-                    score = 0.85
-                elif method == "反包含":
-                    score = 0.8
-                elif method == "公共子串":
-                    score = 0.75
-
-            # 更新最佳匹配
-            if score > best_score:
-                best_score = score
-                best_match = matched_title
-                match_method = method
-                match_position = idx + 1  # 位置从1开始
-
-        # 处理匹配结果
-        if best_match and best_score > 0:
-            matched.append({
-                'position': match_position,
-                'method': match_method,
-                'file_info': file_info
-            })
-            output.append(f"  ✅ 匹配 ({match_method}) -> 播放列表第 {match_position} 首: '{best_match}'")
+    output = job_output(progress)
+    output.append(f"\n按撤销记录恢复 {len(undo_map)} 个文件的原始文件名")
+
+    # 每个目录读取一次文件列表；已不存在的文件直接从记录中移除
+    snapshots = {}
+    moves = []
+    for current, original in undo_map.items():
+        path = os.path.join(directory, current)
+        names = directory_names(snapshots, os.path.dirname(path))
+        if os.path.basename(current) in names:
+            moves.append((path, current, original))
         else:
-            unmatched.append(file_info)
-            output.append(f"  ❌ 未匹配")
+            output.append(f"  ➖ 已跳过: {current} (文件不存在)")
+
+    # 原始文件名被其他文件占用时不能恢复，这个文件留在原处又可能挡住别的文件，反复检查直到稳定
+    remaining = {}
+    while True:
+        vacated = {(os.path.dirname(path), os.path.basename(path)) for path, _, _ in moves}
+        claimed = set()
+        blocked = []
+        for move in moves:
+            path, current, original = move
+            target = (os.path.dirname(path), os.path.basename(original))
+            if (target[1] in snapshots[target[0]] and target not in vacated) or target in claimed:
+                blocked.append(move)
+            claimed.add(target)
+        if not blocked:
+            break
+        for move in blocked:
+            path, current, original = move
+            output.append(f"  ✗ 无法恢复 {current}: {os.path.basename(original)} 已存在")
+            remaining[current] = original
+            moves.remove(move)
+
+    ops = []
+    for path, current, original in moves:
+        names = snapshots[os.path.dirname(path)]
+        names.discard(os.path.basename(path))
+        names.add(os.path.basename(original))
+    for path, current, original in moves:
+        op = journal_op(path, os.path.basename(original), snapshots[os.path.dirname(path)], directory, len(ops))
+        op['orig'] = original
+        ops.append(op)
+
+    errors = {}
+    if ops:
+        journal_path = os.path.join(directory, RENAME_JOURNAL_FILE)
+        journal = {'phase': 1, 'ops': ops, 'undo': remaining}
+        try:
+            write_journal(journal_path, journal)
+            errors = execute_rename_journal(journal_path, journal, progress)
+        except OSError as e:
+            output.append(f"\n✗ 无法写入重命名日志 {RENAME_JOURNAL_FILE}: {str(e)}")
+            return "\n".join(output)
+    elif not remaining:
+        os.remove(os.path.join(directory, UNDO_JOURNAL_FILE))
+
+    cancelled = sum(1 for error in errors.values() if error == RENAME_CANCELLED)
+    for i, op in enumerate(ops):
+        if errors.get(i) == RENAME_CANCELLED:
+            output.append(f"  ➖ 已取消: {op['src']}")
+        elif i in errors:
+            output.append(f"  ✗ 无法恢复 {op['src']}: {errors[i]}")
+        else:
+            output.append(f"已重命名: {op['src']} -> {op['dst']}")
+    output.append(f"\n恢复完成: 重命名 {len(ops) - len(errors)} 个文件, "
+                  f"失败 {len(errors) - cancelled + len(remaining)} 个")
+    if cancelled:
+        output.append(f"⚠ 任务已取消，{cancelled} 个文件未恢复，再次移除前缀可以继续")
+    return "\n".join(output)
 
-    return matched, unmatched, "\n".join(output)
+def unique_target(directory_names, name, suffixed):
+    """在目录快照中为 name 找到未被占用的文件名，占用时按 suffixed(n) 依次尝试"""
+    if name not in directory_names:
+        return name
+    suffix = 1
+    while suffixed(suffix) in directory_names:
+        suffix += 1
+    return suffixed(suffix)
+
+def rename_files_in_place(matched, unmatched, journal_path=None, progress=None):
+    """在当前目录直接重命名文件
+
+    每个目录只读取一次文件列表，所有目标名和冲突在内存中解决；
+    执行前写入重命名日志（默认位于当前目录），中断后可由 resume_rename_journal 继续。
+    progress 为 JobProgress 时报告进度；取消后未重命名的文件保持原名，
+    其文件信息中的 'rename_cancelled' 为 True。
+    """
+    if journal_path is None:
+        journal_path = os.path.join(os.getcwd(), RENAME_JOURNAL_FILE)
+    base_dir = os.path.dirname(journal_path)
 
-def rename_files_in_place(matched, unmatched):
-    """在当前目录直接重命名文件"""
     # 重命名计数器
     renamed_count = 0
     skipped_count = 0
-    output = []
+    cancelled_count = 0
+    output = job_output(progress)
 
     # ============ 检查重复排序并自动填补空位 ============
     if matched:
@@ -554,6 +3383,9 @@ def rename_files_in_place(matched, unmatched):
         # 检查是否有重复的序号，并重新分配连续序号
         positions = [m['position'] for m in matched]
         unique_positions = sorted(list(set(positions)))
+        duplicate_count = len(positions) - len(unique_positions)
+        if duplicate_count:
+            output.append(f"\n⚠ 发现 {duplicate_count} 个重复序号（多个文件匹配到同一位置）")
 
         # 重新分配连续的序号（从1开始）
         for i, match_info in enumerate(matched):
@@ -562,121 +3394,239 @@ def rename_files_in_place(matched, unmatched):
         output.append(f"\n📋 已重新分配序号，确保连续唯一: 共 {len(matched)} 个文件")
     # ============ 检查结束 ============
 
-    output.append("\n正在处理匹配文件:")
+    # ============ 规划所有重命名 ============
+    # plan 中每一项为 (分组, 文件信息, 目标名)，目标名为 None 表示跳过，跳过原因记录在 notes
+    plan = []
+    notes = {}
     for match_info in matched:
         file_info = match_info['file_info']
-        old_path = file_info['file_path']
-
-        # 提取文件扩展名
-        basename, ext = os.path.splitext(file_info['original_filename'])
-
-        # 新文件名：位置_原始文件名
-        new_name = f"{match_info['position']:03d}_{file_info['original_filename']}"
-        new_path = os.path.join(os.path.dirname(old_path), new_name)
+        position = match_info['position']
 
         # 检查是否已经重命名过
-        if file_info['original_filename'].startswith(f"{match_info['position']:03d}_"):
-            output.append(f"  ⚙ 已处理: {new_name}")
-            skipped_count += 1
+        if file_info['original_filename'].startswith(f"{position:03d}_"):
+            notes[len(plan)] = f"  ⚙ 已处理: {position:03d}_{file_info['original_filename']}"
+            plan.append(('matched', file_info, None))
             continue
 
-        # 检查新文件名是否已存在
-        if os.path.exists(new_path):
-            # 生成唯一后缀
-            suffix = 1
-            while True:
-                temp_name = f"{match_info['position']:03d}_{suffix}_{file_info['original_filename']}"
-                temp_path = os.path.join(os.path.dirname(old_path), temp_name)
-                if not os.path.exists(temp_path):
-                    new_name = temp_name
-                    new_path = temp_path
-                    break
-                suffix += 1
-
-        # 重命名文件
-        try:
-            os.rename(old_path, new_path)
-            output.append(f"  ✓ {file_info['original_filename'][:30]} -> {new_name[:37]}")
-            renamed_count += 1
-        except Exception as e:
-            output.append(f"  ✗ 无法重命名 {file_info['original_filename']}: {str(e)}")
-            skipped_count += 1
+        # 新文件名：位置_原始文件名（增量整理时使用快照中记录的原始文件名，不含旧的序号或未匹配标记）
+        base_name = file_info.get('base_filename', file_info['original_filename'])
+        file_info['base_filename'] = base_name
+        plan.append(('matched', file_info, (f"{position:03d}_{base_name}",
+                                            lambda n, p=position, b=base_name: f"{p:03d}_{n}_{b}")))
 
-    output.append("\n正在处理未匹配文件:")
     for file_info in unmatched:
-        old_path = file_info['file_path']
         old_name = file_info['original_filename']
-        basename, ext = os.path.splitext(old_name)
 
         # 检查是否已有标记
-        unmatched_prefixes = ['(未匹配)', '（未匹配）', '[未匹配]', '（未找到）', '(unmatched)']
-        if any(old_name.startswith(prefix) for prefix in unmatched_prefixes):
-            output.append(f"  ➖ 已跳过: {old_name} (已标记)")
-            skipped_count += 1
+        if any(old_name.startswith(prefix) for prefix in UNMATCHED_PREFIXES):
+            notes[len(plan)] = f"  ➖ 已跳过: {old_name} (已标记)"
+            plan.append(('unmatched', file_info, None))
             continue
 
         # 新文件名：统一使用中文标记
-        new_name = '（未匹配）' + old_name
-        new_path = os.path.join(os.path.dirname(old_path), new_name)
-
-        # 检查新文件名是否已存在
-        if os.path.exists(new_path):
-            # 生成唯一后缀
-            suffix = 1
-            while True:
-                temp_name = f"（未匹配）_{suffix}_{old_name}"
-                temp_path = os.path.join(os.path.dirname(old_path), temp_name)
-                if not os.path.exists(temp_path):
-                    new_name = temp_name
-                    new_path = temp_path
-                    break
-                suffix += 1
-
-        # 重命名文件
+        base_name = file_info.get('base_filename', old_name)
+        file_info['base_filename'] = base_name
+        plan.append(('unmatched', file_info, ('（未匹配）' + base_name,
+                                              lambda n, b=base_name: f"（未匹配）_{n}_{b}")))
+
+    # 每个目录读取一次文件列表；将被移走的源文件名视为空闲，互换和循环重命名无需加后缀
+    snapshots = {}
+    for _, file_info, target in plan:
+        if target is not None:
+            directory_names(snapshots, os.path.dirname(file_info['file_path'])).discard(file_info['original_filename'])
+
+    ops = []
+    op_index = {}
+    for i, (_, file_info, target) in enumerate(plan):
+        if target is None:
+            continue
+        directory = os.path.dirname(file_info['file_path'])
+        names = snapshots[directory]
+        new_name = unique_target(names, *target)
+        names.add(new_name)
+        op_index[i] = len(ops)
+        ops.append(journal_op(file_info['file_path'], new_name, names, base_dir, len(ops)))
+
+    # ============ 写入日志后执行 ============
+    errors = {}
+    if ops:
+        # 日志同时带上执行后的撤销记录，移除前缀时据此恢复原始文件名
+        undo_map = plan_undo_map(load_undo_map(os.path.join(base_dir, UNDO_JOURNAL_FILE)) or {}, ops)
+        journal = {'phase': 1, 'ops': ops, 'undo': undo_map}
         try:
-            os.rename(old_path, new_path)
-            output.append(f"  ⚠ {old_name[:27]} -> {new_name[:37]}")
-            renamed_count += 1
-        except Exception as e:
-            output.append(f"  ✗ 无法重命名 {old_name}: {str(e)}")
+            write_journal(journal_path, journal)
+            errors = execute_rename_journal(journal_path, journal, progress)
+        except OSError as e:
+            output.append(f"\n✗ 无法写入重命名日志 {RENAME_JOURNAL_FILE}: {str(e)}")
+            errors = {i: str(e) for i in range(len(ops))}
+
+    sections = {'matched': [], 'unmatched': []}
+    for i, (group, file_info, _) in enumerate(plan):
+        lines = sections[group]
+        if i in notes:
+            lines.append(notes[i])
+            skipped_count += 1
+            continue
+
+        old_name = file_info['original_filename']
+        new_name = os.path.basename(ops[op_index[i]]['dst'])
+        if errors.get(op_index[i]) == RENAME_CANCELLED:
+            file_info['rename_cancelled'] = True
+            lines.append(f"  ➖ 已取消: {old_name}")
+            cancelled_count += 1
+        elif op_index[i] in errors:
+            lines.append(f"  ✗ 无法重命名 {old_name}: {errors[op_index[i]]}")
             skipped_count += 1
+        elif group == 'matched':
+            file_info['renamed_to'] = new_name
+            lines.append(f"  ✓ {old_name[:30]} -> {new_name[:37]}")
+            renamed_count += 1
+        else:
+            file_info['renamed_to'] = new_name
+            lines.append(f"  ⚠ {old_name[:27]} -> {new_name[:37]}")
+            renamed_count += 1
+
+    output.append("\n正在处理匹配文件:")
+    output.extend(sections['matched'])
+    output.append("\n正在处理未匹配文件:")
+    output.extend(sections['unmatched'])
 
     output.append(f"\n处理完成: 重命名 {renamed_count} 个文件, 跳过 {skipped_count} 个")
+    if cancelled_count:
+        output.append(f"⚠ 任务已取消，{cancelled_count} 个文件未重命名，保持原文件名")
     return "\n".join(output)
 
-def get_valid_songs(directory):
-    """获取指定目录中的所有有效歌曲（支持.fla）"""
+def library_path(file_info, filename=None):
+    """文件相对于扫描根目录的路径（"/" 分隔），用作缓存和快照的键"""
+    filename = filename or file_info['original_filename']
+    relative_dir = file_info.get('relative_dir')
+    return f"{relative_dir}/{filename}" if relative_dir else filename
+
+def glob_matches(name, relative_path, patterns):
+    """名称或相对路径是否匹配任意一个 glob"""
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative_path, pattern) for pattern in patterns)
+
+def scan_audio_files(directory, recursive=SCAN_RECURSIVE, include=SCAN_INCLUDE, exclude=SCAN_EXCLUDE):
+    """基于 os.scandir 逐个产生音频文件 (DirEntry, 相对目录)
+
+    先产生当前目录的文件再进入子目录，不会预先收集整个目录树；
+    无法读取的子目录直接跳过。
+    """
+    pending_dirs = [(directory, '')]
+    while pending_dirs:
+        path, relative_dir = pending_dirs.pop()
+        try:
+            iterator = os.scandir(path)
+        except OSError:
+            continue
+
+        subdirs = []
+        with iterator:
+            for entry in iterator:
+                relative_path = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+                if glob_matches(entry.name, relative_path, exclude):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            subdirs.append((entry.path, relative_path))
+                        continue
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+
+                if os.path.splitext(entry.name.lower())[1] not in SUPPORTED_FORMATS:
+                    continue
+                if include and not glob_matches(entry.name, relative_path, include):
+                    continue
+                yield entry, relative_dir
+
+        # 反向入栈，使子目录按扫描到的顺序处理
+        pending_dirs.extend(reversed(subdirs))
+
+def iter_valid_songs(directory, recursive=SCAN_RECURSIVE, include=SCAN_INCLUDE, exclude=SCAN_EXCLUDE):
+    """逐个产生 (序号, 相对路径, 歌曲信息)，扫描到一个文件就立即处理一个
+
+    读取出错时歌曲信息为对应的异常对象。
+    """
+    for file_count, (entry, relative_dir) in enumerate(scan_audio_files(directory, recursive, include, exclude), 1):
+        relative_path = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+        try:
+            metadata = read_song_metadata(entry.path)
+            metadata['relative_dir'] = relative_dir
+            # 复用扫描时的 stat 信息，匹配缓存不必再次访问文件
+            stat = entry.stat()
+            metadata['identity'] = (stat.st_size, stat.st_mtime_ns)
+            yield file_count, relative_path, metadata
+        except Exception as e:
+            yield file_count, relative_path, e
+
+def get_valid_songs(directory, recursive=SCAN_RECURSIVE, include=SCAN_INCLUDE, exclude=SCAN_EXCLUDE,
+                    progress=None):
+    """获取指定目录中的所有有效歌曲（支持.fla）
+
+    progress 为 JobProgress 时边扫描边报告 'scan' 阶段的进度（扫描结束前总数未知），
+    取消时抛出 JobCancelled。
+    """
     songs = {}
     file_count = 0
 
-    output = []
+    output = job_output(progress)
     output.append("\n扫描音频文件...")
-    for file in os.listdir(directory):
-        if os.path.splitext(file.lower())[1] in SUPPORTED_FORMATS:
-            file_path = os.path.join(directory, file)
-            file_count += 1
+    start_time = time.perf_counter()
+    if progress is not None:
+        progress.report('scan', 0)
+    for file_count, relative_path, metadata in iter_valid_songs(directory, recursive, include, exclude):
+        if progress is not None:
+            progress.check_cancelled()
+            progress.report('scan', file_count, None, relative_path)
+        if isinstance(metadata, Exception):
+            output.append(f"  [{file_count}] ❌ 读取出错: {relative_path} - {str(metadata)}")
+            continue
 
-            try:
-                metadata = read_song_metadata(file_path)
-                key = f"{file_count}_{metadata['clean_title']}"
-                songs[key] = metadata
-                output.append(f"  [{file_count}] {file[:45]}")
-            except Exception as e:
-                output.append(f"  [{file_count}] ❌ 读取出错: {file} - {str(e)}")
+        key = f"{file_count}_{metadata['clean_title']}"
+        songs[key] = metadata
+        output.append(f"  [{file_count}] {relative_path[:45]}")
 
+    elapsed = time.perf_counter() - start_time
+    if progress is not None:
+        progress.report('scan', file_count, file_count)
     output.append(f"发现 {file_count} 个音频文件，有效处理 {len(songs)} 个")
+    tagged = sum(1 for metadata in songs.values() if metadata.get('from_tags'))
+    if tagged:
+        output.append(f"其中 {tagged} 个文件使用内嵌标签中的标题")
+    if file_count:
+        output.append(f"扫描速度: {file_count / max(elapsed, 1e-6):.0f} 个文件/秒（用时 {elapsed:.2f} 秒）")
     return songs, "\n".join(output)
 
-def organize_playlist():
-    """命名排序功能的主函数"""
-    output = []
+def organize_playlist(use_cache=USE_MATCH_CACHE, incremental=INCREMENTAL_ORGANIZE, backend=MATCH_BACKEND,
+                      workers=MATCH_WORKERS, progress=None):
+    """命名排序功能的主函数
+
+    use_cache 为 False 时忽略匹配缓存，所有文件重新匹配。
+    incremental 为 True 时根据上次整理的快照只处理新文件和播放列表的变化部分，
+    没有快照时执行完整整理。
+    backend 为候选召回方式（'index' 或 'matrix'，见 score_songs），workers 为并行匹配的进程数。
+    progress 为 JobProgress 时报告扫描、匹配和重命名的进度；在重命名开始前取消时
+    抛出 JobCancelled（文件均未改动），重命名过程中取消时已完成的重命名保留。
+    progress 带有 records 队列时各阶段的输出逐行写入队列，返回空字符串。
+    整理期间持有当前目录的目录锁，目录正被其他任务整理或移除前缀时不执行。
+    """
+    current_dir = os.getcwd()
+    return with_directory_lock(current_dir, "命名排序",
+                               partial(organize_directory, current_dir, use_cache, incremental, backend, workers, progress),
+                               progress)
+
+def organize_directory(current_dir, use_cache=USE_MATCH_CACHE, incremental=INCREMENTAL_ORGANIZE,
+                       backend=MATCH_BACKEND, workers=MATCH_WORKERS, progress=None):
+    """在 current_dir 中执行命名排序（参数见 organize_playlist，调用方持有目录锁）"""
+    output = job_output(progress)
     
     output.append("\n" + "=" * 60)
     output.append("🎵 本地歌曲匹配工具 (修复乱码版)")
     output.append("=" * 60)
 
-    # 获取当前目录
-    current_dir = os.getcwd()
     output.append(f"工作目录: {current_dir}")
 
     # 检查播放列表
@@ -688,27 +3638,67 @@ def organize_playlist():
         output.append("   2. 可以包含序号（如 '1. 歌曲名' 或 ' - 歌曲名'）")
         return "\n".join(output)
 
+    # 上次的重命名被中断时先完成它，不重新匹配
+    resume_output = resume_rename_journal(os.path.join(current_dir, RENAME_JOURNAL_FILE))
+    if resume_output is not None:
+        output.append(resume_output)
+        output.append("\n请再次运行命名排序以处理新的变化")
+        return "\n".join(output)
+
     # 收集音频文件
-    songs, songs_output = get_valid_songs(current_dir)
+    songs, songs_output = get_valid_songs(current_dir, progress=progress)
     output.append(songs_output)
     
     if not songs:
         output.append("✅ 没有需要处理的音频文件")
         return "\n".join(output)
 
-    # 读取播放列表
-    playlist_titles = read_playlist(playlist_file)
+    # 读取播放列表（优先使用 playlist.json 中的歌曲信息和预计算的匹配键）
+    playlist_tracks, from_sidecar = read_playlist_tracks(playlist_file)
+    playlist_titles = [track['keys']['title'] for track in playlist_tracks]
     if not playlist_titles:
         output.append("\n❌ 错误: 无法从播放列表文件中提取有效的歌曲标题")
         output.append("请检查playlist.txt文件内容")
         return "\n".join(output)
 
     output.append(f"\n播放列表包含 {len(playlist_titles)} 首歌曲")
-
-    # 执行匹配
-    matched, unmatched, match_output = match_songs(songs, playlist_titles, threshold=0.68)  # 降低阈值
+    if from_sidecar:
+        output.append(f"已读取 {os.path.basename(playlist_sidecar_path(playlist_file))} 中的歌曲信息")
+
+    # 读取上次整理的快照
+    state_path = os.path.join(current_dir, ORGANIZE_STATE_FILE)
+    state = load_organize_state(state_path) if incremental else None
+    if incremental and state is None:
+        output.append("未找到上次整理的快照，本次执行完整整理")
+
+    cache = None
+    if state is not None:
+        # 增量匹配（快照已经记录了未改动文件的结果，不再使用匹配缓存）
+        matched, unmatched, match_output = match_incremental(songs, state, playlist_titles, threshold=0.68,
+                                                             tracks=playlist_tracks, workers=workers, backend=backend,
+                                                             progress=progress)
+    else:
+        # 预处理播放列表（每个条目只标准化一次）
+        playlist = PlaylistIndex(playlist_titles, tracks=playlist_tracks)
+
+        # 读取匹配缓存（播放列表或匹配参数变化时自动失效）
+        if use_cache:
+            settings = (f"threshold=0.68;global={GLOBAL_ASSIGNMENT};"
+                        f"duration={DURATION_TOLERANCE_SECONDS},{DURATION_TOLERANCE_RATIO};"
+                        f"artist={ARTIST_BLOCKING},{ARTIST_BLOCK_TOP_K};backend={backend}")
+            fingerprint = hashlib.sha1(f"{playlist.fingerprint()};{settings}".encode('utf-8')).hexdigest()
+            cache = MatchCache(os.path.join(current_dir, MATCH_CACHE_FILE), fingerprint).load()
+
+        # 执行匹配
+        matched, unmatched, match_output = match_songs(
+            songs, playlist, threshold=0.68, global_assignment=GLOBAL_ASSIGNMENT,
+            workers=workers, backend=backend, cache=cache, progress=progress)  # 降低阈值
     output.append(match_output)
 
+    # 记录重命名前的播放列表位置（重命名时序号会被重新分配为连续值）
+    placements = [(match_info['file_info'], match_info['position']) for match_info in matched]
+    placements.extend((file_info, None) for file_info in unmatched)
+
     # 输出统计
     output.append("\n" + "=" * 50)
     output.append("匹配结果统计:")
@@ -721,12 +3711,23 @@ def organize_playlist():
 
     # 在当前目录下直接处理文件
     if matched or unmatched:
-        rename_output = rename_files_in_place(matched, unmatched)
+        rename_output = rename_files_in_place(matched, unmatched, os.path.join(current_dir, RENAME_JOURNAL_FILE),
+                                              progress=progress)
         output.append(rename_output)
         output.append("\n✅ 完成! 文件已直接处理在当前目录")
     else:
         output.append("\n⚠️ 没有文件需要处理")
 
+    # 保存匹配缓存（使用重命名后的文件名）
+    if cache is not None and not cache.save():
+        output.append(f"\n⚠️ 无法写入匹配缓存 {MATCH_CACHE_FILE}")
+
+    # 保存本次整理的快照，供下次增量整理使用（取消时未重命名的文件下次作为新文件处理）
+    placements = [(file_info, position) for file_info, position in placements
+                  if not file_info.get('rename_cancelled')]
+    if not save_organize_state(state_path, playlist_titles, placements):
+        output.append(f"\n⚠️ 无法写入整理快照 {ORGANIZE_STATE_FILE}")
+
     output.append("\n操作说明:")
     output.append(" - 匹配的文件: 开头添加三位数字序号")
     output.append(" - 未匹配文件: 开头添加'（未匹配）'标记")
@@ -736,47 +3737,77 @@ def organize_playlist():
     return "\n".join(output)
 
 # ==================== 移除前缀功能 ====================
-def remove_prefixes_func():
-    """删除所有音乐文件的前缀功能函数"""
+def remove_prefixes_func(progress=None):
+    """删除所有音乐文件的前缀功能函数
+
+    progress 为 JobProgress 时报告 'rename' 阶段的进度；取消后剩余文件保持原名。
+    运行期间持有当前目录的目录锁。
+    """
     current_dir = os.getcwd()
-    output = []
+    return with_directory_lock(current_dir, "移除前缀", partial(remove_prefixes_in, current_dir, progress), progress)
+
+def remove_prefixes_in(current_dir, progress=None):
+    """移除 current_dir 中音乐文件的前缀（调用方持有目录锁）"""
+    output = job_output(progress)
     output.append(f"当前目录: {current_dir}")
 
-    # 遍历当前目录下的所有文件
-    for file in os.listdir(current_dir):
-        if file.endswith(SUPPORTED_FORMATS[:2]):  # 只处理.flac和.mp3文件
-            file_path = os.path.join(current_dir, file)
-
-            # 提取文件名（不包括路径）
-            filename = os.path.basename(file)
-
-            # 删除前缀（包括数字前缀和"(未找到)"前缀）
-            new_filename = re.sub(r'^\d+_', '', filename)  # 删除数字前缀
-            new_filename = re.sub(r'^（未找到）', '', new_filename)  # 删除"(未找到)"前缀
-            new_filename = re.sub(r'^（未匹配）', '', new_filename)  # 删除"(未匹配)"前缀
-            new_filename = re.sub(r'^\(未找到\)', '', new_filename)  # 删除"(未找到)"前缀（英文括号）
-            new_filename = re.sub(r'^_', '', new_filename)  # 删除下划线前缀
-            new_filename = re.sub(r'^-', '', new_filename)  # 删除连字符前缀
-
-            # 如果文件名有变化，则重命名文件
-            if new_filename != filename:
-                new_file_path = os.path.join(current_dir, new_filename)
-                try:
-                    os.rename(file_path, new_file_path)
-                    output.append(f"已重命名: {filename} -> {new_filename}")
-                except Exception as e:
-                    output.append(f"重命名文件时出错 {filename}: {e}")
-            else:
-                output.append(f"无需重命名: {filename}")
-                
+    # 先完成上次被中断的重命名，保证撤销记录完整
+    resume_output = resume_rename_journal(os.path.join(current_dir, RENAME_JOURNAL_FILE))
+    if resume_output is not None:
+        output.append(resume_output)
+
+    # 有撤销记录时直接恢复原始文件名
+    undo_output = undo_renames(current_dir, progress)
+    if undo_output is not None:
+        output.append(undo_output)
+        return "\n".join(output)
+
+    # 没有撤销记录（旧版本整理的目录）时按文件名规则移除前缀
+    output.append("未找到撤销记录，按文件名规则移除前缀")
+    files = [file for file in os.listdir(current_dir) if file.lower().endswith(SUPPORTED_FORMATS)]
+    for index, file in enumerate(files):
+        # 只在两个文件之间响应取消
+        if progress is not None:
+            if progress.cancelled():
+                output.append(f"⚠ 任务已取消，剩余 {len(files) - index} 个文件未处理")
+                break
+            progress.report('rename', index, len(files), file)
+        file_path = os.path.join(current_dir, file)
+
+        # 提取文件名（不包括路径）
+        filename = os.path.basename(file)
+
+        # 只删除整理时添加的序号前缀或未匹配标记，原文件名开头的数字、下划线和连字符保持不变
+        new_filename = ORGANIZED_MARK_PATTERN.sub('', filename, count=1)
+
+        # 如果文件名有变化，则重命名文件
+        if new_filename != filename:
+            new_file_path = os.path.join(current_dir, new_filename)
+            try:
+                os.rename(file_path, new_file_path)
+                output.append(f"已重命名: {filename} -> {new_filename}")
+            except Exception as e:
+                output.append(f"重命名文件时出错 {filename}: {e}")
+        else:
+            output.append(f"无需重命名: {filename}")
+            
     return "\n".join(output)
 
 # ==================== GUI界面 ====================
+def format_eta(seconds):
+    """剩余时间的显示文字"""
+    seconds = int(seconds + 0.5)
+    if seconds < 60:
+        return f"{seconds} 秒"
+    if seconds < 3600:
+        return f"{seconds // 60} 分 {seconds % 60} 秒"
+    return f"{seconds // 3600} 小时 {seconds % 3600 // 60} 分"
+
 class MusicManagerGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("音乐管理工具")
-        self.root.geometry("600x400")
+        self.root.geometry("700x600")
         self.root.resizable(True, True)
 
         # 创建主框架
@@ -787,7 +3818,7 @@ class MusicManagerGUI:
         root.columnconfigure(0, weight=1)
         root.rowconfigure(0, weight=1)
         self.main_frame.columnconfigure(1, weight=1)
-        self.main_frame.rowconfigure(3, weight=1)
+        self.main_frame.rowconfigure(4, weight=1)
 
         # 标题
         title_label = ttk.Label(self.main_frame, text="音乐管理工具", font=("Arial", 16, "bold"))
@@ -810,65 +3841,333 @@ class MusicManagerGUI:
         self.remove_btn = ttk.Button(button_frame, text="移除前缀", command=self.remove_prefixes)
         self.remove_btn.grid(row=0, column=2, padx=5, pady=5, sticky=(tk.W, tk.E))
 
-        # 进度条
-        self.progress = ttk.Progressbar(self.main_frame, mode='indeterminate')
-        self.progress.grid(row=2, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(0, 10))
+        self.sync_btn = ttk.Button(button_frame, text="批量同步歌单", command=self.sync_playlists)
+        self.sync_btn.grid(row=1, column=0, padx=5, pady=5, sticky=(tk.W, tk.E))
+
+        # 勾选后命名排序只处理新文件和播放列表的变化部分
+        self.incremental = tk.BooleanVar(value=INCREMENTAL_ORGANIZE)
+        incremental_check = ttk.Checkbutton(button_frame, text="增量整理", variable=self.incremental)
+        incremental_check.grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
+
+        # 进度条、进度说明和取消按钮
+        progress_frame = ttk.Frame(self.main_frame)
+        progress_frame.grid(row=2, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(0, 10))
+        progress_frame.columnconfigure(0, weight=1)
+
+        self.progress = ttk.Progressbar(progress_frame, mode='determinate')
+        self.progress.grid(row=0, column=0, sticky=(tk.W, tk.E))
+
+        self.cancel_btn = ttk.Button(progress_frame, text="取消", command=self.cancel_job, state=tk.DISABLED)
+        self.cancel_btn.grid(row=0, column=1, padx=(10, 0))
+
+        self.status_var = tk.StringVar(value="就绪")
+        self.status_label = ttk.Label(progress_frame, textvariable=self.status_var)
+        self.status_label.grid(row=1, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
+
+        # 任务队列：任务字典列表（按提交顺序），以及进度条显示的任务
+        self.jobs = []
+        self.job_counter = 0
+        self.focus_job = None
+        self.polling = False
+
+        queue_frame = ttk.LabelFrame(self.main_frame, text="任务队列", padding="10")
+        queue_frame.grid(row=3, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(0, 10))
+        queue_frame.columnconfigure(0, weight=1)
+
+        self.queue_view = ttk.Treeview(queue_frame, columns=('name', 'directory', 'state', 'time'),
+                                       show='headings', height=4)
+        for column, heading, width in (('name', "任务", 90), ('directory', "目录", 250), ('state', "状态", 70),
+                                       ('time', "用时", 180)):
+            self.queue_view.heading(column, text=heading)
+            self.queue_view.column(column, width=width, stretch=(column == 'directory'))
+        self.queue_view.grid(row=0, column=0, sticky=(tk.W, tk.E))
+
+        queue_scroll = ttk.Scrollbar(queue_frame, orient=tk.VERTICAL, command=self.queue_view.yview)
+        queue_scroll.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.queue_view.configure(yscrollcommand=queue_scroll.set)
 
         # 输出文本框
         output_frame = ttk.LabelFrame(self.main_frame, text="运行输出", padding="10")
-        output_frame.grid(row=3, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
+        output_frame.grid(row=4, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
         output_frame.columnconfigure(0, weight=1)
         output_frame.rowconfigure(0, weight=1)
 
         self.output_text = scrolledtext.ScrolledText(output_frame, height=10)
-        self.output_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.output_text.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S))
+
+        self.problems_only = tk.BooleanVar(value=False)
+        problems_check = ttk.Checkbutton(output_frame, text="只显示错误和未匹配", variable=self.problems_only,
+                                         command=self._render_log)
+        problems_check.grid(row=1, column=0, sticky=tk.W, pady=(5, 0))
+
+        self.save_full_log = tk.BooleanVar(value=False)
+        full_log_check = ttk.Checkbutton(output_frame, text=f"保存完整日志 ({FULL_LOG_FILE})",
+                                         variable=self.save_full_log)
+        full_log_check.grid(row=1, column=1, sticky=tk.E, pady=(5, 0))
+
+        # 最近的运行记录 (级别, 文本)，超出 LOG_BUFFER_LINES 的旧记录自动丢弃
+        self.log_lines = deque(maxlen=LOG_BUFFER_LINES)
 
         # 退出按钮
         self.exit_btn = ttk.Button(self.main_frame, text="退出", command=root.quit)
-        self.exit_btn.grid(row=4, column=2, sticky=tk.E, pady=(0, 0))
+        self.exit_btn.grid(row=5, column=2, sticky=tk.E, pady=(0, 0))
 
     def run_function(self, func, *args):
-        """运行功能函数"""
-        try:
-            # 开始进度条
-            self.progress.start()
-
-            # 在新线程中运行函数，避免阻塞GUI
-            thread = threading.Thread(target=self._run_function_thread, args=(func, *args))
-            thread.daemon = True
-            thread.start()
+        """把功能函数加入任务队列
+
+        改动文件的任务在同一目录中按提交顺序逐个运行，只读任务提交后立即运行（见 JOB_TYPES）。
+        """
+        name, mutating = JOB_TYPES.get(func.__name__, (func.__name__, True))
+        self.job_counter += 1
+        job = {
+            'id': str(self.job_counter),
+            'name': name,
+            'func': func,
+            'args': args,
+            'directory': os.getcwd(),
+            'mutating': mutating,
+            'state': 'queued',
+            'submitted': time.monotonic(),
+            'started': None,
+            'finished': None,
+            'progress': None,
+            'stage_started': {}
+        }
+        self.jobs.append(job)
+        self.queue_view.insert('', tk.END, iid=job['id'], values=(name, job['directory'], "", ""))
+        self._update_job_row(job)
+        self._schedule_jobs()
+
+    def _schedule_jobs(self):
+        """启动可以运行的排队任务：同一目录中已有改动文件的任务在运行时，后来的改动任务继续排队"""
+        busy = {job['directory'] for job in self.jobs if job['state'] == 'running' and job['mutating']}
+        for job in self.jobs:
+            if job['state'] != 'queued':
+                continue
+            if job['mutating']:
+                if job['directory'] in busy:
+                    continue
+                busy.add(job['directory'])
+            self._start_job(job)
+        self._update_cancel_button()
 
-        except Exception as e:
-            self.progress.stop()
-            messagebox.showerror("错误", f"运行功能时发生错误:\n{str(e)}")
+    def _start_job(self, job):
+        """在后台线程中运行任务
 
-    def _run_function_thread(self, func, *args):
+        函数通过 JobProgress 的队列发送进度事件和逐行的运行记录，
+        主线程用 after() 定时读取，每次把积累的记录一次性追加到输出框。
+        """
+        log_file = None
+        try:
+            if self.save_full_log.get():
+                log_file = open(FULL_LOG_FILE, 'a', encoding='utf-8')
+                log_file.write(f"\n===== {time.strftime('%Y-%m-%d %H:%M:%S')} 运行 {job['name']} =====\n")
+        except OSError as e:
+            self._append_log([('problem', f"⚠ 无法打开日志文件 {FULL_LOG_FILE}，本次不保存完整日志: {e}")])
+
+        job['progress'] = JobProgress(queue.Queue(), records=queue.Queue(), log_file=log_file)
+        job['state'] = 'running'
+        job['started'] = time.monotonic()
+        self._update_job_row(job)
+        self._append_log([('info', f"运行 {job['name']} 的输出:"), ('info', "=" * 50)])
+
+        # 进度条显示最近启动的任务，收到第一个进度事件之前显示不确定进度
+        self.focus_job = job
+        self.progress.config(mode='indeterminate', value=0)
+        self.progress.start()
+        self.status_var.set(f"{job['name']}: 正在运行...")
+
+        # 在新线程中运行函数，避免阻塞GUI
+        thread = threading.Thread(target=self._run_function_thread, args=(job,))
+        thread.daemon = True
+        thread.start()
+        if not self.polling:
+            self.polling = True
+            self.root.after(PROGRESS_POLL_MS, self._poll_jobs)
+
+    def _run_function_thread(self, job):
         """在后台线程中运行函数"""
+        progress = job['progress']
         try:
             # 运行函数
-            result = func(*args)
+            result = job['func'](*job['args'], progress=progress)
             
             # 在主线程中更新UI
-            self.root.after(0, self._function_finished, func.__name__, result)
+            self.root.after(0, self._function_finished, job, result)
+        except JobCancelled:
+            self.root.after(0, self._function_cancelled, job)
         except Exception as e:
-            self.root.after(0, self._function_error, str(e))
+            self.root.after(0, self._function_error, job, str(e))
+        finally:
+            if progress.log_file is not None:
+                progress.log_file.close()
+
+    def _poll_jobs(self):
+        """读取运行中任务的进度事件（只显示最新的一个）和运行记录，并刷新任务队列中的用时"""
+        for job in self.jobs:
+            if job['state'] == 'running':
+                self._drain_job(job)
+            if job['state'] in ('queued', 'running'):
+                self._update_job_row(job)
+
+        if any(job['state'] in ('queued', 'running') for job in self.jobs):
+            self.root.after(PROGRESS_POLL_MS, self._poll_jobs)
+        else:
+            self.polling = False
 
-    def _function_finished(self, func_name, result):
-        """函数运行完成后的回调"""
-        # 停止进度条
-        self.progress.stop()
-
-        # 显示输出
-        self.output_text.insert(tk.END, f"运行 {func_name} 的输出:\n")
-        self.output_text.insert(tk.END, "=" * 50 + "\n")
-        if result:
-            self.output_text.insert(tk.END, result)
-        self.output_text.insert(tk.END, "=" * 50 + "\n")
+    def _drain_job(self, job):
+        """取出任务队列中积累的进度事件和全部运行记录"""
+        progress = job['progress']
+        event = None
+        try:
+            while True:
+                event = progress.events.get_nowait()
+        except queue.Empty:
+            pass
+        if event is not None and job is self.focus_job and not progress.cancelled():
+            self._show_progress(job, event)
+
+        records = []
+        try:
+            while True:
+                records.append(progress.records.get_nowait())
+        except queue.Empty:
+            pass
+        self._append_log(records)
+
+    def _log_visible(self, level):
+        return level == 'problem' or not self.problems_only.get()
+
+    def _append_log(self, records):
+        """把一批记录加入环形缓冲区，只把最终会保留的部分一次性插入输出框"""
+        if not records:
+            return
+        self.log_lines.extend(records)
+        shown = [text for level, text in records[-LOG_BUFFER_LINES:] if self._log_visible(level)]
+        if not shown:
+            return
+        self.output_text.insert(tk.END, "\n".join(shown) + "\n")
+
+        # 删除超出上限的旧行（最后一行为空行）
+        excess = int(self.output_text.index('end-1c').split('.')[0]) - 1 - LOG_BUFFER_LINES
+        if excess > 0:
+            self.output_text.delete('1.0', f"{excess + 1}.0")
+        self.output_text.see(tk.END)
+
+    def _render_log(self):
+        """切换筛选条件后按缓冲区重新显示"""
+        self.output_text.delete('1.0', tk.END)
+        shown = [text for level, text in self.log_lines if self._log_visible(level)]
+        if shown:
+            self.output_text.insert(tk.END, "\n".join(shown) + "\n")
         self.output_text.see(tk.END)
 
-    def _function_error(self, error_msg):
+    def _show_progress(self, job, event):
+        """更新进度条和进度说明（总数已知时显示百分比和剩余时间）"""
+        stage = event['stage']
+        done = event['done']
+        total = event['total']
+        label = f"{job['name']} - {PROGRESS_STAGES.get(stage, stage)}"
+        now = time.monotonic()
+        started = job['stage_started'].setdefault(stage, (now, done))
+
+        if total is None:
+            if str(self.progress.cget('mode')) != 'indeterminate':
+                self.progress.config(mode='indeterminate')
+                self.progress.start()
+            text = f"{label}: 已处理 {done} 项"
+        else:
+            if str(self.progress.cget('mode')) != 'determinate':
+                self.progress.stop()
+                self.progress.config(mode='determinate')
+            self.progress.config(maximum=max(total, 1), value=done)
+            text = f"{label}: {done}/{total} ({done / max(total, 1) * 100:.0f}%)"
+            elapsed = now - started[0]
+            if done > started[1] and elapsed > 0 and done < total:
+                remaining = (total - done) * elapsed / (done - started[1])
+                text += f"，剩余约 {format_eta(remaining)}"
+
+        if event['item']:
+            text += f"  {event['item'][:40]}"
+        self.status_var.set(text)
+
+    def _update_job_row(self, job):
+        """刷新任务队列中任务的状态和用时"""
+        now = time.monotonic()
+        if job['started'] is None:
+            timing = f"已等待 {(job['finished'] or now) - job['submitted']:.0f} 秒"
+        else:
+            timing = (f"等待 {job['started'] - job['submitted']:.1f} 秒，"
+                      f"运行 {(job['finished'] or now) - job['started']:.1f} 秒")
+        state = JOB_STATES[job['state']]
+        if job['state'] == 'running' and job['progress'].cancelled():
+            state = "正在取消"
+        self.queue_view.item(job['id'], values=(job['name'], job['directory'], state, timing))
+
+    def _update_cancel_button(self):
+        active = any(job['state'] in ('queued', 'running') for job in self.jobs)
+        self.cancel_btn.config(state=tk.NORMAL if active else tk.DISABLED)
+
+    def cancel_job(self):
+        """取消任务队列中选中的任务（未选中时取消进度条显示的任务）
+
+        排队中的任务直接移出队列；运行中的任务在处理完当前项后停止。
+        """
+        selected = [job for job in self.jobs if job['id'] in self.queue_view.selection()]
+        targets = [job for job in selected or [self.focus_job] if job is not None]
+        for job in targets:
+            if job['state'] == 'queued':
+                job['state'] = 'cancelled'
+                job['finished'] = time.monotonic()
+                self._update_job_row(job)
+            elif job['state'] == 'running':
+                job['progress'].cancel()
+                self._update_job_row(job)
+                if job is self.focus_job:
+                    self.status_var.set(f"{job['name']}: 正在取消，当前项完成后停止...")
+        self._schedule_jobs()
+
+    def _finish_job(self, job, state, status, records):
+        """任务结束：输出剩余记录和 records，更新任务队列，进度条改为显示其他运行中的任务，并启动排队的任务"""
+        self._drain_job(job)
+        self._append_log(records + [('info', "=" * 50)])
+        job['state'] = state
+        job['finished'] = time.monotonic()
+        self._update_job_row(job)
+
+        if job is self.focus_job:
+            running = [other for other in self.jobs if other['state'] == 'running']
+            self.focus_job = running[-1] if running else None
+            if self.focus_job is None:
+                self.progress.stop()
+                self.progress.config(mode='determinate', value=0)
+                self.status_var.set(f"{job['name']}: {status}")
+            else:
+                self.status_var.set(f"{self.focus_job['name']}: 正在运行...")
+
+        # 只保留最近的 JOB_HISTORY_LIMIT 个已结束任务
+        finished = [other for other in self.jobs if other['state'] not in ('queued', 'running')]
+        for old in finished[:max(0, len(finished) - JOB_HISTORY_LIMIT)]:
+            self.jobs.remove(old)
+            self.queue_view.delete(old['id'])
+        self._schedule_jobs()
+
+    def _function_cancelled(self, job):
+        """任务在改动任何文件之前被取消"""
+        self._finish_job(job, 'cancelled', "已取消", [('problem', f"⚠ 运行 {job['name']} 已取消，文件未做改动")])
+
+    def _function_finished(self, job, result):
+        """函数运行完成后的回调"""
+        # 函数没有逐行输出时显示返回的文字
+        records = [(log_level(line), line) for line in result.split("\n")] if result else []
+        if job['progress'].cancelled():
+            self._finish_job(job, 'cancelled', "已取消（部分完成）", records)
+        else:
+            self._finish_job(job, 'done', "完成", records)
+
+    def _function_error(self, job, error_msg):
         """函数运行出错的回调"""
-        self.progress.stop()
+        self._finish_job(job, 'failed', "出错", [('problem', f"❌ 运行 {job['name']} 出错: {error_msg}")])
         messagebox.showerror("错误", f"运行功能时发生错误:\n{error_msg}")
 
     def update_playlist(self):
@@ -892,9 +4191,36 @@ class MusicManagerGUI:
         # 运行更新歌单功能，并传递用户输入的链接
         self.run_function(update_playlist, playlist_url)
 
+    def sync_playlists(self):
+        """批量同步歌单 - 输入用户ID，或选择歌单列表文件"""
+        source = simpledialog.askstring(
+            "批量同步歌单",
+            "请输入网易云音乐用户ID（同步到当前目录下以歌单名命名的子目录）\n"
+            "留空则选择歌单列表文件（每行: 歌单ID 目标目录）",
+            parent=self.root
+        )
+        if source is None:
+            return
+
+        source = source.strip()
+        if not source:
+            source = filedialog.askopenfilename(
+                title="选择歌单列表文件",
+                filetypes=[("文本文件", "*.txt"), ("所有文件", "*.*")],
+                parent=self.root
+            )
+            if not source:
+                messagebox.showwarning("取消操作", "未选择歌单列表文件，操作已取消")
+                return
+        elif not source.isdigit():
+            messagebox.showerror("错误", "用户ID应为数字")
+            return
+
+        self.run_function(sync_playlists, source)
+
     def organize_files(self):
         """命名排序"""
-        self.run_function(organize_playlist)
+        self.run_function(organize_playlist, USE_MATCH_CACHE, self.incremental.get())
 
     def remove_prefixes(self):
         """移除前缀"""
@@ -906,4 +4232,6 @@ def main():
     root.mainloop()
 
 if __name__ == "__main__":
+    # 打包后的可执行文件中启动多进程匹配需要先调用 freeze_support
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -1,13 +1,52 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext, simpledialog
+from tkinter import ttk, messagebox, scrolledtext, simpledialog, filedialog
 import sys
 import os
 import threading
+import multiprocessing
+import queue
+import time
+from collections import deque
 
 # 导入功能模块
 import update_playlist
 import organize_playlist
 import remove_prefixes
+from organize_playlist import JobProgress, JobCancelled, log_level
+
+# 读取进度事件队列的间隔（毫秒）
+PROGRESS_POLL_MS = 100
+
+# 进度事件中各阶段的显示名称
+PROGRESS_STAGES = {
+    'scan': "扫描文件",
+    'match': "匹配歌曲",
+    'rename': "重命名文件",
+    'rename_commit': "完成重命名",
+    'playlist': "获取歌单",
+    'sync': "同步歌单",
+}
+
+# 各功能在任务队列中显示的名称，以及是否改动工作目录中的文件
+# （同一目录同时只运行一个改动文件的任务，获取歌单等只读任务可以同时运行）
+JOB_TYPES = {
+    'update_playlist': ("更新歌单", False),
+    'sync_playlists': ("批量同步歌单", False),
+    'organize_playlist': ("命名排序", True),
+    'remove_prefixes_func': ("移除前缀", True),
+}
+
+# 任务状态的显示名称
+JOB_STATES = {'queued': "排队中", 'running': "运行中", 'done': "完成", 'cancelled': "已取消", 'failed': "出错"}
+
+# 任务队列中最多保留的已结束任务数
+JOB_HISTORY_LIMIT = 50
+
+# 运行输出框最多保留的行数（更早的记录只保存在完整日志中）
+LOG_BUFFER_LINES = 5000
+
+# 勾选"保存完整日志"时，运行记录追加写入工作目录下的这个文件
+FULL_LOG_FILE = "music_manager.log"
 
 def get_resource_path(relative_path):
     """获取资源文件的绝对路径，处理PyInstaller打包后的情况"""
@@ -19,11 +58,20 @@ def get_resource_path(relative_path):
     
     return os.path.join(base_path, relative_path)
 
+def format_eta(seconds):
+    """剩余时间的显示文字"""
+    seconds = int(seconds + 0.5)
+    if seconds < 60:
+        return f"{seconds} 秒"
+    if seconds < 3600:
+        return f"{seconds // 60} 分 {seconds % 60} 秒"
+    return f"{seconds // 3600} 小时 {seconds % 3600 // 60} 分"
+
 class MusicManagerGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("音乐管理工具")
-        self.root.geometry("600x400")
+        self.root.geometry("700x600")
         self.root.resizable(True, True)
 
         # 创建主框架
@@ -34,7 +82,7 @@ class MusicManagerGUI:
         root.columnconfigure(0, weight=1)
         root.rowconfigure(0, weight=1)
         self.main_frame.columnconfigure(1, weight=1)
-        self.main_frame.rowconfigure(3, weight=1)
+        self.main_frame.rowconfigure(4, weight=1)
 
         # 标题
         title_label = ttk.Label(self.main_frame, text="音乐管理工具", font=("Arial", 16, "bold"))
@@ -57,65 +105,333 @@ class MusicManagerGUI:
         self.remove_btn = ttk.Button(button_frame, text="移除前缀", command=self.remove_prefixes)
         self.remove_btn.grid(row=0, column=2, padx=5, pady=5, sticky=(tk.W, tk.E))
 
-        # 进度条
-        self.progress = ttk.Progressbar(self.main_frame, mode='indeterminate')
-        self.progress.grid(row=2, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(0, 10))
+        self.sync_btn = ttk.Button(button_frame, text="批量同步歌单", command=self.sync_playlists)
+        self.sync_btn.grid(row=1, column=0, padx=5, pady=5, sticky=(tk.W, tk.E))
+
+        # 勾选后命名排序只处理新文件和播放列表的变化部分
+        self.incremental = tk.BooleanVar(value=organize_playlist.INCREMENTAL_ORGANIZE)
+        incremental_check = ttk.Checkbutton(button_frame, text="增量整理", variable=self.incremental)
+        incremental_check.grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
+
+        # 进度条、进度说明和取消按钮
+        progress_frame = ttk.Frame(self.main_frame)
+        progress_frame.grid(row=2, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(0, 10))
+        progress_frame.columnconfigure(0, weight=1)
+
+        self.progress = ttk.Progressbar(progress_frame, mode='determinate')
+        self.progress.grid(row=0, column=0, sticky=(tk.W, tk.E))
+
+        self.cancel_btn = ttk.Button(progress_frame, text="取消", command=self.cancel_job, state=tk.DISABLED)
+        self.cancel_btn.grid(row=0, column=1, padx=(10, 0))
+
+        self.status_var = tk.StringVar(value="就绪")
+        self.status_label = ttk.Label(progress_frame, textvariable=self.status_var)
+        self.status_label.grid(row=1, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
+
+        # 任务队列：任务字典列表（按提交顺序），以及进度条显示的任务
+        self.jobs = []
+        self.job_counter = 0
+        self.focus_job = None
+        self.polling = False
+
+        queue_frame = ttk.LabelFrame(self.main_frame, text="任务队列", padding="10")
+        queue_frame.grid(row=3, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(0, 10))
+        queue_frame.columnconfigure(0, weight=1)
+
+        self.queue_view = ttk.Treeview(queue_frame, columns=('name', 'directory', 'state', 'time'),
+                                       show='headings', height=4)
+        for column, heading, width in (('name', "任务", 90), ('directory', "目录", 250), ('state', "状态", 70),
+                                       ('time', "用时", 180)):
+            self.queue_view.heading(column, text=heading)
+            self.queue_view.column(column, width=width, stretch=(column == 'directory'))
+        self.queue_view.grid(row=0, column=0, sticky=(tk.W, tk.E))
+
+        queue_scroll = ttk.Scrollbar(queue_frame, orient=tk.VERTICAL, command=self.queue_view.yview)
+        queue_scroll.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.queue_view.configure(yscrollcommand=queue_scroll.set)
 
         # 输出文本框
         output_frame = ttk.LabelFrame(self.main_frame, text="运行输出", padding="10")
-        output_frame.grid(row=3, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
+        output_frame.grid(row=4, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
         output_frame.columnconfigure(0, weight=1)
         output_frame.rowconfigure(0, weight=1)
 
         self.output_text = scrolledtext.ScrolledText(output_frame, height=10)
-        self.output_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.output_text.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S))
+
+        self.problems_only = tk.BooleanVar(value=False)
+        problems_check = ttk.Checkbutton(output_frame, text="只显示错误和未匹配", variable=self.problems_only,
+                                         command=self._render_log)
+        problems_check.grid(row=1, column=0, sticky=tk.W, pady=(5, 0))
+
+        self.save_full_log = tk.BooleanVar(value=False)
+        full_log_check = ttk.Checkbutton(output_frame, text=f"保存完整日志 ({FULL_LOG_FILE})",
+                                         variable=self.save_full_log)
+        full_log_check.grid(row=1, column=1, sticky=tk.E, pady=(5, 0))
+
+        # 最近的运行记录 (级别, 文本)，超出 LOG_BUFFER_LINES 的旧记录自动丢弃
+        self.log_lines = deque(maxlen=LOG_BUFFER_LINES)
 
         # 退出按钮
         self.exit_btn = ttk.Button(self.main_frame, text="退出", command=root.quit)
-        self.exit_btn.grid(row=4, column=2, sticky=tk.E, pady=(0, 0))
+        self.exit_btn.grid(row=5, column=2, sticky=tk.E, pady=(0, 0))
 
     def run_function(self, func, *args):
-        """运行功能函数"""
+        """把功能函数加入任务队列
+
+        改动文件的任务在同一目录中按提交顺序逐个运行，只读任务提交后立即运行（见 JOB_TYPES）。
+        """
+        name, mutating = JOB_TYPES.get(func.__name__, (func.__name__, True))
+        self.job_counter += 1
+        job = {
+            'id': str(self.job_counter),
+            'name': name,
+            'func': func,
+            'args': args,
+            'directory': os.getcwd(),
+            'mutating': mutating,
+            'state': 'queued',
+            'submitted': time.monotonic(),
+            'started': None,
+            'finished': None,
+            'progress': None,
+            'stage_started': {}
+        }
+        self.jobs.append(job)
+        self.queue_view.insert('', tk.END, iid=job['id'], values=(name, job['directory'], "", ""))
+        self._update_job_row(job)
+        self._schedule_jobs()
+
+    def _schedule_jobs(self):
+        """启动可以运行的排队任务：同一目录中已有改动文件的任务在运行时，后来的改动任务继续排队"""
+        busy = {job['directory'] for job in self.jobs if job['state'] == 'running' and job['mutating']}
+        for job in self.jobs:
+            if job['state'] != 'queued':
+                continue
+            if job['mutating']:
+                if job['directory'] in busy:
+                    continue
+                busy.add(job['directory'])
+            self._start_job(job)
+        self._update_cancel_button()
+
+    def _start_job(self, job):
+        """在后台线程中运行任务
+
+        函数通过 JobProgress 的队列发送进度事件和逐行的运行记录，
+        主线程用 after() 定时读取，每次把积累的记录一次性追加到输出框。
+        """
+        log_file = None
         try:
-            # 开始进度条
-            self.progress.start()
+            if self.save_full_log.get():
+                log_file = open(FULL_LOG_FILE, 'a', encoding='utf-8')
+                log_file.write(f"\n===== {time.strftime('%Y-%m-%d %H:%M:%S')} 运行 {job['name']} =====\n")
+        except OSError as e:
+            self._append_log([('problem', f"⚠ 无法打开日志文件 {FULL_LOG_FILE}，本次不保存完整日志: {e}")])
 
-            # 在新线程中运行函数，避免阻塞GUI
-            thread = threading.Thread(target=self._run_function_thread, args=(func, *args))
-            thread.daemon = True
-            thread.start()
+        job['progress'] = JobProgress(queue.Queue(), records=queue.Queue(), log_file=log_file)
+        job['state'] = 'running'
+        job['started'] = time.monotonic()
+        self._update_job_row(job)
+        self._append_log([('info', f"运行 {job['name']} 的输出:"), ('info', "=" * 50)])
 
-        except Exception as e:
-            self.progress.stop()
-            messagebox.showerror("错误", f"运行功能时发生错误:\n{str(e)}")
+        # 进度条显示最近启动的任务，收到第一个进度事件之前显示不确定进度
+        self.focus_job = job
+        self.progress.config(mode='indeterminate', value=0)
+        self.progress.start()
+        self.status_var.set(f"{job['name']}: 正在运行...")
 
-    def _run_function_thread(self, func, *args):
+        # 在新线程中运行函数，避免阻塞GUI
+        thread = threading.Thread(target=self._run_function_thread, args=(job,))
+        thread.daemon = True
+        thread.start()
+        if not self.polling:
+            self.polling = True
+            self.root.after(PROGRESS_POLL_MS, self._poll_jobs)
+
+    def _run_function_thread(self, job):
         """在后台线程中运行函数"""
+        progress = job['progress']
         try:
             # 运行函数
-            result = func(*args)
+            result = job['func'](*job['args'], progress=progress)
             
             # 在主线程中更新UI
-            self.root.after(0, self._function_finished, func.__name__, result)
+            self.root.after(0, self._function_finished, job, result)
+        except JobCancelled:
+            self.root.after(0, self._function_cancelled, job)
         except Exception as e:
-            self.root.after(0, self._function_error, str(e))
+            self.root.after(0, self._function_error, job, str(e))
+        finally:
+            if progress.log_file is not None:
+                progress.log_file.close()
 
-    def _function_finished(self, func_name, result):
-        """函数运行完成后的回调"""
-        # 停止进度条
-        self.progress.stop()
-
-        # 显示输出
-        self.output_text.insert(tk.END, f"运行 {func_name} 的输出:\n")
-        self.output_text.insert(tk.END, "=" * 50 + "\n")
-        if result:
-            self.output_text.insert(tk.END, result)
-        self.output_text.insert(tk.END, "=" * 50 + "\n")
+    def _poll_jobs(self):
+        """读取运行中任务的进度事件（只显示最新的一个）和运行记录，并刷新任务队列中的用时"""
+        for job in self.jobs:
+            if job['state'] == 'running':
+                self._drain_job(job)
+            if job['state'] in ('queued', 'running'):
+                self._update_job_row(job)
+
+        if any(job['state'] in ('queued', 'running') for job in self.jobs):
+            self.root.after(PROGRESS_POLL_MS, self._poll_jobs)
+        else:
+            self.polling = False
+
+    def _drain_job(self, job):
+        """取出任务队列中积累的进度事件和全部运行记录"""
+        progress = job['progress']
+        event = None
+        try:
+            while True:
+                event = progress.events.get_nowait()
+        except queue.Empty:
+            pass
+        if event is not None and job is self.focus_job and not progress.cancelled():
+            self._show_progress(job, event)
+
+        records = []
+        try:
+            while True:
+                records.append(progress.records.get_nowait())
+        except queue.Empty:
+            pass
+        self._append_log(records)
+
+    def _log_visible(self, level):
+        return level == 'problem' or not self.problems_only.get()
+
+    def _append_log(self, records):
+        """把一批记录加入环形缓冲区，只把最终会保留的部分一次性插入输出框"""
+        if not records:
+            return
+        self.log_lines.extend(records)
+        shown = [text for level, text in records[-LOG_BUFFER_LINES:] if self._log_visible(level)]
+        if not shown:
+            return
+        self.output_text.insert(tk.END, "\n".join(shown) + "\n")
+
+        # 删除超出上限的旧行（最后一行为空行）
+        excess = int(self.output_text.index('end-1c').split('.')[0]) - 1 - LOG_BUFFER_LINES
+        if excess > 0:
+            self.output_text.delete('1.0', f"{excess + 1}.0")
         self.output_text.see(tk.END)
 
-    def _function_error(self, error_msg):
+    def _render_log(self):
+        """切换筛选条件后按缓冲区重新显示"""
+        self.output_text.delete('1.0', tk.END)
+        shown = [text for level, text in self.log_lines if self._log_visible(level)]
+        if shown:
+            self.output_text.insert(tk.END, "\n".join(shown) + "\n")
+        self.output_text.see(tk.END)
+
+    def _show_progress(self, job, event):
+        """更新进度条和进度说明（总数已知时显示百分比和剩余时间）"""
+        stage = event['stage']
+        done = event['done']
+        total = event['total']
+        label = f"{job['name']} - {PROGRESS_STAGES.get(stage, stage)}"
+        now = time.monotonic()
+        started = job['stage_started'].setdefault(stage, (now, done))
+
+        if total is None:
+            if str(self.progress.cget('mode')) != 'indeterminate':
+                self.progress.config(mode='indeterminate')
+                self.progress.start()
+            text = f"{label}: 已处理 {done} 项"
+        else:
+            if str(self.progress.cget('mode')) != 'determinate':
+                self.progress.stop()
+                self.progress.config(mode='determinate')
+            self.progress.config(maximum=max(total, 1), value=done)
+            text = f"{label}: {done}/{total} ({done / max(total, 1) * 100:.0f}%)"
+            elapsed = now - started[0]
+            if done > started[1] and elapsed > 0 and done < total:
+                remaining = (total - done) * elapsed / (done - started[1])
+                text += f"，剩余约 {format_eta(remaining)}"
+
+        if event['item']:
+            text += f"  {event['item'][:40]}"
+        self.status_var.set(text)
+
+    def _update_job_row(self, job):
+        """刷新任务队列中任务的状态和用时"""
+        now = time.monotonic()
+        if job['started'] is None:
+            timing = f"已等待 {(job['finished'] or now) - job['submitted']:.0f} 秒"
+        else:
+            timing = (f"等待 {job['started'] - job['submitted']:.1f} 秒，"
+                      f"运行 {(job['finished'] or now) - job['started']:.1f} 秒")
+        state = JOB_STATES[job['state']]
+        if job['state'] == 'running' and job['progress'].cancelled():
+            state = "正在取消"
+        self.queue_view.item(job['id'], values=(job['name'], job['directory'], state, timing))
+
+    def _update_cancel_button(self):
+        active = any(job['state'] in ('queued', 'running') for job in self.jobs)
+        self.cancel_btn.config(state=tk.NORMAL if active else tk.DISABLED)
+
+    def cancel_job(self):
+        """取消任务队列中选中的任务（未选中时取消进度条显示的任务）
+
+        排队中的任务直接移出队列；运行中的任务在处理完当前项后停止。
+        """
+        selected = [job for job in self.jobs if job['id'] in self.queue_view.selection()]
+        targets = [job for job in selected or [self.focus_job] if job is not None]
+        for job in targets:
+            if job['state'] == 'queued':
+                job['state'] = 'cancelled'
+                job['finished'] = time.monotonic()
+                self._update_job_row(job)
+            elif job['state'] == 'running':
+                job['progress'].cancel()
+                self._update_job_row(job)
+                if job is self.focus_job:
+                    self.status_var.set(f"{job['name']}: 正在取消，当前项完成后停止...")
+        self._schedule_jobs()
+
+    def _finish_job(self, job, state, status, records):
+        """任务结束：输出剩余记录和 records，更新任务队列，进度条改为显示其他运行中的任务，并启动排队的任务"""
+        self._drain_job(job)
+        self._append_log(records + [('info', "=" * 50)])
+        job['state'] = state
+        job['finished'] = time.monotonic()
+        self._update_job_row(job)
+
+        if job is self.focus_job:
+            running = [other for other in self.jobs if other['state'] == 'running']
+            self.focus_job = running[-1] if running else None
+            if self.focus_job is None:
+                self.progress.stop()
+                self.progress.config(mode='determinate', value=0)
+                self.status_var.set(f"{job['name']}: {status}")
+            else:
+                self.status_var.set(f"{self.focus_job['name']}: 正在运行...")
+
+        # 只保留最近的 JOB_HISTORY_LIMIT 个已结束任务
+        finished = [other for other in self.jobs if other['state'] not in ('queued', 'running')]
+        for old in finished[:max(0, len(finished) - JOB_HISTORY_LIMIT)]:
+            self.jobs.remove(old)
+            self.queue_view.delete(old['id'])
+        self._schedule_jobs()
+
+    def _function_cancelled(self, job):
+        """任务在改动任何文件之前被取消"""
+        self._finish_job(job, 'cancelled', "已取消", [('problem', f"⚠ 运行 {job['name']} 已取消，文件未做改动")])
+
+    def _function_finished(self, job, result):
+        """函数运行完成后的回调"""
+        # 函数没有逐行输出时显示返回的文字
+        records = [(log_level(line), line) for line in result.split("\n")] if result else []
+        if job['progress'].cancelled():
+            self._finish_job(job, 'cancelled', "已取消（部分完成）", records)
+        else:
+            self._finish_job(job, 'done', "完成", records)
+
+    def _function_error(self, job, error_msg):
         """函数运行出错的回调"""
-        self.progress.stop()
+        self._finish_job(job, 'failed', "出错", [('problem', f"❌ 运行 {job['name']} 出错: {error_msg}")])
         messagebox.showerror("错误", f"运行功能时发生错误:\n{error_msg}")
 
     def update_playlist(self):
@@ -139,9 +455,36 @@ class MusicManagerGUI:
         # 运行更新歌单功能，并传递用户输入的链接
         self.run_function(update_playlist.update_playlist, playlist_url)
 
+    def sync_playlists(self):
+        """批量同步歌单 - 输入用户ID，或选择歌单列表文件"""
+        source = simpledialog.askstring(
+            "批量同步歌单",
+            "请输入网易云音乐用户ID（同步到当前目录下以歌单名命名的子目录）\n"
+            "留空则选择歌单列表文件（每行: 歌单ID 目标目录）",
+            parent=self.root
+        )
+        if source is None:
+            return
+
+        source = source.strip()
+        if not source:
+            source = filedialog.askopenfilename(
+                title="选择歌单列表文件",
+                filetypes=[("文本文件", "*.txt"), ("所有文件", "*.*")],
+                parent=self.root
+            )
+            if not source:
+                messagebox.showwarning("取消操作", "未选择歌单列表文件，操作已取消")
+                return
+        elif not source.isdigit():
+            messagebox.showerror("错误", "用户ID应为数字")
+            return
+
+        self.run_function(update_playlist.sync_playlists, source)
+
     def organize_files(self):
         """命名排序"""
-        self.run_function(organize_playlist.organize_playlist)
+        self.run_function(organize_playlist.organize_playlist, organize_playlist.USE_MATCH_CACHE, self.incremental.get())
 
     def remove_prefixes(self):
         """移除前缀"""
@@ -153,4 +496,6 @@ def main():
     root.mainloop()
 
 if __name__ == "__main__":
+    # 打包后的可执行文件中启动多进程匹配需要先调用 freeze_support
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
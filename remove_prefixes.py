@@ -1,9 +1,13 @@
 import os
-import re
 import sys
 from io import StringIO
 import contextlib
 
+from functools import partial
+
+from organize_playlist import (ORGANIZED_MARK_PATTERN, RENAME_JOURNAL_FILE, resume_rename_journal,
+                               undo_renames, job_output, with_directory_lock)
+
 # 安全设置标准输出编码为UTF-8
 try:
     if sys.stdout:
@@ -12,41 +16,62 @@ except:
     pass
 
 # 支持的音频文件扩展名
-SUPPORTED_FORMATS = ('.flac', '.mp3')
+SUPPORTED_FORMATS = ('.flac', '.mp3', '.m4a', '.wav', '.ogg', '.fla')
+
+def remove_prefixes_func(progress=None):
+    """删除所有音乐文件的前缀功能函数
 
-def remove_prefixes_func():
-    """删除所有音乐文件的前缀功能函数"""
+    progress 为 JobProgress 时报告 'rename' 阶段的进度；取消后剩余文件保持原名。
+    运行期间持有当前目录的目录锁。
+    """
     current_dir = os.getcwd()
-    output = []
+    return with_directory_lock(current_dir, "移除前缀", partial(remove_prefixes_in, current_dir, progress), progress)
+
+def remove_prefixes_in(current_dir, progress=None):
+    """移除 current_dir 中音乐文件的前缀（调用方持有目录锁）"""
+    output = job_output(progress)
     output.append(f"当前目录: {current_dir}")
 
-    # 遍历当前目录下的所有文件
-    for file in os.listdir(current_dir):
-        if file.endswith(SUPPORTED_FORMATS):
-            file_path = os.path.join(current_dir, file)
-
-            # 提取文件名（不包括路径）
-            filename = os.path.basename(file)
-
-            # 删除前缀（包括数字前缀和"(未找到)"前缀）
-            new_filename = re.sub(r'^\d+_', '', filename)  # 删除数字前缀
-            new_filename = re.sub(r'^（未找到）', '', new_filename)  # 删除"(未找到)"前缀
-            new_filename = re.sub(r'^（未匹配）', '', new_filename)  # 删除"(未匹配)"前缀
-            new_filename = re.sub(r'^\(未找到\)', '', new_filename)  # 删除"(未找到)"前缀（英文括号）
-            new_filename = re.sub(r'^_', '', new_filename)  # 删除下划线前缀
-            new_filename = re.sub(r'^-', '', new_filename)  # 删除连字符前缀
-
-            # 如果文件名有变化，则重命名文件
-            if new_filename != filename:
-                new_file_path = os.path.join(current_dir, new_filename)
-                try:
-                    os.rename(file_path, new_file_path)
-                    output.append(f"已重命名: {filename} -> {new_filename}")
-                except Exception as e:
-                    output.append(f"重命名文件时出错 {filename}: {e}")
-            else:
-                output.append(f"无需重命名: {filename}")
-                
+    # 先完成上次被中断的重命名，保证撤销记录完整
+    resume_output = resume_rename_journal(os.path.join(current_dir, RENAME_JOURNAL_FILE))
+    if resume_output is not None:
+        output.append(resume_output)
+
+    # 有撤销记录时直接恢复原始文件名
+    undo_output = undo_renames(current_dir, progress)
+    if undo_output is not None:
+        output.append(undo_output)
+        return "\n".join(output)
+
+    # 没有撤销记录（旧版本整理的目录）时按文件名规则移除前缀
+    output.append("未找到撤销记录，按文件名规则移除前缀")
+    files = [file for file in os.listdir(current_dir) if file.lower().endswith(SUPPORTED_FORMATS)]
+    for index, file in enumerate(files):
+        # 只在两个文件之间响应取消
+        if progress is not None:
+            if progress.cancelled():
+                output.append(f"⚠ 任务已取消，剩余 {len(files) - index} 个文件未处理")
+                break
+            progress.report('rename', index, len(files), file)
+        file_path = os.path.join(current_dir, file)
+
+        # 提取文件名（不包括路径）
+        filename = os.path.basename(file)
+
+        # 只删除整理时添加的序号前缀或未匹配标记，原文件名开头的数字、下划线和连字符保持不变
+        new_filename = ORGANIZED_MARK_PATTERN.sub('', filename, count=1)
+
+        # 如果文件名有变化，则重命名文件
+        if new_filename != filename:
+            new_file_path = os.path.join(current_dir, new_filename)
+            try:
+                os.rename(file_path, new_file_path)
+                output.append(f"已重命名: {filename} -> {new_filename}")
+            except Exception as e:
+                output.append(f"重命名文件时出错 {filename}: {e}")
+        else:
+            output.append(f"无需重命名: {filename}")
+            
     return "\n".join(output)
 
 def main():
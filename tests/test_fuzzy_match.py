@@ -0,0 +1,37 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from organize_playlist import PlaylistIndex, build_match_record, normalize_text, best_fuzzy_match, fuzzy_choices
+
+# 同名的两个条目：第一个时长超出容差，第二个与文件时长接近
+TITLE = "晴天 (Live)"
+DURATIONS = (300, 269.5)
+FILE_DURATION = 269
+
+
+class BestFuzzyMatchTest(unittest.TestCase):
+    """满分条目的时长不兼容时继续扫描，结果与 fuzzy_choices 的首选一致"""
+
+    def setUp(self):
+        self.entries = PlaylistIndex([TITLE] * len(DURATIONS)).entries
+        for entry, duration in zip(self.entries, DURATIONS):
+            entry['duration'] = duration
+        self.query = build_match_record(normalize_text("晴天 live"))
+
+    def test_skips_incompatible_perfect_score(self):
+        self.query['duration'] = FILE_DURATION
+        _, _, score, position = best_fuzzy_match(self.query, self.entries)
+        self.assertEqual((score, position), (1.0, 2))
+        self.assertEqual(fuzzy_choices(self.query, self.entries)[0][1], position)
+
+    def test_without_duration_stops_at_first(self):
+        self.query['duration'] = None
+        _, _, score, position = best_fuzzy_match(self.query, self.entries)
+        self.assertEqual((score, position), (1.0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
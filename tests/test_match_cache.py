@@ -0,0 +1,53 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from organize_playlist import organize_directory, MATCH_CACHE_FILE, UNDO_JOURNAL_FILE
+
+# 两个文件争用第 1 首，精确匹配的文件胜出
+PLAYLIST = "周杰伦 - 晴天\n林俊杰 - 江南\n"
+WINNER = "周杰伦 - 晴天.flac"
+RUNNER_UP = "晴天 live.mp3"
+
+
+class MatchCacheTest(unittest.TestCase):
+    """缓存的是每个文件的打分，全局分配每次重新执行"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, "playlist.txt"), 'w', encoding='utf-8') as f:
+            f.write(PLAYLIST)
+        for name in (WINNER, RUNNER_UP):
+            open(os.path.join(self.directory, name), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def audio_files(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(('.flac', '.mp3')))
+
+    def test_slot_freed_by_deleted_winner(self):
+        organize_directory(self.directory)
+        self.assertEqual(self.audio_files(), ["001_" + WINNER, "（未匹配）" + RUNNER_UP])
+
+        # 胜出的文件被删除后，命中缓存的另一个文件得到第 1 首
+        os.remove(os.path.join(self.directory, "001_" + WINNER))
+        output = organize_directory(self.directory)
+        self.assertIn("命中 1 个文件", output)
+        self.assertEqual(len(self.audio_files()), 1)
+        self.assertTrue(self.audio_files()[0].startswith("001_"))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, MATCH_CACHE_FILE)))
+
+    def test_journals_in_directory(self):
+        # 重命名日志和撤销记录写在整理的目录中，而不是进程的工作目录
+        organize_directory(self.directory)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, UNDO_JOURNAL_FILE)))
+        self.assertFalse(os.path.exists(os.path.join(os.getcwd(), UNDO_JOURNAL_FILE)))
+
+
+if __name__ == '__main__':
+    unittest.main()
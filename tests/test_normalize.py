@@ -0,0 +1,145 @@
+import os
+import re
+import sys
+import random
+import unicodedata
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import organize_playlist
+
+try:
+    import music_manager
+except ImportError:
+    # 没有 tkinter 时只检查 organize_playlist
+    music_manager = None
+
+# 随机测试的用例数和每个用例的最大长度
+RANDOM_CASES = 20000
+RANDOM_MAX_LENGTH = 24
+# 逐段检查全部码位时每段的码位数
+CODE_POINT_BLOCK = 4096
+
+
+def legacy_normalize_text(text):
+    """改为查表实现之前的 normalize_text（原样保留，作为对照）"""
+    if not isinstance(text, str):
+        return text
+
+    # 替换常见中日文特殊字符为ASCII等价
+    special_replaces = {
+        '〜': '~', '～': '~', 'ー': '-', 'ｰ': '-', '（': '(', '）': ')',
+        '「': '[', '」': ']', '【': '[', '】': ']', '｛': '{', '｝': '}',
+        '“': '"', '”': '"', '‘': "'", '’': "'", '・': '.', '。': '.'
+    }
+    for orig, repl in special_replaces.items():
+        text = text.replace(orig, repl)
+
+    # 音调处理 (降噪处理)
+    normalized_chars = []
+    for char in text:
+        try:
+            # NFC规范化
+            normalized = unicodedata.normalize('NFC', char)
+            # 转换为小写
+            if normalized.isalpha():
+                normalized = normalized.lower()
+            normalized_chars.append(normalized)
+        except:
+            normalized_chars.append(char)
+
+    text = ''.join(normalized_chars)
+
+    # 移除变音符记号
+    text = ''.join(
+        c for c in unicodedata.normalize('NFD', text)
+        if not unicodedata.combining(c)
+    )
+
+    # 转换全角字符为半角
+    fullwidth_ranges = [
+        (0xFF01, 0xFF0F),  # 全角标点
+        (0xFF1A, 0xFF20),  # 全角符号
+        (0xFF3B, 0xFF40),  # 全角括弧
+        (0xFF5B, 0xFF5E)  # 全角运算符
+    ]
+    for start, end in fullwidth_ranges:
+        for code in range(start, end + 1):
+            half_code = code - 0xFEE0
+            if 0x21 <= half_code <= 0x7E:
+                text = text.replace(chr(code), chr(half_code))
+
+    # ============ 关键修复1：改进乱码清理 ============
+    # 清理非常用符号和乱码字符
+    text = re.sub(r'[^\w一-鿿぀-ゟ゠-ヿ\s\(\)\-\~\.]', '', text)
+    # 合并连续空格
+    text = re.sub(r'\s+', ' ', text).strip()
+
+    return text
+
+
+def char_range(start, end):
+    return [chr(code) for code in range(start, end + 1)]
+
+
+# 随机字符串的字母表：中文、假名、带变音符的拉丁字母、组合音标、全角字符、乱码和空白
+ALPHABETS = {
+    'cjk': char_range(0x4E00, 0x9FFF) + char_range(0x3400, 0x4DBF) + list('（）「」【】｛｝・。〜～'),
+    'kana': char_range(0x3040, 0x30FF) + char_range(0xFF65, 0xFF9F) + list('ーｰ'),
+    'diacritics': char_range(0x00C0, 0x024F) + char_range(0x1E00, 0x1EFF) + char_range(0x0300, 0x036F),
+    'fullwidth': char_range(0xFF01, 0xFF5E) + char_range(0x3000, 0x303F),
+    # UTF-8 按 GBK/Latin-1 误解码常见的字符、替换字符、控制字符和私用区
+    'mojibake': list('ÃÂâ€™œ”¢æ¼é¹å¤©ç¥žè¯å”±é”Ÿæ–¤æ‹·烫屯锟斤拷�\x00\x1f\x7f​\U0001F3B5')
+                + char_range(0x0080, 0x00FF) + char_range(0x2500, 0x257F),
+    'ascii': char_range(0x20, 0x7E) + list('\t\n\r　   '),
+}
+
+
+class NormalizeTextEquivalenceTest(unittest.TestCase):
+    """查表实现的 normalize_text 与原实现的结果逐字相同"""
+
+    def implementations(self):
+        yield organize_playlist.normalize_text
+        if music_manager is not None:
+            yield music_manager.normalize_text
+
+    def assert_same(self, text):
+        expected = legacy_normalize_text(text)
+        for normalize_text in self.implementations():
+            self.assertEqual(normalize_text(text), expected,
+                             f"{normalize_text.__module__}.normalize_text({text!r})")
+
+    def test_examples(self):
+        for text in ["周杰伦 - 晴天", "ＹＯＡＳＯＢＩ「夜に駆ける」", "Beyoncé — Déjà Vu", "Ｌｏｖｅ（Ｌｉｖｅ）",
+                     "ｶﾀｶﾅ ﾃｽﾄ", "å‘¨æ°ä¼¦ - æ™´å¤©", "锟斤拷烫烫烫", "  多个   空格\t\n",
+                     "ȩ́ ä", "한국어 노래", "", "   "]:
+            self.assert_same(text)
+
+    def test_non_string(self):
+        for value in (None, 1979, 1.5, b'bytes'):
+            for normalize_text in self.implementations():
+                self.assertEqual(normalize_text(value), value)
+
+    def test_random_strings(self):
+        rng = random.Random(20240101)
+        names = list(ALPHABETS)
+        for _ in range(RANDOM_CASES):
+            # 每个用例混合一到三种字母表，覆盖不同文字之间的组合音标和空白
+            alphabet = [char for name in rng.sample(names, rng.randint(1, 3)) for char in ALPHABETS[name]]
+            self.assert_same(''.join(rng.choice(alphabet) for _ in range(rng.randint(0, RANDOM_MAX_LENGTH))))
+
+    def test_every_code_point(self):
+        for start in range(0, sys.maxunicode + 1, CODE_POINT_BLOCK):
+            chars = [chr(code) for code in range(start, min(start + CODE_POINT_BLOCK, sys.maxunicode + 1))]
+            # 以空格分隔的单个字符，以及连在一起的字符（组合音标会附着到前一个字符上）
+            for text in (' a'.join(chars), ''.join(chars)):
+                if any(normalize_text(text) != legacy_normalize_text(text) for normalize_text in self.implementations()):
+                    # 逐个字符检查，找出结果不同的码位
+                    for char in chars:
+                        self.assert_same(f"a{char} b")
+                    self.assert_same(text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import organize_playlist
+from organize_playlist import (execute_rename_journal, resume_rename_journal, journal_op, plan_undo_map,
+                               write_journal, load_undo_map, undo_renames,
+                               RENAME_JOURNAL_FILE, UNDO_JOURNAL_FILE)
+
+# 互换和三个文件的循环
+SWAP = [("a.mp3", "b.mp3"), ("b.mp3", "a.mp3")]
+CYCLE = [("a.mp3", "b.mp3"), ("b.mp3", "c.mp3"), ("c.mp3", "a.mp3")]
+
+
+class RenameJournalTest(unittest.TestCase):
+    """两阶段重命名在互换、循环、部分失败和中断恢复时不丢失文件"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.journal_path = os.path.join(self.directory, RENAME_JOURNAL_FILE)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def create(self, renames):
+        """每个源文件的内容是它的原始文件名，返回第一阶段的日志"""
+        names = set()
+        for src, _ in renames:
+            with open(self.path(src), 'w', encoding='utf-8') as f:
+                f.write(src)
+            names.add(src)
+        ops = [journal_op(self.path(src), dst, names, self.directory, i) for i, (src, dst) in enumerate(renames)]
+        return {'phase': 1, 'ops': ops, 'undo': plan_undo_map({}, ops)}
+
+    def contents(self):
+        """{文件名: 原始文件名}，不含日志文件"""
+        result = {}
+        for name in os.listdir(self.directory):
+            if name not in (RENAME_JOURNAL_FILE, UNDO_JOURNAL_FILE):
+                with open(self.path(name), 'r', encoding='utf-8') as f:
+                    result[name] = f.read()
+        return result
+
+    def execute(self, journal):
+        write_journal(self.journal_path, journal)
+        return execute_rename_journal(self.journal_path, journal)
+
+    def assert_undo_restores(self, renames):
+        undo_renames(self.directory)
+        self.assertEqual(self.contents(), {src: src for src, _ in renames})
+        self.assertFalse(os.path.exists(self.path(UNDO_JOURNAL_FILE)))
+
+    def test_swap_and_cycle(self):
+        for renames in (SWAP, CYCLE):
+            with self.subTest(renames=renames):
+                errors = self.execute(self.create(renames))
+                self.assertEqual(errors, {})
+                self.assertEqual(self.contents(), {dst: src for src, dst in renames})
+                self.assertFalse(os.path.exists(self.journal_path))
+                self.assert_undo_restores(renames)
+                for name in os.listdir(self.directory):
+                    os.remove(self.path(name))
+
+    def failing_rename(self, source):
+        """第一阶段移动 source 时失败的 os.rename"""
+        real_rename = os.rename
+
+        def rename(src, dst):
+            if src == self.path(source) and dst.endswith('.tmp'):
+                raise PermissionError("模拟失败")
+            real_rename(src, dst)
+        return rename
+
+    def test_partial_phase_one_failure(self):
+        for renames in (SWAP, CYCLE):
+            for failed in range(len(renames)):
+                with self.subTest(renames=renames, failed=failed):
+                    journal = self.create(renames)
+                    with mock.patch.object(organize_playlist.os, 'rename', self.failing_rename(renames[failed][0])):
+                        errors = self.execute(journal)
+                    # 没有文件被覆盖，所有文件仍在，失败的文件及受其阻挡的文件保持原名
+                    contents = self.contents()
+                    self.assertEqual(sorted(contents.values()), sorted(src for src, _ in renames))
+                    self.assertIn(failed, errors)
+                    self.assertEqual(contents[renames[failed][0]], renames[failed][0])
+                    for i, (src, dst) in enumerate(renames):
+                        self.assertEqual(contents[src if i in errors else dst], src)
+                    # 撤销记录与实际结果一致
+                    undo_map = load_undo_map(self.path(UNDO_JOURNAL_FILE)) or {}
+                    self.assertEqual(undo_map, {dst: src for i, (src, dst) in enumerate(renames) if i not in errors})
+                    self.assert_undo_restores(renames)
+                    for name in os.listdir(self.directory):
+                        os.remove(self.path(name))
+
+    def test_resume_after_phase_one_crash(self):
+        for renames in (SWAP, CYCLE):
+            for done in range(len(renames) + 1):
+                with self.subTest(renames=renames, done=done):
+                    journal = self.create(renames)
+                    write_journal(self.journal_path, journal)
+                    # 中断前已有 done 个文件移到临时名
+                    for op in journal['ops'][:done]:
+                        os.rename(self.path(op['src']), self.path(op['tmp']))
+                    output = resume_rename_journal(self.journal_path)
+                    self.assertIn("失败 0 个", output)
+                    self.assertEqual(self.contents(), {dst: src for src, dst in renames})
+                    self.assert_undo_restores(renames)
+                    for name in os.listdir(self.directory):
+                        os.remove(self.path(name))
+
+    def test_resume_after_phase_two_crash(self):
+        for renames in (SWAP, CYCLE):
+            for done in range(len(renames) + 1):
+                with self.subTest(renames=renames, done=done):
+                    journal = self.create(renames)
+                    for op in journal['ops']:
+                        os.rename(self.path(op['src']), self.path(op['tmp']))
+                    journal['phase'] = 2
+                    journal['failed'] = []
+                    write_journal(self.journal_path, journal)
+                    # 中断前已有 done 个文件改为目标名
+                    for op in journal['ops'][:done]:
+                        os.rename(self.path(op['tmp']), self.path(op['dst']))
+                    output = resume_rename_journal(self.journal_path)
+                    self.assertIn("失败 0 个", output)
+                    self.assertEqual(self.contents(), {dst: src for src, dst in renames})
+                    self.assertFalse(os.path.exists(self.journal_path))
+                    self.assert_undo_restores(renames)
+                    for name in os.listdir(self.directory):
+                        os.remove(self.path(name))
+
+    def test_resume_after_partial_failure_crash(self):
+        # 第一阶段 b 失败后在第二阶段中断：恢复时仍不能覆盖 b
+        journal = self.create(CYCLE)
+        with mock.patch.object(organize_playlist.os, 'rename', self.failing_rename("b.mp3")):
+            for op in journal['ops']:
+                try:
+                    organize_playlist.os.rename(self.path(op['src']), self.path(op['tmp']))
+                except OSError:
+                    pass
+        journal['phase'] = 2
+        journal['failed'] = [1]
+        write_journal(self.journal_path, journal)
+        resume_rename_journal(self.journal_path)
+        self.assertEqual(self.contents(), {name: name for name in ("a.mp3", "b.mp3", "c.mp3")})
+        self.assertIsNone(load_undo_map(self.path(UNDO_JOURNAL_FILE)))
+
+
+if __name__ == '__main__':
+    unittest.main()
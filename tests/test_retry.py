@@ -0,0 +1,42 @@
+import os
+import sys
+import time
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from update_playlist import NetEaseClient
+
+# 服务器要求的等待秒数（远超 max_delay）
+RETRY_AFTER = "3600"
+
+
+def throttled_response():
+    return mock.Mock(status_code=429, headers={'Retry-After': RETRY_AFTER})
+
+
+class RetryDelayTest(unittest.TestCase):
+    """Retry-After 不超过 max_delay，取消后立即停止重试"""
+
+    def test_retry_after_clamped(self):
+        client = NetEaseClient(max_delay=2, rate=None)
+        self.assertEqual(client._retry_delay(0, throttled_response()), 2)
+        self.assertLessEqual(client._retry_delay(10, None), 2)
+
+    def test_cancel_interrupts_wait(self):
+        event = threading.Event()
+        client = NetEaseClient(max_delay=30, rate=None, cancelled=event.is_set)
+        client.session.get = mock.Mock(side_effect=lambda *args, **kwargs: throttled_response())
+        threading.Timer(0.2, event.set).start()
+
+        start = time.monotonic()
+        response = client.get("/api/test")
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(client.session.get.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import sys
+import json
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from update_playlist import iter_json_values, PLAYLIST_STREAM_PATHS
+
+# 顶层和目标路径旁边放置各种数字和字面量，在任意位置切分时都可能被截断
+SAMPLE = {
+    'code': 200,
+    'result': {
+        'x': 1.5e10, 'y': 0.5, 'w': -1e-5, 'big': 12345678901234567890, 't': True, 'f': False, 'n': None,
+        'name': "歌单 \"名\" \\ ✓",
+        'trackIds': [{'id': 1}, {'id': 20}, {'id': 300}],
+        'tracks': [{'id': 1, 'name': "晴天", 'duration': 269.5e3}, {'id': 20, 'name': "夜に駆ける", 'v': -0.0}],
+        'after': [1, 2.25, {'k': [3e2]}],
+    },
+    'tail': 7,
+}
+
+
+def expected_events(data):
+    events = [(('code',), data['code'])]
+    events.extend((('result', 'trackIds'), value) for value in data['result']['trackIds'])
+    events.extend((('result', 'tracks'), value) for value in data['result']['tracks'])
+    return events
+
+
+class IterJsonValuesTest(unittest.TestCase):
+    """iter_json_values 在任意切分的数据块上得到与 json.loads 相同的结果"""
+
+    def parse(self, chunks):
+        return list(iter_json_values(chunks, PLAYLIST_STREAM_PATHS))
+
+    def test_single_chunk(self):
+        self.assertEqual(self.parse([json.dumps(SAMPLE).encode()]), expected_events(SAMPLE))
+
+    def test_every_split(self):
+        # 紧凑和带空白的两种写法，在每个字节处切分（包括多字节 UTF-8 字符和数字的中间）
+        expected = expected_events(SAMPLE)
+        for text in (json.dumps(SAMPLE, ensure_ascii=False, separators=(',', ':')),
+                     json.dumps(SAMPLE, ensure_ascii=False, indent=1)):
+            data = text.encode('utf-8')
+            for split in range(1, len(data)):
+                self.assertEqual(self.parse([data[:split], data[split:]]), expected, f"split at {split}")
+
+    def test_split_numbers(self):
+        for number in ("1.5e10", "0.5", "-12", "1E+5", "2.5e-3", "0"):
+            data = ('{"code":200,"result":{"x":%s,"tracks":[%s]}}' % (number, number)).encode()
+            for split in range(1, len(data)):
+                self.assertEqual(self.parse([data[:split], data[split:]]),
+                                 [(('code',), 200), (('result', 'tracks'), json.loads(number))],
+                                 f"{data[:split]!r} | {data[split:]!r}")
+
+    def test_one_byte_chunks(self):
+        data = json.dumps(SAMPLE).encode()
+        self.assertEqual(self.parse(data[i:i + 1] for i in range(len(data))), expected_events(SAMPLE))
+
+    def test_truncated(self):
+        data = json.dumps(SAMPLE).encode()
+        with self.assertRaises(ValueError):
+            self.parse([data[:-3]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,19 @@
 import requests
 import json
+import codecs
+import hashlib
 import webbrowser
 import time
 import os
 import sys
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 from urllib.parse import urlencode
 from io import StringIO
+from organize_playlist import playlist_line_record, playlist_sidecar_path, PLAYLIST_SIDECAR_VERSION, \
+    PLAYLIST_KEYS_VERSION, JobCancelled, job_output
 import contextlib
 
 # 安全设置标准输出编码为UTF-8
@@ -21,125 +29,574 @@ try:
 except ImportError:
     BROWSER_COOKIE_AVAILABLE = False
 
-def fetch_playlist_data(playlist_url, cookie=None):
-    """获取歌单数据"""
+# 网易云音乐 API 地址（测试时可改为本地服务器）
+API_BASE = "https://music.163.com"
+# 分批获取歌曲详情时每批的歌曲数
+TRACK_BATCH_SIZE = 500
+# 同时进行的歌曲详情请求数
+TRACK_FETCH_WORKERS = 4
+# 请求超时（连接, 读取）秒数
+REQUEST_TIMEOUT = (5, 30)
+# 失败请求的最大重试次数
+MAX_RETRIES = 3
+# 重试退避的基础秒数（第 n 次重试等待 基础秒数 * 2^(n-1)，另加随机抖动）
+RETRY_BACKOFF = 0.5
+# 需要重试的 HTTP 状态码
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# 重试前的最长等待秒数（服务器要求的 Retry-After 更长时也只等待这么久）
+RETRY_MAX_DELAY = 10
+# 重试等待期间检查取消的间隔秒数
+RETRY_SLEEP_STEP = 0.1
+# 限速：每秒平均请求数和允许的突发请求数
+REQUESTS_PER_SECOND = 5
+REQUEST_BURST = 5
+# 流式读取歌单响应时每次读取的字节数
+STREAM_CHUNK_SIZE = 64 * 1024
+# 流式解析歌单时需要的字段路径
+PLAYLIST_STREAM_PATHS = {('code',), ('result', 'tracks'), ('result', 'trackIds')}
+# JSON 数字中可能出现的字符（判断缓冲区末尾的数字是否被截断）
+JSON_NUMBER_CHARS = '0123456789+-.eE'
+# 批量同步时同时更新的歌单数
+PLAYLIST_SYNC_WORKERS = 4
+# 获取用户歌单列表时每页的数量
+USER_PLAYLIST_PAGE_SIZE = 1000
+# 歌单文件名
+PLAYLIST_FILENAME = "playlist.txt"
+# 目录名中不允许出现的字符
+INVALID_PATH_CHARS = '<>:"/\\|?*'
+# 从浏览器读取的 Cookie 的缓存文件（位于用户目录，批量同步到不同目录时共用）
+COOKIE_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".music_manager_cookie.json")
+# Cookie 没有过期时间（会话 Cookie）时缓存的秒数
+COOKIE_DEFAULT_TTL = 7 * 24 * 3600
+# 距离过期不足该秒数时视为已过期
+COOKIE_EXPIRY_MARGIN = 60
+# 读取 Cookie 的浏览器（browser_cookie3 中的函数名），并发读取，先得到有效结果者优先
+COOKIE_BROWSERS = ('firefox', 'chrome', 'edge')
+
+# 模拟浏览器的请求头
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Referer': 'https://music.163.com/',
+    'Accept': '*/*',
+    'Accept-Encoding': 'gzip, deflate',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+}
+
+class PlaylistIncomplete(Exception):
+    """按 trackIds 补全歌曲时部分歌曲详情获取失败，异常信息说明缺少的歌曲数"""
+
+class TokenBucket:
+    """令牌桶限速器（线程安全）"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """取得一个令牌，没有可用令牌时等待"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class NetEaseClient:
+    """网易云音乐 API 客户端
+
+    所有请求共用一个带连接池的 requests.Session，设置连接/读取超时，
+    遇到 5xx/429 和连接错误时按指数退避重试（每次最多等待 max_delay 秒），并用令牌桶限制请求速率。
+    cancelled 为返回是否已取消的函数（如 JobProgress.cancelled），取消后在重试等待中立即停止重试。
+    请求数、重试数和延迟统计可通过 stats()/stats_summary() 获取。
+    """
+
+    def __init__(self, base_url=None, timeout=REQUEST_TIMEOUT, max_retries=MAX_RETRIES, backoff=RETRY_BACKOFF,
+                 rate=REQUESTS_PER_SECOND, burst=REQUEST_BURST, pool_size=TRACK_FETCH_WORKERS,
+                 max_delay=RETRY_MAX_DELAY, cancelled=None):
+        self.base_url = base_url or API_BASE
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.cancelled = cancelled
+        self.limiter = TokenBucket(rate, burst) if rate else None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update(DEFAULT_HEADERS)
+
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.retry_count = 0
+        self.error_count = 0
+        self.latencies = []
+
+    def get(self, path, params=None, cookie=None, stream=False):
+        """发送 GET 请求并返回响应；重试用尽或取消后返回最后一次响应或抛出最后一次连接错误
+
+        stream 为 True 时不预先读取响应体（由调用方读取并关闭）。
+        """
+        headers = {'Cookie': cookie or 'appver=2.0.2'}
+        for attempt in range(self.max_retries + 1):
+            if self.limiter:
+                self.limiter.acquire()
+
+            start_time = time.perf_counter()
+            try:
+                response = self.session.get(f"{self.base_url}{path}", params=params, headers=headers,
+                                            timeout=self.timeout, stream=stream)
+                error = None
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                response, error = None, e
+            self._record(time.perf_counter() - start_time, error is not None)
+
+            retryable = error is not None or response.status_code in RETRY_STATUS
+            if not retryable or attempt == self.max_retries:
+                break
+
+            if not self._wait_retry(self._retry_delay(attempt, response)):
+                break
+            with self.lock:
+                self.retry_count += 1
+            if response is not None:
+                response.close()
+
+        if error is not None:
+            raise error
+        return response
+
+    def get_json(self, path, params=None, cookie=None):
+        """发送 GET 请求并解析 JSON，HTTP 错误时抛出 requests.HTTPError"""
+        response = self.get(path, params, cookie)
+        response.raise_for_status()
+        return response.json()
+
+    def _retry_delay(self, attempt, response):
+        # 429 响应带有 Retry-After 时按服务器要求等待，但不超过 max_delay
+        if response is not None and response.headers.get('Retry-After', '').isdigit():
+            return min(int(response.headers['Retry-After']), self.max_delay)
+        return min(self.backoff * (2 ** attempt) * (1 + random.random() * 0.1), self.max_delay)
+
+    def _wait_retry(self, delay):
+        """分段等待 delay 秒，期间检查取消；已取消时返回 False"""
+        deadline = time.monotonic() + delay
+        while True:
+            if self.cancelled is not None and self.cancelled():
+                return False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            time.sleep(min(remaining, RETRY_SLEEP_STEP))
+
+    def _record(self, latency, failed):
+        with self.lock:
+            self.request_count += 1
+            self.latencies.append(latency)
+            if failed:
+                self.error_count += 1
+
+    def stats(self):
+        """返回请求统计：请求数、重试数、连接错误数以及延迟（秒）的平均值/最大值"""
+        with self.lock:
+            latencies = list(self.latencies)
+            return {
+                'requests': self.request_count,
+                'retries': self.retry_count,
+                'errors': self.error_count,
+                'latency_avg': sum(latencies) / len(latencies) if latencies else 0.0,
+                'latency_max': max(latencies, default=0.0),
+            }
+
+    def stats_summary(self):
+        stats = self.stats()
+        return (f"网络请求: {stats['requests']} 次，重试 {stats['retries']} 次，连接错误 {stats['errors']} 次，"
+                f"平均延迟 {stats['latency_avg'] * 1000:.0f} ms，最大 {stats['latency_max'] * 1000:.0f} ms")
+
+    def close(self):
+        self.session.close()
+
+def fetch_song_details(client, track_ids, cookie=None, batch_size=TRACK_BATCH_SIZE, workers=TRACK_FETCH_WORKERS):
+    """按 ID 分批获取歌曲详情，返回 (与 track_ids 顺序一致的歌曲列表, 未能获取的歌曲 ID 列表)
+
+    各批次在线程池中并发请求（最多 workers 个），共用 client 的连接池和限速。
+    请求失败的批次中的歌曲和接口没有返回的歌曲都计入未能获取的 ID。
+    """
+    batches = [track_ids[i:i + batch_size] for i in range(0, len(track_ids), batch_size)]
+
+    def fetch_batch(batch):
+        try:
+            return client.get_json("/api/song/detail/", {'ids': json.dumps(batch)}, cookie).get('songs') or []
+        except (requests.exceptions.RequestException, ValueError):
+            return []
+
+    songs_by_id = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for songs in pool.map(fetch_batch, batches):
+            for song in songs:
+                songs_by_id[song.get('id')] = song
+
+    songs = [songs_by_id[track_id] for track_id in track_ids if track_id in songs_by_id]
+    failed = [track_id for track_id in track_ids if track_id not in songs_by_id]
+    return songs, failed
+
+def iter_json_values(chunks, targets):
+    """增量解析 JSON 文本块，逐个产生 targets 中路径上的值 (路径, 值)
+
+    路径为键的元组，如 ('result', 'tracks')；目标值为数组时逐个产生其中的元素。
+    只沿目标路径进入对象，其他值整体跳过，因此内存占用只与单个元素的大小有关。
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    prefixes = {target[:i] for target in targets for i in range(1, len(target))}
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        # 至少把未解析部分的长度翻倍，使反复重试的大值的总解析量保持线性
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        buf = buf[pos:]
+        pos = 0
+        wanted = max(len(buf) * 2, 1)
+        parts = [buf]
+        size = len(buf)
+        while size < wanted:
+            try:
+                part = text_decoder.decode(next(chunks))
+            except StopIteration:
+                part = text_decoder.decode(b'', final=True)
+                eof = True
+            parts.append(part)
+            size += len(part)
+            if eof:
+                break
+        buf = ''.join(parts)
+        return True
+
+    def peek():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if not fill():
+                raise ValueError("JSON 数据意外结束")
+
+    def expect(chars):
+        nonlocal pos
+        char = peek()
+        if char not in chars:
+            raise ValueError(f"JSON 格式错误: 位置 {pos} 处为 {char!r}")
+        pos += 1
+        return char
+
+    def decode_value():
+        nonlocal pos
+        peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                # 数字后面只剩数字字符（如 "1.5e" 中的 "e"、"0." 中的 "."）或到达缓冲区末尾时
+                # 可能被截断，读入更多数据后重新解析
+                truncated = not isinstance(value, (str, list, dict)) and not buf[end:].lstrip(JSON_NUMBER_CHARS)
+                if not truncated or not fill():
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if not fill():
+                    raise
+
+    def parse_array(path):
+        if peek() == ']':
+            expect(']')
+            return
+        while True:
+            yield path, decode_value()
+            if expect(',]') == ']':
+                return
+
+    def parse_object(path):
+        if peek() == '}':
+            expect('}')
+            return
+        while True:
+            key = decode_value()
+            expect(':')
+            child = path + (key,)
+            if child in targets:
+                if peek() == '[':
+                    expect('[')
+                    yield from parse_array(child)
+                else:
+                    yield child, decode_value()
+            elif child in prefixes and peek() == '{':
+                expect('{')
+                yield from parse_object(child)
+            else:
+                decode_value()
+            if expect(',}') == '}':
+                return
+
+    expect('{')
+    yield from parse_object(())
+
+def track_record(position, track):
+    """把歌曲详情转换为歌曲记录：位置、艺术家、歌曲名、ID、专辑和时长（毫秒）"""
+    artists = track.get('artists') or track.get('ar') or []
+    album = track.get('album') or track.get('al') or {}
+    return {
+        'position': position,
+        'artists': ' / '.join([artist.get('name', '') for artist in artists]),
+        'name': track.get('name', '未知歌曲'),
+        'id': track.get('id'),
+        'album': album.get('name'),
+        'duration': track.get('duration', track.get('dt'))
+    }
+
+def open_playlist_stream(client, playlist_url, cookie=None):
+    """使用 client（NetEaseClient）以流式方式请求歌单，返回 (歌曲记录生成器, HTTP 状态码, 接口返回码)
+
+    读取到第一首歌曲后才返回，失败时生成器为 None。大歌单只内联了开头部分歌曲时，
+    其余歌曲在内联部分之后按 trackIds 分批获取，因此读完生成器之前不能关闭 client。
+    """
+    playlist_id = playlist_url.split('=')[-1]
+    params = {'id': playlist_id, 'n': 100000, 's': 8}
     try:
-        # 设置更完整的User-Agent模拟浏览器请求
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Referer': 'https://music.163.com/',
-            'Accept': '*/*',
-            'Accept-Encoding': 'gzip, deflate',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-        }
-
-        # 如果提供了Cookie，则添加到请求头中
-        if cookie:
-            headers['Cookie'] = cookie
-        else:
-            # 默认Cookie参数
-            headers['Cookie'] = 'appver=2.0.2'
-
-        # 从URL中提取歌单ID
-        playlist_id = playlist_url.split('=')[-1]
-
-        # 构造完整的API URL和参数
-        api_url = "https://music.163.com/api/playlist/detail"
-        params = {
-            'id': playlist_id,
-            'n': 100000,
-            's': 8
-        }
-
-        response = requests.get(api_url, headers=headers, params=params)
+        response = client.get("/api/playlist/detail", params, cookie, stream=True)
         response.raise_for_status()
-
-        # 解析JSON数据
-        data = response.json()
-
-        # 检查返回码
-        if data.get('code') != 200:
-            return None, response.status_code
-
-        return data, response.status_code
     except requests.exceptions.RequestException as e:
-        return None, getattr(e.response, 'status_code', None) if hasattr(e, 'response') else None
-    except json.JSONDecodeError as e:
-        return None, None
-
-def parse_playlist_tracks(data):
-    """解析歌单中的歌曲信息"""
-    if not data or 'result' not in data or 'tracks' not in data['result']:
-        return []
-
-    tracks = data['result']['tracks']
-    track_list = []
-
-    for track in tracks:
-        # 获取歌曲名和艺术家
-        song_name = track.get('name', '未知歌曲')
-        artists = track.get('artists', [])
-
-        # 拼接艺术家名称
-        if artists:
-            artist_names = ' / '.join([artist.get('name', '') for artist in artists])
-            track_info = f"{artist_names} - {song_name}"
-        else:
-            track_info = song_name
-
-        track_list.append(track_info)
+        return None, getattr(e.response, 'status_code', None), None
 
-    return track_list
-
-def update_playlist_file(track_list, filename="playlist.txt"):
-    """更新playlist.txt文件"""
+    events = iter_json_values(response.iter_content(STREAM_CHUNK_SIZE), PLAYLIST_STREAM_PATHS)
+    track_ids = []
+    code = None
+    try:
+        for path, value in events:
+            if path == ('code',):
+                code = value
+            elif path == ('result', 'trackIds'):
+                track_ids.append(value.get('id'))
+            elif path == ('result', 'tracks'):
+                return (stream_playlist_tracks(client, response, events, value, track_ids, cookie),
+                        response.status_code, code)
+    except ValueError:
+        pass
+
+    # 没有内联歌曲：只有 trackIds 时直接分批获取
+    response.close()
+    if code in (None, 200) and track_ids:
+        return stream_playlist_tracks(client, None, iter(()), None, track_ids, cookie), response.status_code, 200
+    return None, response.status_code, code
+
+def stream_playlist_tracks(client, response, events, first_track, track_ids, cookie=None):
+    """open_playlist_stream 使用的生成器：依次产生内联歌曲和补全的歌曲记录（见 track_record）
+
+    按 trackIds 补全时有歌曲详情获取失败，则在产生全部获取到的歌曲后抛出 PlaylistIncomplete。
+    """
+    seen = set()
+    position = 0
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            for i, track in enumerate(track_list, 1):
-                f.write(f"{i}. {track}\n")
-        return True, f"成功更新 {filename}，共 {len(track_list)} 首歌曲"
+        if first_track is not None:
+            position += 1
+            seen.add(first_track.get('id'))
+            yield track_record(position, first_track)
+        for path, value in events:
+            if path == ('result', 'tracks'):
+                position += 1
+                seen.add(value.get('id'))
+                yield track_record(position, value)
+            elif path == ('result', 'trackIds'):
+                track_ids.append(value.get('id'))
+    finally:
+        if response is not None:
+            response.close()
+
+    missing = [track_id for track_id in track_ids if track_id is not None and track_id not in seen]
+    failed = 0
+    for start in range(0, len(missing), TRACK_BATCH_SIZE * TRACK_FETCH_WORKERS):
+        songs, failed_ids = fetch_song_details(client, missing[start:start + TRACK_BATCH_SIZE * TRACK_FETCH_WORKERS],
+                                               cookie)
+        failed += len(failed_ids)
+        for song in songs:
+            position += 1
+            yield track_record(position, song)
+
+    # 部分歌曲获取失败时不能把不完整的歌单当作成功写入
+    if failed:
+        raise PlaylistIncomplete(f"⚠ 歌单共 {position + failed} 首，其中 {failed} 首的详情获取失败"
+                                 f"（按 trackIds 分批请求了 {len(missing)} 首），歌单不完整")
+
+def format_track(record):
+    """playlist.txt 中的一行：艺术家 - 歌曲名"""
+    if record['artists']:
+        return f"{record['artists']} - {record['name']}"
+    return record['name']
+
+def sidecar_track(record, line):
+    """playlist.json 中的一首歌曲：歌曲信息加上 organize_playlist 预计算的匹配键
+
+    匹配键按 read_playlist 解析 playlist.txt 中这一行的方式计算，两种读取方式得到相同的标题。
+    """
+    keys = playlist_line_record(line)
+    return {
+        'position': record['position'],
+        'id': record['id'],
+        'name': record['name'],
+        'artists': record['artists'],
+        'album': record['album'],
+        'duration': record['duration'],
+        'line': line.rstrip('\n'),
+        'keys': keys
+    }
+
+def update_playlist_file(tracks, filename=PLAYLIST_FILENAME, progress=None):
+    """更新playlist.txt文件，同时在旁边写入结构化的 playlist.json
+
+    tracks 为歌曲记录的可迭代对象（可以是生成器），边读取边写入临时文件，
+    全部写完后再替换原文件，中途出错时原文件保持不变。
+    playlist.json 记录 playlist.txt 内容的哈希，playlist.txt 被手动修改后命名排序会忽略它。
+    tracks 抛出 PlaylistIncomplete（部分歌曲获取失败）时同样保留原文件并返回失败。
+    progress 为 JobProgress 时报告 'playlist' 阶段的进度（总数未知）；
+    取消时删除临时文件、保留原文件并抛出 JobCancelled。
+    """
+    sidecar = playlist_sidecar_path(filename)
+    temp_paths = [filename + ".tmp", sidecar + ".tmp"]
+    count = 0
+    # 逐行计算 playlist.txt 内容的哈希（与 organize_playlist.playlist_text_digest 一致）
+    digest = hashlib.sha1()
+    try:
+        # 批量同步时目标目录可能尚不存在
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        with open(temp_paths[0], 'w', encoding='utf-8') as f, open(temp_paths[1], 'w', encoding='utf-8') as j:
+            j.write('{"version": %d, "keys_version": %d, "tracks": [\n' % (PLAYLIST_SIDECAR_VERSION, PLAYLIST_KEYS_VERSION))
+            for record in tracks:
+                if progress is not None:
+                    progress.check_cancelled()
+                    progress.report('playlist', count, None, record['name'])
+                count += 1
+                line = f"{count}. {format_track(record)}\n"
+                f.write(line)
+                digest.update(line.encode('utf-8'))
+                if count > 1:
+                    j.write(',\n')
+                j.write(json.dumps(sidecar_track(record, line), ensure_ascii=False))
+            j.write('\n], "text_sha1": %s}\n' % json.dumps(digest.hexdigest()))
+        if not count:
+            for temp_path in temp_paths:
+                os.remove(temp_path)
+            return False, "未能解析到任何歌曲信息"
+        os.replace(temp_paths[0], filename)
+        os.replace(temp_paths[1], sidecar)
+        return True, f"成功更新 {filename}，共 {count} 首歌曲"
     except Exception as e:
+        for temp_path in temp_paths:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        if isinstance(e, JobCancelled):
+            raise
+        if isinstance(e, PlaylistIncomplete):
+            return False, f"{e}，未更新 {filename}"
         return False, f"写入文件时出错: {e}"
 
-def get_cookie_from_browser():
-    """从浏览器自动获取Cookie"""
-    if not BROWSER_COOKIE_AVAILABLE:
-        return None
-
+def load_cached_cookie(path=COOKIE_CACHE_FILE):
+    """读取缓存的 Cookie，缓存不存在、损坏或已过期时返回 None"""
     try:
-        # 尝试从Firefox获取Cookie
-        try:
-            firefox_cookies = browser_cookie3.firefox(domain_name='.music.163.com')
-            cookie_dict = {cookie.name: cookie.value for cookie in firefox_cookies}
+        with open(path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('expires', 0) - COOKIE_EXPIRY_MARGIN > time.time() and 'MUSIC_U=' in cached.get('cookie', ''):
+            return cached['cookie']
+    except (OSError, ValueError, AttributeError, TypeError):
+        pass
+    return None
+
+def save_cached_cookie(cookie, expires, browser, path=COOKIE_CACHE_FILE):
+    """保存 Cookie 及其过期时间（仅当前用户可读写，先写临时文件再替换）"""
+    temp_path = path + ".tmp"
+    try:
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'cookie': cookie, 'expires': expires, 'browser': browser, 'saved_at': time.time()}, f)
+        os.replace(temp_path, path)
+    except OSError:
+        # 缓存写入失败不影响本次使用
+        pass
+
+def invalidate_cached_cookie(cookie=None, path=COOKIE_CACHE_FILE):
+    """删除缓存的 Cookie；指定 cookie 时只在缓存内容与其相同时删除"""
+    if cookie is not None and load_cached_cookie(path) != cookie:
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
 
-            # 检查是否有必要的Cookie
-            if 'MUSIC_U' in cookie_dict:
-                # 构造Cookie字符串
-                cookie_str = '; '.join([f"{name}={value}" for name, value in cookie_dict.items()])
-                return cookie_str
-        except Exception:
-            pass
+def read_browser_cookie(browser):
+    """从指定浏览器读取网易云的 Cookie，返回 (Cookie字符串, 过期时间戳)，没有 MUSIC_U 时返回 None"""
+    try:
+        cookies = list(getattr(browser_cookie3, browser)(domain_name='.music.163.com'))
+    except Exception:
+        return None
 
-        # 尝试从Chrome获取Cookie
-        try:
-            chrome_cookies = browser_cookie3.chrome(domain_name='.music.163.com')
-            cookie_dict = {cookie.name: cookie.value for cookie in chrome_cookies}
+    music_u = [cookie for cookie in cookies if cookie.name == 'MUSIC_U' and cookie.value]
+    if not music_u:
+        return None
+    expires = music_u[0].expires or time.time() + COOKIE_DEFAULT_TTL
+    # 构造Cookie字符串
+    cookie_str = '; '.join([f"{cookie.name}={cookie.value}" for cookie in cookies])
+    return cookie_str, expires
+
+def get_cookie_from_browser(rejected=None):
+    """从浏览器自动获取Cookie
+
+    优先使用未过期的缓存；缓存缺失、过期，或 rejected（被服务器以 20001/403 拒绝的 Cookie）
+    与缓存相同时，并发读取 COOKIE_BROWSERS 中的浏览器，采用最先得到的有效结果并写入缓存。
+    """
+    if rejected is not None:
+        invalidate_cached_cookie(rejected)
+    cached = load_cached_cookie()
+    if cached:
+        return cached
 
-            # 检查是否有必要的Cookie
-            if 'MUSIC_U' in cookie_dict:
-                # 构造Cookie字符串
-                cookie_str = '; '.join([f"{name}={value}" for name, value in cookie_dict.items()])
-                return cookie_str
-        except Exception:
-            pass
+    if not BROWSER_COOKIE_AVAILABLE:
+        return None
 
+    browsers = [browser for browser in COOKIE_BROWSERS if hasattr(browser_cookie3, browser)]
+    if not browsers:
         return None
-    except Exception:
+
+    # 读取较慢的浏览器不再等待，其线程在后台自行结束
+    pool = ThreadPoolExecutor(max_workers=len(browsers))
+    try:
+        futures = {pool.submit(read_browser_cookie, browser): browser for browser in browsers}
+        for future in as_completed(futures):
+            result = future.result()
+            if result:
+                cookie_str, expires = result
+                save_cached_cookie(cookie_str, expires, futures[future])
+                return cookie_str
         return None
+    finally:
+        pool.shutdown(wait=False)
 
-def update_playlist(playlist_url):
-    """更新歌单功能的主函数"""
-    output = []
+def update_playlist(playlist_url, progress=None):
+    """更新歌单功能的主函数
+
+    progress 为 JobProgress 时报告进度，取消时抛出 JobCancelled（原 playlist.txt 保持不变）。
+    """
+    output = job_output(progress)
     
     # 验证URL格式
     if not playlist_url.startswith("https://music.163.com/api/playlist/detail?id="):
@@ -147,55 +604,250 @@ def update_playlist(playlist_url):
         output.append("格式应为: https://music.163.com/api/playlist/detail?id=歌单ID")
         return "\n".join(output)
 
-    # 初始尝试获取数据
+    # 同一次更新中的所有请求共用一个客户端（连接池、重试和限速），取消后不再等待重试
+    client = NetEaseClient(cancelled=progress.cancelled if progress is not None else None)
+    try:
+        if update_playlist_with_client(client, playlist_url, output, progress=progress):
+            output.append("\n现在可以运行 organize_playlist.py 来匹配和重命名音乐文件了")
+    finally:
+        client.close()
+    output.append(client.stats_summary())
+
+    return "\n".join(output)
+
+def update_playlist_with_client(client, playlist_url, output, filename=PLAYLIST_FILENAME,
+                                get_cookie=get_cookie_from_browser, progress=None):
+    """使用给定客户端获取歌单并写入 filename，过程信息追加到 output，返回是否成功
+
+    get_cookie 为需要登录时获取 Cookie 的函数，签名同 get_cookie_from_browser。
+    progress 为 JobProgress 时报告写入进度（见 update_playlist_file）。
+    """
+    # 初始尝试获取数据（流式读取，边解析边写入）
     output.append("正在获取歌单数据...")
-    data, status_code = fetch_playlist_data(playlist_url)
+    tracks, status_code, code = open_playlist_stream(client, playlist_url)
 
     # 检查是否需要登录
     cookie = None
-    if not data or (data and data.get('code') == 20001) or status_code == 403:
+    if tracks is None or code == 20001 or status_code == 403:
         output.append("检测到可能需要登录才能访问该歌单")
         # 直接尝试从浏览器获取Cookie，无需用户确认
-        cookie = get_cookie_from_browser()
+        cookie = get_cookie()
 
         if cookie:
             output.append("正在使用获取到的Cookie重新获取歌单数据...")
-            data, status_code = fetch_playlist_data(playlist_url, cookie)
-
-    if not data:
-        output.append("无法获取歌单数据")
-        return "\n".join(output)
-
-    # 检查返回码
-    if data.get('code') != 200:
-        output.append(f"获取歌单数据失败，错误码: {data.get('code')}")
-        if data.get('code') == 20001:
-            output.append("请确保您已正确登录并提供了有效的Cookie")
-        return "\n".join(output)
+            tracks, status_code, code = open_playlist_stream(client, playlist_url, cookie)
+
+            # 缓存的Cookie可能已失效，重新从浏览器读取
+            if code == 20001 or status_code == 403:
+                fresh_cookie = get_cookie(rejected=cookie)
+                if fresh_cookie and fresh_cookie != cookie:
+                    output.append("Cookie已失效，正在使用重新获取的Cookie再次获取歌单数据...")
+                    tracks, status_code, code = open_playlist_stream(client, playlist_url, fresh_cookie)
+
+    if tracks is None:
+        if code is None:
+            output.append("无法获取歌单数据")
+        else:
+            output.append(f"获取歌单数据失败，错误码: {code}")
+            if code == 20001:
+                output.append("请确保您已正确登录并提供了有效的Cookie")
+        return False
 
     output.append("正在解析歌单信息...")
-    track_list = parse_playlist_tracks(data)
-
-    if not track_list:
-        output.append("未能解析到任何歌曲信息")
-        return "\n".join(output)
-
-    output.append(f"成功解析到 {len(track_list)} 首歌曲")
 
     # 更新playlist.txt文件
-    success, message = update_playlist_file(track_list)
+    success, message = update_playlist_file(tracks, filename, progress)
     output.append(message)
     
     if success:
         output.append("playlist.txt 更新完成!")
-        output.append("\n现在可以运行 organize_playlist.py 来匹配和重命名音乐文件了")
     else:
         output.append("更新playlist.txt失败")
-        
+    return success
+
+def playlist_api_url(playlist_id):
+    """歌单ID对应的歌单API链接"""
+    return f"https://music.163.com/api/playlist/detail?id={playlist_id}"
+
+def safe_dirname(name):
+    """把歌单名转换为可用作目录名的字符串"""
+    name = ''.join('_' if char in INVALID_PATH_CHARS or ord(char) < 32 else char for char in name)
+    return name.strip().strip('.') or "_"
+
+def load_playlist_map(path):
+    """读取歌单列表文件，返回 [(歌单ID, 目标目录)]
+
+    每行为 "歌单ID或链接 目标目录"，# 开头的行为注释；省略目录时使用歌单ID作为目录名，
+    相对目录以列表文件所在目录为基准。
+    """
+    base_dir = os.path.dirname(os.path.abspath(path))
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = line.split(None, 1)
+            playlist_id = parts[0].split('=')[-1]
+            if not playlist_id.isdigit():
+                raise ValueError(f"{path} 第 {line_number} 行的歌单ID无效: {parts[0]}")
+            directory = parts[1].strip() if len(parts) > 1 else playlist_id
+            entries.append((playlist_id, os.path.join(base_dir, directory)))
+    return entries
+
+def fetch_user_playlists(client, user_id, cookie=None):
+    """分页获取用户的全部歌单，返回 [(歌单ID, 歌单名)]；返回码不为 200 时抛出 ValueError"""
+    playlists = []
+    offset = 0
+    while True:
+        data = client.get_json("/api/user/playlist",
+                               {'uid': user_id, 'limit': USER_PLAYLIST_PAGE_SIZE, 'offset': offset}, cookie)
+        if data.get('code') != 200:
+            raise ValueError(f"获取用户歌单失败，错误码: {data.get('code')}")
+        page = data.get('playlist') or []
+        playlists.extend((str(item.get('id')), item.get('name') or str(item.get('id'))) for item in page)
+        if not data.get('more') or not page:
+            return playlists
+        offset += len(page)
+
+def shared_cookie_getter():
+    """批量同步时各歌单共用的 Cookie 获取函数：只读取一次，Cookie 被拒绝时也只刷新一次"""
+    lock = threading.Lock()
+    cached = []
+
+    def get_cookie(rejected=None):
+        with lock:
+            if not cached or (rejected is not None and cached[0] == rejected):
+                cached[:] = [get_cookie_from_browser(rejected)]
+            return cached[0]
+
+    return get_cookie
+
+def sync_one_playlist(client, playlist_id, directory, get_cookie):
+    """同步单个歌单到 directory/playlist.txt，返回结果字典（异常不会向外抛出）"""
+    output = []
+    start_time = time.perf_counter()
+    try:
+        success = update_playlist_with_client(client, playlist_api_url(playlist_id), output,
+                                              os.path.join(directory, PLAYLIST_FILENAME), get_cookie)
+    except Exception as e:
+        output.append(f"同步时出错: {e}")
+        success = False
+    return {
+        'id': playlist_id,
+        'directory': directory,
+        'success': success,
+        'elapsed': time.perf_counter() - start_time,
+        'output': output
+    }
+
+def sync_playlists(source, base_dir=None, workers=PLAYLIST_SYNC_WORKERS, progress=None):
+    """批量同步歌单，每个歌单写入各自目录下的 playlist.txt
+
+    source 为网易云用户ID（同步该用户的全部歌单到 base_dir 下以歌单名命名的子目录，
+    默认当前目录），或歌单列表文件的路径（格式见 load_playlist_map）。
+    各歌单在线程池中并发同步（最多 workers 个），共用一个客户端的连接池、重试和限速，
+    单个歌单失败或较慢不影响其他歌单。
+    progress 为 JobProgress 时按完成的歌单数报告 'sync' 阶段的进度；取消后尚未开始的歌单不再同步，
+    正在同步的歌单照常完成（但不再等待失败请求的重试）。
+    """
+    output = job_output(progress)
+    start_time = time.perf_counter()
+    get_cookie = shared_cookie_getter()
+    client = NetEaseClient(pool_size=max(1, workers) * TRACK_FETCH_WORKERS,
+                           cancelled=progress.cancelled if progress is not None else None)
+    try:
+        if source.isdigit():
+            base_dir = base_dir or os.getcwd()
+            try:
+                playlists = fetch_user_playlists(client, source)
+            except (requests.exceptions.RequestException, ValueError):
+                # 私密歌单需要登录后才能获取
+                playlists = fetch_user_playlists(client, source, get_cookie())
+            jobs = []
+            used_names = set()
+            for playlist_id, name in playlists:
+                dirname = safe_dirname(name)
+                if dirname.lower() in used_names:
+                    dirname = f"{dirname}_{playlist_id}"
+                used_names.add(dirname.lower())
+                jobs.append((playlist_id, os.path.join(base_dir, dirname), name))
+            output.append(f"用户 {source} 共有 {len(jobs)} 个歌单")
+        else:
+            jobs = [(playlist_id, directory, playlist_id) for playlist_id, directory in load_playlist_map(source)]
+            output.append(f"歌单列表文件 {source} 中共有 {len(jobs)} 个歌单")
+    except (OSError, ValueError, requests.exceptions.RequestException) as e:
+        client.close()
+        output.append(f"无法获取歌单列表: {e}")
+        return "\n".join(output)
+
+    # 同一目录只能对应一个歌单
+    results = {}
+    runnable = []
+    seen_dirs = set()
+    for index, (playlist_id, directory, name) in enumerate(jobs):
+        key = os.path.normcase(os.path.abspath(directory))
+        if key in seen_dirs:
+            results[index] = {'id': playlist_id, 'directory': directory, 'success': False, 'elapsed': 0.0,
+                              'output': ["目标目录与其他歌单重复，已跳过"]}
+            continue
+        seen_dirs.add(key)
+        runnable.append(index)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {pool.submit(sync_one_playlist, client, jobs[index][0], jobs[index][1], get_cookie): index
+                       for index in runnable}
+            if progress is not None:
+                progress.report('sync', 0, len(runnable))
+            done = 0
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                index = futures[future]
+                results[index] = future.result()
+                done += 1
+                if progress is not None:
+                    progress.report('sync', done, len(runnable), jobs[index][2])
+                    # 只取消尚未开始的歌单
+                    if progress.cancelled():
+                        for pending in futures:
+                            pending.cancel()
+    finally:
+        client.close()
+
+    cancelled = 0
+    for index in runnable:
+        if index not in results:
+            results[index] = {'id': jobs[index][0], 'directory': jobs[index][1], 'success': False, 'elapsed': 0.0,
+                              'output': ["任务已取消，未同步"]}
+            cancelled += 1
+
+    succeeded = 0
+    for index, (playlist_id, directory, name) in enumerate(jobs):
+        result = results[index]
+        succeeded += result['success']
+        status = "成功" if result['success'] else "失败"
+        label = name if name == playlist_id else f"{name} ({playlist_id})"
+        output.append(f"\n[{status}] {label} -> {directory}，用时 {result['elapsed']:.2f} 秒")
+        output.extend(f"    {line}" for line in result['output'])
+
+    output.append(f"\n同步完成: 成功 {succeeded} 个，失败 {len(jobs) - succeeded - cancelled} 个，"
+                  f"总用时 {time.perf_counter() - start_time:.2f} 秒")
+    if cancelled:
+        output.append(f"⚠ 任务已取消，{cancelled} 个歌单未同步")
+    output.append(client.stats_summary())
     return "\n".join(output)
 
 def main():
-    """主函数"""
+    """主函数
+
+    用法: python update_playlist.py [用户ID或歌单列表文件 [目标目录]]，不带参数时输入单个歌单链接
+    """
+    if len(sys.argv) > 1:
+        print(sync_playlists(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None))
+        return
+
     print("网易云音乐歌单更新工具")
     print("=" * 40)
 